@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional
+from agents.base_agent import BaseAgent
+from utils.logger import setup_logger
+
+class _PoolEntry:
+    """池中一个会话的智能体；构造完成前 agent 为None，其他调用方等待 ready"""
+
+    __slots__ = ('session_id', 'agent', 'last_used', 'leases', 'ready')
+
+    def __init__(self, session_id: str, now: float):
+        self.session_id = session_id
+        self.agent: Optional[BaseAgent] = None
+        self.last_used = now
+        self.leases = 0
+        self.ready = threading.Event()
+
+class AgentPool:
+    """按会话id复用的智能体池
+
+    每个会话一个智能体，池中最多保留 max_agents 个：超过 idle_timeout 秒未使用的
+    智能体在下次访问池时被换出，数量超限时换出最久未使用的。换出时记忆先写入
+    持久化后端，会话再次访问时重新创建智能体并从后端懒加载最近的记忆。
+    通过 lease() 使用中的智能体持有租约，不会被换出；智能体在锁外构造，
+    同一会话的并发调用方等待同一个占位项，不会重复构造。
+    """
+
+    def __init__(self, factory: Callable[[str], BaseAgent], max_agents: int = 256,
+                 idle_timeout: float = 1800.0):
+        self.logger = setup_logger("agent_pool")
+        self.factory = factory
+        self.max_agents = max_agents
+        self.idle_timeout = idle_timeout
+        # 会话id -> 池项，按访问顺序排列（最久未使用的在最前）
+        self._agents: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'idle_evictions': 0, 'lru_evictions': 0}
+
+    def _acquire(self, session_id: str) -> _PoolEntry:
+        """取得会话的池项并加一个租约，不存在时在锁外构造智能体"""
+        while True:
+            with self._lock:
+                entry = self._agents.get(session_id)
+                building = entry is None
+                if building:
+                    entry = self._agents[session_id] = _PoolEntry(session_id, time.monotonic())
+                    self.stats['misses'] += 1
+                else:
+                    self.stats['hits'] += 1
+                entry.leases += 1
+                entry.last_used = time.monotonic()
+                self._agents.move_to_end(session_id)
+            if building:
+                try:
+                    entry.agent = self.factory(session_id)
+                except Exception:
+                    with self._lock:
+                        if self._agents.get(session_id) is entry:
+                            del self._agents[session_id]
+                    raise
+                finally:
+                    entry.ready.set()
+            else:
+                entry.ready.wait()
+                if entry.agent is None:
+                    # 其他调用方构造失败，重新构造
+                    continue
+            with self._lock:
+                evicted = self._collect_evictions(time.monotonic())
+            self._release(evicted)
+            return entry
+
+    def _unlease(self, entry: _PoolEntry):
+        """归还租约，并把会话标记为刚刚使用过"""
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if self._agents.get(entry.session_id) is entry:
+                self._agents.move_to_end(entry.session_id)
+            evicted = self._collect_evictions(entry.last_used)
+        self._release(evicted)
+
+    @contextmanager
+    def lease(self, session_id: str) -> Iterator[BaseAgent]:
+        """租用会话的智能体，租约期间（例如流式回复读完之前）不会被换出"""
+        entry = self._acquire(session_id)
+        try:
+            yield entry.agent
+        finally:
+            self._unlease(entry)
+
+    def get(self, session_id: str) -> BaseAgent:
+        """获取会话的智能体，不存在时创建；不持有租约，跨越较长时间使用时请用 lease()"""
+        entry = self._acquire(session_id)
+        self._unlease(entry)
+        return entry.agent
+
+    def _collect_evictions(self, now: float) -> List[BaseAgent]:
+        """取出需要换出的智能体（调用方持有锁），跳过持有租约和尚在构造中的智能体"""
+        evicted = []
+        for session_id, entry in list(self._agents.items()):
+            if entry.leases:
+                continue
+            if now - entry.last_used > self.idle_timeout:
+                self.stats['idle_evictions'] += 1
+            elif len(self._agents) > self.max_agents:
+                self.stats['lru_evictions'] += 1
+            else:
+                break
+            del self._agents[session_id]
+            evicted.append(entry.agent)
+        return evicted
+
+    def _release(self, agents: List[BaseAgent]):
+        """在锁外把被换出的智能体的记忆写入后端"""
+        for agent in agents:
+            try:
+                agent.release()
+            except Exception as e:
+                self.logger.error(f"换出会话{agent.session_id}时出错: {str(e)}")
+        if agents:
+            self.logger.info(f"换出{len(agents)}个空闲智能体，当前{len(self)}个")
+
+    def evict_idle(self) -> int:
+        """主动换出空闲的智能体，返回换出的数量"""
+        with self._lock:
+            evicted = self._collect_evictions(time.monotonic())
+        self._release(evicted)
+        return len(evicted)
+
+    def remove(self, session_id: str):
+        """移除会话的智能体（例如用户清空对话后）"""
+        with self._lock:
+            entry = self._agents.pop(session_id, None)
+        if entry is not None and entry.agent is not None:
+            self._release([entry.agent])
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._agents
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取池的使用统计"""
+        with self._lock:
+            leased = sum(1 for entry in self._agents.values() if entry.leases)
+            return {**self.stats, 'live': len(self._agents), 'leased': leased, 'max_agents': self.max_agents}
@@ -1,15 +1,24 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, List
 import json
+import math
+from agents.memory import MemoryStore
+from agents.memory_backend import MemoryBackend
 from utils.logger import setup_logger
+from utils.token_budget import get_token_estimator
 
 class BaseAgent(ABC):
     """基础智能体类"""
     
-    def __init__(self, agent_type: str):
+    def __init__(self, agent_type: str, session_id: Optional[str] = None,
+                 memory_backend: Optional[MemoryBackend] = None):
         self.agent_type = agent_type
+        self.session_id = session_id
         self.logger = setup_logger(f"{agent_type}_agent")
-        self.memory = []
+        # 给定会话id和后端时记忆按会话持久化，否则只保存在进程内
+        self.memory = MemoryStore(capacity=100, context_size=10, backend=memory_backend, session_id=session_id)
+        self.memory_compactor = None  # 启用后较早的对话折叠为滚动摘要
+        self.memory_retriever = None  # 启用后按相关性检索历史记录
         
     @abstractmethod
     def get_system_prompt(self) -> str:
@@ -21,21 +30,81 @@ class BaseAgent(ABC):
         """处理请求"""
         pass
     
+    @property
+    def memory_count(self) -> int:
+        """累计写入的记录数，用于对齐历史窗口"""
+        return self.memory.total
+    
     def add_to_memory(self, interaction: Dict[str, Any]):
-        """添加交互记录到内存"""
+        """添加交互记录到内存（超过容量时自动淘汰最早的记录）"""
         self.memory.append(interaction)
-        # 限制内存大小
-        if len(self.memory) > 100:
-            self.memory = self.memory[-100:]
+        if self.memory_retriever is not None:
+            self.memory_retriever.sync()
+        if self.memory_compactor is not None:
+            self.memory_compactor.maybe_compact()
     
-    def get_memory_context(self) -> str:
-        """获取内存上下文"""
-        if not self.memory:
+    def release(self):
+        """会话被换出前调用：把尚未落盘的记忆写入持久化后端
+
+        进行中的摘要任务完成后会自行保存，不需要等待。未配置后端时记忆随智能体一起丢弃。
+        """
+        if self.memory.backend is not None:
+            self.memory.backend.flush()
+    
+    def get_memory_summary(self) -> str:
+        """较早对话的滚动摘要，未启用压缩或尚未生成时为空"""
+        if self.memory_compactor is None:
             return ""
+        return self.memory_compactor.get_state()['summary']
+    
+    def get_memory_context(self, max_tokens: Optional[int] = None) -> str:
+        """获取内存上下文，给定max_tokens时只保留预算内最近的记录
+
+        启用记忆压缩时为 滚动摘要 + 尚未摘要的原文记录，否则为最近10条记录。
+        """
+        if self.memory_compactor is None:
+            memory_text = self.memory.get_context(max_tokens)
+            return f"最近的交互记录:\n{memory_text}" if memory_text else ""
+        
+        state = self.memory_compactor.get_state()
+        sections = []
+        if state['summary']:
+            sections.append(f"对话摘要:\n{state['summary']}")
+        memory_text = self.memory.render_since(state['summarized_until'], max_tokens)
+        if memory_text:
+            sections.append(f"最近的交互记录:\n{memory_text}")
+        return "\n\n".join(sections)
+    
+    def get_memory_messages(self, max_items: int = 10, step: int = 5,
+                            max_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """以对话消息形式返回最近的交互记录
+
+        窗口起点按 step 条对齐，只有新增记录超过 max_items 时才整段前移，
+        因此连续多轮请求的历史消息前缀保持不变，可以命中提供商侧的前缀缓存。
+        启用记忆压缩时返回所有尚未并入摘要的记录，窗口只在摘要更新时前移。
+        给定 max_tokens 时从最早的一轮开始丢弃，直到不超过预算。
+        """
+        if not self.memory:
+            return []
+        
+        if self.memory_compactor is not None:
+            start_index = self.memory_compactor.get_state()['summarized_until']
+        else:
+            start_index = max(0, math.ceil((self.memory_count - max_items) / step) * step)
+        return self.records_to_messages(self.memory.since(start_index), max_tokens)
+    
+    def records_to_messages(self, records, max_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """把记忆记录转换成对话消息，跳过没有回复的记录；给定 max_tokens 时从最早的一轮开始丢弃"""
+        messages = []
+        for record in records:
+            if record.user_input and record.assistant_response:
+                messages.append({"role": "user", "content": record.user_input})
+                messages.append({"role": "assistant", "content": record.assistant_response})
         
-        recent_memory = self.memory[-10:]  # 最近10条记录
-        memory_text = "\n".join([
-            f"用户: {item.get('user_input', '')}\n助手: {item.get('assistant_response', '')}"
-            for item in recent_memory
-        ])
-        return f"最近的交互记录:\n{memory_text}"
\ No newline at end of file
+        if max_tokens is not None:
+            estimator = get_token_estimator()
+            used = estimator.count_messages(messages)
+            while messages and used > max_tokens:
+                used -= estimator.count_messages(messages[:2])
+                messages = messages[2:]
+        return messages
\ No newline at end of file
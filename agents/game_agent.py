@@ -1,13 +1,41 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
 from agents.base_agent import BaseAgent
+from agents.game_pipeline import GamePipeline
+from agents.intent_classifier import get_intent_classifier
+from agents.memory_compaction import MemoryCompactor
+from agents.retrieval import MemoryRetriever
+from config.settings import Config
+from utils.deadline import Deadline
 from utils.logger import setup_logger
+from utils.token_budget import get_token_estimator
 
 class GameAgent(BaseAgent):
     """游戏开发智能体"""
     
-    def __init__(self):
-        super().__init__("game")
+    def __init__(self, ai_manager=None, session_id: Optional[str] = None, memory_backend=None,
+                 code_generator=None):
+        super().__init__("game", session_id=session_id, memory_backend=memory_backend)
+        self.ai_manager = ai_manager
+        # 有AI管理器时各类游戏请求走生成流水线，code_generator 用于生成可运行的游戏代码
+        self.game_pipeline = GamePipeline(ai_manager, code_generator) if ai_manager is not None else None
+        if ai_manager is not None and Config.AI_MEMORY_COMPACTION_ENABLED:
+            self.memory_compactor = MemoryCompactor(
+                self.memory, ai_manager,
+                recent_tokens=Config.AI_MEMORY_RECENT_TOKENS,
+                summary_max_tokens=Config.AI_MEMORY_SUMMARY_MAX_TOKENS,
+                provider=Config.AI_SUMMARY_PROVIDER or None,
+                model=Config.AI_SUMMARY_MODEL or None
+            )
+        if Config.AI_RETRIEVAL_ENABLED:
+            self.memory_retriever = MemoryRetriever(self.memory)
+        self.intent_classifier = get_intent_classifier()
+        self.intent_handlers = {
+            'math': self._handle_math_game,
+            'chinese': self._handle_chinese_game,
+            'english': self._handle_english_game,
+            'scene': self._handle_scene_generation,
+        }
         self.logger.info("游戏开发智能体已初始化")
     
     def get_system_prompt(self) -> str:
@@ -31,27 +59,45 @@ class GameAgent(BaseAgent):
 请用中文回复，保持专业且友好的语气。
 """
     
-    def process_request(self, request: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """处理游戏开发请求"""
+    def _deadline_response(self, deadline: Deadline) -> Dict[str, Any]:
+        """超时或取消时返回给界面的结果"""
+        result = deadline.result()
+        message = '请求已取消。' if result['error_type'] == 'cancelled' else '请求超时，请稍后重试。'
+        return {**result, 'response': message}
+    
+    def process_request(self, request: str, context: Optional[Dict[str, Any]] = None,
+                        deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """处理游戏开发请求
+
+        deadline 会一直传递到AI提供商的SDK调用，超时或被取消时返回 error_type 为
+        'timeout' / 'cancelled' 的结果。
+        """
+        return self._handle_request(request, self.intent_classifier.classify(request), context, deadline)
+    
+    def _handle_request(self, request: str, intents: List[Dict[str, Any]], context: Optional[Dict[str, Any]] = None,
+                        deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """按意图分类结果交给对应的处理函数，匹配不到关键词时按通用请求处理
+
+        成功的回复连同请求写入记忆，生成的游戏设计记录下来供后续请求检索。
+        """
+        if deadline is not None and deadline.done:
+            return self._deadline_response(deadline)
         try:
-            # 添加请求到内存
+            intent = intents[0]['intent'] if intents else 'general'
+            handler = self.intent_handlers.get(intent, self._handle_general_game_request)
+            result = handler(request, context, deadline)
+            result['intents'] = intents
+            
             self.add_to_memory({
                 'user_input': request,
+                'assistant_response': result.get('response', '') if result.get('success') else '',
                 'timestamp': context.get('timestamp', '') if context else '',
                 'context': context
             })
-            
-            # 根据请求类型处理
-            if '数字' in request or '数学' in request or '加减乘除' in request:
-                return self._handle_math_game(request, context)
-            elif '汉字' in request or '中文' in request:
-                return self._handle_chinese_game(request, context)
-            elif '英语' in request or '英文' in request:
-                return self._handle_english_game(request, context)
-            elif '场景' in request or '动作逻辑' in request:
-                return self._handle_scene_generation(request, context)
-            else:
-                return self._handle_general_game_request(request, context)
+            if result.get('success') and result.get('game_data'):
+                self.add_design(result['game_data'].get('title') or request,
+                                result.get('instructions') or result['response'], result['game_type'])
+            return result
                 
         except Exception as e:
             self.logger.error(f"处理请求时出错: {str(e)}")
@@ -61,9 +107,119 @@ class GameAgent(BaseAgent):
                 'response': '抱歉，处理您的请求时出现了错误。'
             }
     
-    def _handle_math_game(self, request: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    def add_design(self, title: str, content: str, game_type: str = 'general'):
+        """记录本会话生成过的游戏设计，供后续请求检索"""
+        if self.memory_retriever is not None:
+            self.memory_retriever.add_design(title, content, game_type)
+    
+    def build_related_context(self, request: str, exclude_from: Optional[int] = None) -> str:
+        """检索与请求相关的历史对话和游戏设计，按相关性在 AI_RETRIEVAL_MAX_TOKENS 内拼接"""
+        if self.memory_retriever is None:
+            return ""
+        related = self.memory_retriever.retrieve(request, Config.AI_RETRIEVAL_TOP_K, exclude_from)
+        estimator = get_token_estimator()
+        budget = Config.AI_RETRIEVAL_MAX_TOKENS
+        sections = []
+        for heading, items, render in (
+            ("相关的历史对话", related['memories'], lambda payload: payload.rendered),
+            ("相关的游戏设计", related['designs'],
+             lambda payload: f"《{payload['title']}》({payload['game_type']})\n{payload['content']}"),
+        ):
+            texts = []
+            for item in items:
+                text = render(item['payload'])
+                tokens = estimator.count(text)
+                if tokens > budget:
+                    continue
+                budget -= tokens
+                texts.append(text)
+            if texts:
+                sections.append(f"{heading}:\n" + "\n\n".join(texts))
+        return "\n\n".join(sections)
+    
+    def build_request_segments(self, request: str) -> Dict[str, Any]:
+        """把请求拆成 系统提示词 / 历史对话 / 当前请求 三段
+
+        前两段在多轮对话中保持稳定，作为提供商侧可缓存的前缀；
+        滚动摘要只在压缩时变化，附在系统提示词之后。
+        启用相关性检索时历史对话只保留最近 AI_RETRIEVAL_RECENT_TURNS 轮，更早的记录和
+        生成过的游戏设计按与请求的相关性检索，附在当前请求之前。
+        """
+        system = self.get_system_prompt().strip()
+        summary = self.get_memory_summary()
+        if summary:
+            system += f"\n\n之前对话的摘要:\n{summary}"
+        
+        if self.memory_retriever is None:
+            return {
+                'system': system,
+                'history': self.get_memory_messages(max_tokens=Config.AI_HISTORY_MAX_TOKENS),
+                'prompt': request
+            }
+        
+        recent = self.memory.recent(Config.AI_RETRIEVAL_RECENT_TURNS)
+        related = self.build_related_context(request, exclude_from=self.memory.total - len(recent))
+        return {
+            'system': system,
+            'history': self.records_to_messages(recent, Config.AI_HISTORY_MAX_TOKENS),
+            'prompt': f"{related}\n\n当前请求:\n{request}" if related else request
+        }
+    
+    def process_request_stream(self, request: str, context: Optional[Dict[str, Any]] = None,
+                               deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """以流式方式处理请求
+
+        先做意图分类：数字、汉字、英语和场景类请求交给生成流水线，返回带 game_data 和 code 的
+        非流式结果；通用请求在有可用的AI提供商时返回 {'success': True, 'stream': StreamResponse}，
+        否则退回到非流式结果。deadline 同时限制建立连接和读取流的时间。
+        """
+        intents = self.intent_classifier.classify(request)
+        intent = intents[0]['intent'] if intents else 'general'
+        if intent in self.intent_handlers or not self.ai_manager or not self.ai_manager.get_available_providers():
+            return self._handle_request(request, intents, context, deadline)
+        
+        segments = self.build_request_segments(request)
+        interaction = {
+            'user_input': request,
+            'timestamp': context.get('timestamp', '') if context else '',
+            'context': context
+        }
+        
+        result = self.ai_manager.send_request_to_best_provider(
+            segments['prompt'],
+            system=segments['system'],
+            history=segments['history'],
+            stream=True,
+            deadline=deadline
+        )
+        if not result.get('success'):
+            self.logger.error(f"流式请求失败: {result.get('error')}")
+            if deadline is not None and deadline.done:
+                return self._deadline_response(deadline)
+            return self._handle_request(request, intents, context, deadline)
+        
+        def _remember(stream):
+            # 出错、超时或被取消的回复不完整，不写入对话历史
+            if stream.error:
+                return
+            interaction['assistant_response'] = stream.text
+            self.add_to_memory(interaction)
+        
+        result['stream'].add_done_callback(_remember)
+        result.update({'game_type': 'general', 'intents': intents})
+        return result
+    
+    def _pipeline_available(self) -> bool:
+        """是否可以使用AI生成流水线（离线时各处理函数退回固定建议）"""
+        return self.game_pipeline is not None and bool(self.ai_manager.get_available_providers())
+    
+    def _handle_math_game(self, request: str, context: Optional[Dict[str, Any]],
+                          deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """处理数字游戏请求"""
-        # TODO: 实现数字游戏逻辑
+        if self._pipeline_available():
+            return self.game_pipeline.run('math', request, context, self.get_system_prompt(), deadline)
+        
+        # 没有可用的AI提供商时返回通用建议
         response = f"我理解您想要开发一个数字游戏。基于您的需求'{request}'，我建议：\n\n"
         response += "1. 确定游戏的目标年龄段\n"
         response += "2. 选择合适的数学运算类型\n"
@@ -76,9 +232,13 @@ class GameAgent(BaseAgent):
             'response': response
         }
     
-    def _handle_chinese_game(self, request: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    def _handle_chinese_game(self, request: str, context: Optional[Dict[str, Any]],
+                             deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """处理汉字游戏请求"""
-        # TODO: 实现汉字游戏逻辑
+        if self._pipeline_available():
+            return self.game_pipeline.run('chinese', request, context, self.get_system_prompt(), deadline)
+        
+        # 没有可用的AI提供商时返回通用建议
         response = f"我理解您想要开发一个汉字学习游戏。基于您的需求'{request}'，我建议：\n\n"
         response += "1. 确定要学习的汉字难度级别\n"
         response += "2. 设计互动的学习方式\n"
@@ -91,9 +251,13 @@ class GameAgent(BaseAgent):
             'response': response
         }
     
-    def _handle_english_game(self, request: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    def _handle_english_game(self, request: str, context: Optional[Dict[str, Any]],
+                             deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """处理英语游戏请求"""
-        # TODO: 实现英语游戏逻辑
+        if self._pipeline_available():
+            return self.game_pipeline.run('english', request, context, self.get_system_prompt(), deadline)
+        
+        # 没有可用的AI提供商时返回通用建议
         response = f"我理解您想要开发一个英语学习游戏。基于您的需求'{request}'，我建议：\n\n"
         response += "1. 确定英语学习的重点领域\n"
         response += "2. 设计沉浸式的学习环境\n"
@@ -106,9 +270,13 @@ class GameAgent(BaseAgent):
             'response': response
         }
     
-    def _handle_scene_generation(self, request: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    def _handle_scene_generation(self, request: str, context: Optional[Dict[str, Any]],
+                                 deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """处理游戏场景生成请求"""
-        # TODO: 实现场景生成逻辑
+        if self._pipeline_available():
+            return self.game_pipeline.run('scene', request, context, self.get_system_prompt(), deadline)
+        
+        # 没有可用的AI提供商时返回通用建议
         response = f"我理解您想要根据动作逻辑生成游戏场景。基于您的需求'{request}'，我建议：\n\n"
         response += "1. 分析动作逻辑的核心要素\n"
         response += "2. 设计场景的视觉风格\n"
@@ -121,7 +289,8 @@ class GameAgent(BaseAgent):
             'response': response
         }
     
-    def _handle_general_game_request(self, request: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    def _handle_general_game_request(self, request: str, context: Optional[Dict[str, Any]],
+                                     deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """处理一般游戏开发请求"""
         response = f"我理解您想要开发一个游戏。基于您的需求'{request}'，我建议：\n\n"
         response += "1. 明确游戏的目标受众\n"
@@ -0,0 +1,221 @@
+import json
+import re
+import threading
+from typing import Dict, Any, Optional, List
+from agents.pipeline import TaskGraph
+from games.math_game import MathGameGenerator
+from games.chinese_game import ChineseGameGenerator
+from games.english_game import EnglishGameGenerator
+from games.scene_generator import GameSceneGenerator
+from utils.deadline import Deadline
+from utils.logger import setup_logger
+
+GAME_NAMES = {'math': '数字游戏', 'chinese': '汉字游戏', 'english': '英语游戏', 'scene': '自定义游戏'}
+
+# 各类游戏的子类型字段、请求中的关键词 -> 子类型，以及默认子类型（与界面上的选项一致）
+GAME_SUBTYPES = {
+    'math': ('operation', {'加法': '加法', '减法': '减法', '乘法': '乘法', '除法': '除法'}, '混合运算'),
+    'chinese': ('character_type', {'成语': '成语', '词语': '常用词语', '组词': '常用词语', '汉字': '基础汉字'}, '基础汉字'),
+    'english': ('english_type', {'字母': '字母学习', 'alphabet': '字母学习', 'abc': '字母学习', '单词': '单词记忆',
+                                 '对话': '简单对话', '语法': '语法练习', 'grammar': '语法练习'}, '单词记忆'),
+}
+DIFFICULTIES = ['简单', '中等', '困难']
+DEFAULT_AGE_GROUP = '3-6岁'
+QUESTION_COUNT = 10
+
+# 题目JSON示例，提示模型按现有生成器的字段输出
+QUESTION_EXAMPLES = {
+    'math': '{"question": "3 + 4 = ?", "answer": 7, "options": [5, 6, 7, 8]}',
+    'chinese': '{"question": "这个字读什么？ 山", "answer": "shān", "options": ["shān", "sān", "shàn", "shā"], "meaning": "地面上高起的部分"}',
+    'english': '{"question": "\'apple\'的中文意思是什么？", "answer": "苹果", "options": ["苹果", "香蕉", "橙子", "葡萄"]}',
+}
+
+_AGE_PATTERN = re.compile(r'(\d+)\s*[-~～到至]\s*(\d+)\s*岁')
+
+def extract_game_spec(game_type: str, request: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """从请求和上下文中提取游戏参数，上下文中显式给出的值优先"""
+    context = context or {}
+    lowered = request.lower()
+    age_match = _AGE_PATTERN.search(request)
+    spec = {
+        'difficulty': context.get('difficulty') or next((level for level in DIFFICULTIES if level in request), DIFFICULTIES[0]),
+        'age_group': context.get('age_group') or (f"{age_match.group(1)}-{age_match.group(2)}岁" if age_match else DEFAULT_AGE_GROUP),
+    }
+    if game_type in GAME_SUBTYPES:
+        field, keywords, default = GAME_SUBTYPES[game_type]
+        matched = list(dict.fromkeys(subtype for keyword, subtype in keywords.items() if keyword in lowered))
+        if game_type == 'math' and len(matched) > 1:
+            matched = ['混合运算']
+        spec[field] = context.get(field) or (matched[0] if matched else default)
+        spec['title'] = context.get('title') or f"{spec[field]}{GAME_NAMES[game_type]}"
+    else:
+        spec['title'] = context.get('title') or GAME_NAMES['scene']
+        spec['description'] = context.get('description') or request
+        spec['action_logic'] = context.get('action_logic') or request
+    return spec
+
+def parse_questions(text: str) -> Optional[List[Dict[str, Any]]]:
+    """从模型回复中解析题目JSON数组，只保留答案在选项中的题目；解析不出时返回None"""
+    start, end = text.find('['), text.rfind(']')
+    if start < 0 or end <= start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(items, list):
+        return None
+    questions = [
+        item for item in items
+        if isinstance(item, dict) and isinstance(item.get('question'), str)
+        and isinstance(item.get('options'), list) and len(item['options']) >= 2
+        and item.get('answer') in item['options']
+    ]
+    return questions or None
+
+_generators: Optional[Dict[str, Any]] = None
+_generators_lock = threading.Lock()
+
+def get_game_generators() -> Dict[str, Any]:
+    """进程内共享的游戏生成器（题库只读），所有会话并发使用，读取时不加锁"""
+    global _generators
+    if _generators is None:
+        with _generators_lock:
+            if _generators is None:
+                _generators = {
+                    'math': MathGameGenerator(),
+                    'chinese': ChineseGameGenerator(),
+                    'english': EnglishGameGenerator(),
+                    'scene': GameSceneGenerator(),
+                }
+    return _generators
+
+class GamePipeline:
+    """AI驱动的游戏生成流水线
+
+    设计文档、题目和游戏说明三个AI子任务互不依赖，作为一张 TaskGraph 并发执行；
+    题目生成后交给 games/* 中现有的生成器组装游戏数据，再生成游戏代码。
+    某个AI子任务失败时使用生成器的内置题库和说明，不影响其余部分。
+    """
+
+    CODE_METHODS = {
+        'math': 'generate_math_game_code',
+        'chinese': 'generate_chinese_game_code',
+        'english': 'generate_english_game_code',
+        'scene': 'generate_scene_game_code',
+    }
+
+    def __init__(self, ai_manager, code_generator=None):
+        self.logger = setup_logger("game_pipeline")
+        self.ai_manager = ai_manager
+        self.code_generator = code_generator
+        self.generators = get_game_generators()
+
+    def _describe(self, game_type: str, spec: Dict[str, Any]) -> str:
+        lines = [f"游戏类型: {GAME_NAMES[game_type]}"]
+        labels = {'title': '标题', 'operation': '运算类型', 'character_type': '学习内容', 'english_type': '学习内容',
+                  'difficulty': '难度', 'age_group': '适合年龄', 'description': '游戏描述', 'action_logic': '动作逻辑'}
+        lines += [f"{label}: {spec[key]}" for key, label in labels.items() if spec.get(key)]
+        return "\n".join(lines)
+
+    def _ask(self, prompt: str, system: str, max_tokens: int, deadline: Optional[Deadline]):
+        """返回AI子任务的协程，失败时结果为None"""
+        async def _request():
+            result = await self.ai_manager.send_request_to_best_provider_async(
+                prompt, system=system, max_tokens=max_tokens, deadline=deadline
+            )
+            if not result.get('success'):
+                self.logger.warning(f"生成子任务失败: {result.get('error')}")
+                return None
+            return result['response'].strip()
+        return _request()
+
+    def _build_game(self, game_type: str, spec: Dict[str, Any], questions: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """用现有生成器组装游戏数据，AI题目可用时替换内置题库"""
+        generator = self.generators[game_type]
+        if game_type == 'math':
+            game_data = generator.create_math_game(spec['title'], spec['operation'], spec['difficulty'], spec['age_group'])
+        elif game_type == 'chinese':
+            game_data = generator.create_chinese_game(spec['title'], spec['character_type'], spec['difficulty'], spec['age_group'])
+        elif game_type == 'english':
+            game_data = generator.create_english_game(spec['title'], spec['english_type'], spec['difficulty'], spec['age_group'])
+        else:
+            return generator.generate_game_scene(spec['title'], spec['description'], spec['action_logic'], spec['age_group'])
+        if questions:
+            game_data['problems' if game_type == 'math' else 'questions'] = questions[:QUESTION_COUNT]
+            game_data['question_source'] = 'ai'
+        return game_data
+
+    def build_graph(self, game_type: str, request: str, spec: Dict[str, Any], system: str,
+                    deadline: Optional[Deadline] = None) -> TaskGraph:
+        """构建生成流水线: design / questions / instructions 并发 → game → code"""
+        description = f"{self._describe(game_type, spec)}\n用户需求: {request}"
+        graph = TaskGraph()
+        graph.add('design', lambda _: self._ask(
+            f"请为下面的儿童教育游戏写一份简洁的设计文档，包括核心玩法、关卡设计、奖励机制和学习目标，使用Markdown格式。\n\n{description}",
+            system, 800, deadline
+        ))
+        graph.add('instructions', lambda _: self._ask(
+            f"请为下面的游戏写一份给孩子和家长看的游戏说明，包括规则、操作方法和过关条件，语言简单易懂，使用Markdown格式。\n\n{description}",
+            system, 500, deadline
+        ))
+        if game_type in QUESTION_EXAMPLES:
+            async def _questions(_):
+                reply = await self._ask(
+                    f"请为下面的游戏出{QUESTION_COUNT}道四选一的题目，难度符合年龄段。只输出JSON数组，不要其他内容，"
+                    f"每道题的格式如: {QUESTION_EXAMPLES[game_type]}\n\n{description}",
+                    system, 1500, deadline
+                )
+                return parse_questions(reply) if reply else None
+            graph.add('questions', _questions)
+            graph.add('game', lambda inputs: self._build_game(game_type, spec, inputs['questions']), deps=['questions'])
+        else:
+            graph.add('game', lambda _: self._build_game(game_type, spec, None))
+        method = getattr(self.code_generator, self.CODE_METHODS[game_type], None)
+        if method is not None:
+            graph.add('code', lambda inputs: method(inputs['game']), deps=['game'])
+        return graph
+
+    def run(self, game_type: str, request: str, context: Optional[Dict[str, Any]] = None,
+            system: str = '', deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """执行流水线，返回与其他处理结果格式一致的字典"""
+        spec = extract_game_spec(game_type, request, context)
+        graph = self.build_graph(game_type, request, spec, system, deadline)
+        run = graph.run(deadline)
+        results, errors = run['results'], run['errors']
+        self.logger.info(
+            f"{GAME_NAMES[game_type]}流水线完成: 耗时{run['elapsed']:.2f}秒，"
+            f"子任务合计{sum(run['timings'].values()):.2f}秒，失败: {list(errors) or '无'}"
+        )
+        if 'game' not in results:
+            return {
+                'success': False,
+                'game_type': game_type,
+                'error': errors.get('game', '游戏生成失败'),
+                'response': '抱歉，生成游戏时出现了错误。'
+            }
+
+        game_data = results['game']
+        generator = self.generators[game_type]
+        instructions = results.get('instructions') or (
+            generator.generate_scene_instructions(game_data) if game_type == 'scene'
+            else generator.generate_game_instructions(game_data)
+        )
+        design = results.get('design')
+        result = {
+            'success': True,
+            'game_type': game_type,
+            'response': f"{design}\n\n{instructions}" if design else instructions,
+            'game_data': game_data,
+            'design': design,
+            'instructions': instructions,
+            'pipeline': {
+                'elapsed': run['elapsed'],
+                'timings': run['timings'],
+                'errors': errors,
+                'width': graph.width
+            }
+        }
+        if results.get('code'):
+            result['code'] = results['code']
+        return result
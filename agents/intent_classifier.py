@@ -0,0 +1,154 @@
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+# 意图关键词表: 意图 -> {关键词: 权重}，中英文同义词写在一起，关键词不区分大小写。
+# 权重体现关键词对意图的确定程度，例如「英语」「汉字」直接点明学科，
+# 而「数字」「字母」也常作为题材出现在其他学科的请求里。
+INTENT_KEYWORDS: Dict[str, Dict[str, float]] = {
+    'math': {
+        '数学': 1.5, '数字': 1.0, '加减乘除': 1.5, '加法': 1.2, '减法': 1.2, '乘法': 1.2, '除法': 1.2,
+        '口诀': 0.8, '算术': 1.2, '口算': 1.2, '计算': 0.8, '数数': 1.0, '比大小': 1.0, '分数': 1.0,
+        'math': 1.5, 'maths': 1.5, 'arithmetic': 1.2, 'addition': 1.2, 'subtraction': 1.2,
+        'multiplication': 1.2, 'division': 1.2, 'number': 1.0, 'numbers': 1.0, 'counting': 1.0,
+    },
+    'chinese': {
+        '汉字': 1.5, '中文': 1.5, '语文': 1.5, '拼音': 1.2, '成语': 1.2, '词语': 1.0, '识字': 1.2,
+        '笔画': 1.2, '偏旁': 1.2, '古诗': 1.2, '组词': 1.0,
+        'chinese': 1.5, 'hanzi': 1.5, 'pinyin': 1.2, 'idiom': 1.0, 'idioms': 1.0,
+    },
+    'english': {
+        '英语': 1.5, '英文': 1.5, '单词': 1.2, '字母': 1.0, '拼写': 1.2, '音标': 1.2, '自然拼读': 1.2,
+        'english': 1.5, 'alphabet': 1.2, 'phonics': 1.2, 'vocabulary': 1.2, 'spelling': 1.2,
+        'word': 0.8, 'words': 0.8, 'abc': 1.0,
+    },
+    'scene': {
+        '场景': 1.5, '动作逻辑': 1.5, '关卡': 1.0, '地图': 1.0, '跳跃': 1.0, '平台跳跃': 1.2,
+        '角色移动': 1.0, '收集': 0.6,
+        'scene': 1.5, 'level': 1.0, 'levels': 1.0, 'platformer': 1.2, 'jump': 1.0, 'map': 1.0,
+    },
+}
+
+DEFAULT_INTENT = 'general'
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机
+
+    一次扫描文本即可找出所有关键词的出现位置，耗时与关键词数量无关。
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+        self._built = False
+
+    def add(self, keyword: str, payload: Any = None):
+        """添加关键词，payload 在匹配时原样返回"""
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((keyword, payload))
+        self._built = False
+
+    def build(self):
+        """按广度优先计算失败指针，并把失败链上的输出合并到每个状态"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+                queue.append(next_state)
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """依次产出 (结束位置, 关键词, payload)"""
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, payload in output[state]:
+                yield position, keyword, payload
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+class IntentClassifier:
+    """基于关键词自动机的意图分类器
+
+    把意图关键词表编译成一个Aho-Corasick自动机，一次扫描为所有意图打分，
+    返回按得分排序的意图及置信度（该意图得分占总得分的比例）。
+    英文关键词按整词匹配，同一关键词多次出现只计一次。
+    """
+
+    def __init__(self, intents: Optional[Dict[str, Dict[str, float]]] = None):
+        self.intents = intents or INTENT_KEYWORDS
+        self._automaton = AhoCorasick()
+        for intent, keywords in self.intents.items():
+            for keyword, weight in keywords.items():
+                self._automaton.add(keyword.lower(), (intent, weight))
+        self._automaton.build()
+
+    def classify(self, text: str) -> List[Dict[str, Any]]:
+        """返回 [{'intent', 'score', 'confidence', 'keywords'}]，按得分从高到低排列"""
+        text = text.lower()
+        scores: Dict[str, float] = {}
+        matched: Dict[str, List[str]] = {}
+        seen = set()
+        for end, keyword, (intent, weight) in self._automaton.iter_matches(text):
+            start = end - len(keyword) + 1
+            if _is_word_char(keyword[0]) and (
+                (start > 0 and _is_word_char(text[start - 1])) or
+                (end + 1 < len(text) and _is_word_char(text[end + 1]))
+            ):
+                continue
+            if (intent, keyword) in seen:
+                continue
+            seen.add((intent, keyword))
+            scores[intent] = scores.get(intent, 0.0) + weight
+            matched.setdefault(intent, []).append(keyword)
+
+        total = sum(scores.values())
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [
+            {'intent': intent, 'score': score, 'confidence': score / total, 'keywords': matched[intent]}
+            for intent, score in ranked
+        ]
+
+    def predict(self, text: str, min_confidence: float = 0.0) -> str:
+        """返回最可能的意图，没有匹配或置信度不足时返回 general"""
+        ranked = self.classify(text)
+        if ranked and ranked[0]['confidence'] >= min_confidence:
+            return ranked[0]['intent']
+        return DEFAULT_INTENT
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+def get_intent_classifier() -> IntentClassifier:
+    """默认关键词表的分类器，自动机构建一次后所有会话只读共享"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = IntentClassifier()
+    return _classifier
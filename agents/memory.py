@@ -0,0 +1,163 @@
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, Optional, List, Iterator, TYPE_CHECKING
+from utils.token_budget import get_token_estimator
+
+if TYPE_CHECKING:
+    from agents.memory_backend import MemoryBackend
+
+class MemoryRecord:
+    """一条交互记录"""
+
+    __slots__ = ('user_input', 'assistant_response', 'timestamp', 'context', 'rendered', 'tokens')
+
+    def __init__(self, user_input: str = '', assistant_response: str = '', timestamp: str = '',
+                 context: Optional[Dict[str, Any]] = None):
+        self.user_input = user_input
+        self.assistant_response = assistant_response
+        self.timestamp = timestamp
+        self.context = context
+        # 渲染后的上下文文本和token数在写入时计算一次
+        self.rendered = f"用户: {user_input}\n助手: {assistant_response}"
+        self.tokens = get_token_estimator().count(self.rendered)
+
+    @classmethod
+    def from_dict(cls, interaction: Dict[str, Any]) -> 'MemoryRecord':
+        return cls(
+            user_input=interaction.get('user_input') or '',
+            assistant_response=interaction.get('assistant_response') or '',
+            timestamp=interaction.get('timestamp') or '',
+            context=interaction.get('context')
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """兼容原来以字典保存记录时的读取方式"""
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'user_input': self.user_input,
+            'assistant_response': self.assistant_response,
+            'timestamp': self.timestamp,
+            'context': self.context
+        }
+
+class MemoryStore:
+    """定长环形缓冲的智能体记忆
+
+    超过容量时自动淘汰最早的记录；最近 context_size 条的上下文文本和token总数
+    在写入和淘汰时增量维护（追加新记录、截掉被淘汰记录的前缀），读取上下文不再遍历和拼接。
+    配置了持久化后端时按 session_id 保存，首次访问时才从后端加载最近 capacity 条。
+    """
+
+    def __init__(self, capacity: int = 100, context_size: int = 10,
+                 backend: Optional['MemoryBackend'] = None, session_id: Optional[str] = None):
+        self.capacity = capacity
+        self.context_size = context_size
+        self.backend = backend if session_id else None
+        self.session_id = session_id
+        self._records: deque = deque(maxlen=capacity)
+        self._context_records: deque = deque(maxlen=context_size)
+        self._context_text = ''
+        self._context_tokens = 0
+        self._total = 0  # 累计写入的记录数（含已淘汰的）
+        self._loaded = self.backend is None
+
+    def _ensure_loaded(self):
+        """首次访问时从后端加载最近的记录"""
+        if self._loaded:
+            return
+        self._loaded = True
+        interactions, total = self.backend.load_recent(self.session_id, self.capacity)
+        for interaction in interactions:
+            record = MemoryRecord.from_dict(interaction)
+            self._records.append(record)
+            self._context_records.append(record)
+        self._total = total
+        self._rebuild_context()
+
+    def _rebuild_context(self):
+        """按当前上下文记录重建文本和token总数（加载和清空时使用）"""
+        self._context_text = "\n".join(record.rendered for record in self._context_records)
+        self._context_tokens = sum(record.tokens for record in self._context_records)
+
+    def _push_context(self, record: MemoryRecord):
+        """把新记录加入上下文窗口，窗口已满时从文本开头截掉最早一条"""
+        if self.context_size <= 0:
+            return
+        if len(self._context_records) == self.context_size:
+            evicted = self._context_records[0]
+            self._context_text = self._context_text[len(evicted.rendered) + 1:]
+            self._context_tokens -= evicted.tokens
+        self._context_records.append(record)
+        self._context_text = f"{self._context_text}\n{record.rendered}" if self._context_text else record.rendered
+        self._context_tokens += record.tokens
+
+    @property
+    def total(self) -> int:
+        self._ensure_loaded()
+        return self._total
+
+    def append(self, interaction: Dict[str, Any]) -> MemoryRecord:
+        """写入一条交互记录（持久化由后端在后台批量完成）"""
+        self._ensure_loaded()
+        record = MemoryRecord.from_dict(interaction)
+        self._records.append(record)
+        self._push_context(record)
+        if self.backend is not None:
+            self.backend.append(self.session_id, record.to_dict())
+        self._total += 1
+        return record
+
+    def clear(self):
+        self._records.clear()
+        self._context_records.clear()
+        self._rebuild_context()
+        self._total = 0
+        self._loaded = True
+        if self.backend is not None:
+            self.backend.clear(self.session_id)
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[MemoryRecord]:
+        self._ensure_loaded()
+        return iter(self._records)
+
+    @property
+    def first_index(self) -> int:
+        """缓冲区中最早一条记录的全局序号"""
+        return self.total - len(self._records)
+
+    def recent(self, count: int) -> List[MemoryRecord]:
+        """最近count条记录，按时间顺序"""
+        self._ensure_loaded()
+        count = max(0, min(count, len(self._records)))
+        return list(islice(reversed(self._records), count))[::-1]
+
+    def since(self, index: int) -> List[MemoryRecord]:
+        """全局序号不小于index的记录"""
+        return self.recent(self.total - max(index, self.first_index))
+
+    def render_since(self, index: int, max_tokens: Optional[int] = None) -> str:
+        """把全局序号不小于index的记录渲染成文本，给定max_tokens时只保留预算内最近的记录"""
+        return self._render(self.since(index), max_tokens)
+
+    @staticmethod
+    def _render(records, max_tokens: Optional[int]) -> str:
+        kept, used = [], 0
+        for record in reversed(records):
+            used += record.tokens
+            if max_tokens is not None and used > max_tokens:
+                break
+            kept.append(record.rendered)
+        return "\n".join(reversed(kept))
+
+    def get_context(self, max_tokens: Optional[int] = None) -> str:
+        """最近 context_size 条记录渲染成的文本，给定max_tokens时只保留预算内最近的记录"""
+        self._ensure_loaded()
+        if max_tokens is None or self._context_tokens <= max_tokens:
+            return self._context_text
+        return self._render(self._context_records, max_tokens)
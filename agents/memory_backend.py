@@ -0,0 +1,222 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional, List, Tuple
+from config.settings import Config
+from utils.logger import setup_logger
+
+class MemoryBackend(ABC):
+    """智能体记忆的持久化后端，按会话id存取交互记录和滚动摘要"""
+
+    @abstractmethod
+    def load_recent(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """读取会话最近limit条记录（按时间顺序）和累计记录数"""
+        pass
+
+    @abstractmethod
+    def append(self, session_id: str, interaction: Dict[str, Any]):
+        """追加一条记录，序号由后端按写入顺序分配（同一会话的多个写入方不会互相覆盖）"""
+        pass
+
+    @abstractmethod
+    def load_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """读取会话的滚动摘要 {'summary', 'summarized_until'}，没有时返回None"""
+        pass
+
+    @abstractmethod
+    def save_summary(self, session_id: str, summary: str, summarized_until: int):
+        """保存会话的滚动摘要"""
+        pass
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        """删除会话的所有记录和摘要"""
+        pass
+
+    def flush(self):
+        """把尚未落盘的写入刷到存储"""
+        pass
+
+    def close(self):
+        """刷新并释放资源"""
+        self.flush()
+
+class SQLiteMemoryBackend(MemoryBackend):
+    """SQLite记忆后端
+
+    使用WAL模式，多个 Streamlit 副本可以同时读写同一个数据库文件；写入先进入
+    内存队列，由后台线程每隔 flush_interval 秒或攒够 batch_size 条时在一个事务里
+    批量提交（synchronous=NORMAL，不在每次请求时同步磁盘）。读取前会先刷新队列，
+    保证同一进程内读到自己刚写入的记录。批次按入队顺序提交，记录序号在提交事务内
+    按 MAX(seq)+1 分配。
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, batch_size: int = 50):
+        self.logger = setup_logger("memory_backend")
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[Tuple[str, tuple]] = []
+        self._pending_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._conn = self._connect()
+        self._flusher = threading.Thread(target=self._flush_loop, name="memory_flush", daemon=True)
+        self._flusher.start()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """打开数据库并建表"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS memories ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, user_input TEXT, "
+                "assistant_response TEXT, timestamp TEXT, context TEXT, "
+                "PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                "summarized_until INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            self.logger.error(f"记忆数据库初始化失败，记忆将不会持久化: {str(e)}")
+            return None
+
+    def _enqueue(self, sql: str, params: tuple):
+        with self._pending_lock:
+            self._pending.append((sql, params))
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """在一个事务里提交队列中的全部写入
+
+        取出队列和提交在同一把锁内完成，并发刷新时先取出的批次一定先提交。
+        """
+        with self._db_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending or self._conn is None:
+                return
+            try:
+                with self._conn:
+                    for sql, params in pending:
+                        self._conn.execute(sql, params)
+            except sqlite3.Error as e:
+                self.logger.error(f"记忆写入失败，丢弃{len(pending)}条写入: {str(e)}")
+
+    def load_recent(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        self.flush()
+        if self._conn is None:
+            return [], 0
+        with self._db_lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT seq, user_input, assistant_response, timestamp, context FROM memories "
+                    "WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (session_id, limit)
+                ).fetchall()
+            except sqlite3.Error as e:
+                self.logger.error(f"读取记忆失败: {str(e)}")
+                return [], 0
+        if not rows:
+            return [], 0
+        records = [
+            {
+                'user_input': user_input,
+                'assistant_response': assistant_response,
+                'timestamp': timestamp,
+                'context': json.loads(context) if context else None
+            }
+            for _, user_input, assistant_response, timestamp, context in reversed(rows)
+        ]
+        return records, rows[0][0] + 1
+
+    def append(self, session_id: str, interaction: Dict[str, Any]):
+        context = interaction.get('context')
+        self._enqueue(
+            "INSERT INTO memories (session_id, seq, user_input, assistant_response, timestamp, context) "
+            "SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ?, ?, ? FROM memories WHERE session_id = ?",
+            (
+                session_id, interaction.get('user_input'), interaction.get('assistant_response'),
+                interaction.get('timestamp'),
+                json.dumps(context, ensure_ascii=False, default=str) if context is not None else None,
+                session_id
+            )
+        )
+
+    def load_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        if self._conn is None:
+            return None
+        with self._db_lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT summary, summarized_until FROM summaries WHERE session_id = ?", (session_id,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                self.logger.error(f"读取对话摘要失败: {str(e)}")
+                return None
+        if row is None:
+            return None
+        return {'summary': row[0], 'summarized_until': row[1]}
+
+    def save_summary(self, session_id: str, summary: str, summarized_until: int):
+        self._enqueue(
+            "INSERT OR REPLACE INTO summaries (session_id, summary, summarized_until, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (session_id, summary, summarized_until, time.time())
+        )
+
+    def clear(self, session_id: str):
+        self._enqueue("DELETE FROM memories WHERE session_id = ?", (session_id,))
+        self._enqueue("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+
+    def close(self):
+        """停止后台线程，刷新剩余写入并关闭连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_backend: Optional[MemoryBackend] = None
+_backend_lock = threading.Lock()
+
+def get_memory_backend() -> Optional[MemoryBackend]:
+    """按配置获取进程内共享的记忆后端，AI_MEMORY_BACKEND=memory 时返回None（只保存在进程内）"""
+    global _backend
+    if Config.AI_MEMORY_BACKEND != 'sqlite':
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = SQLiteMemoryBackend(
+                    Config.AI_MEMORY_DB_PATH,
+                    flush_interval=Config.AI_MEMORY_FLUSH_INTERVAL,
+                    batch_size=Config.AI_MEMORY_FLUSH_BATCH_SIZE
+                )
+                # 进程退出前把队列里的写入刷到磁盘
+                atexit.register(_backend.close)
+    return _backend
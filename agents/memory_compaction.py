@@ -0,0 +1,121 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, List
+from agents.memory import MemoryStore
+from utils.logger import setup_logger
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责压缩儿童教育游戏设计对话的历史记录。请把已有摘要和新的对话合并成一段简洁的中文摘要，"
+    "保留用户的目标、年龄段、已确定的设计决定和未解决的问题，省略寒暄和重复内容。只输出摘要本身。"
+)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """所有会话共享的摘要线程池，摘要任务不占用请求线程"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory_summary")
+    return _executor
+
+class MemoryCompactor:
+    """滚动摘要式记忆压缩
+
+    最近的对话按原文保留；未摘要的原文超过 recent_tokens 时，把较早的一半
+    交给低成本模型在后台线程中合并进滚动摘要，完成后原文窗口才前移。
+    摘要保存在会话自己的压缩器里，请求时直接读取，不会重复生成；
+    记忆配置了持久化后端时摘要随会话一起保存，首次访问时加载。
+    """
+
+    def __init__(self, memory: MemoryStore, ai_manager, recent_tokens: int = 1500,
+                 summary_max_tokens: int = 300, provider: Optional[str] = None,
+                 model: Optional[str] = None):
+        self.logger = setup_logger("memory_compactor")
+        self.memory = memory
+        self.ai_manager = ai_manager
+        self.recent_tokens = recent_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.provider = provider
+        self.model = model
+        self.summary = ""
+        self.summarized_until = 0  # 已并入摘要的记录的全局序号上界（不含）
+        self._lock = threading.Lock()
+        self._pending: Optional[Future] = None
+        self._loaded = memory.backend is None
+
+    def _ensure_loaded(self):
+        """首次访问时从记忆后端加载已保存的摘要（调用方持有锁）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        state = self.memory.backend.load_summary(self.memory.session_id)
+        if state:
+            self.summary = state['summary']
+            self.summarized_until = state['summarized_until']
+
+    def maybe_compact(self) -> Optional[Future]:
+        """原文超出预算时提交后台摘要任务（同一时刻最多一个），立即返回"""
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                return self._pending
+            self._ensure_loaded()
+            records = self.memory.since(self.summarized_until)
+            if sum(record.tokens for record in records) <= self.recent_tokens:
+                return None
+            # 折叠较早的记录，直到剩余原文不超过预算的一半，避免每轮都触发摘要
+            used, fold = sum(record.tokens for record in records), 0
+            while fold < len(records) and used > self.recent_tokens // 2:
+                used -= records[fold].tokens
+                fold += 1
+            turns = [record.rendered for record in records[:fold]]
+            until = max(self.summarized_until, self.memory.first_index) + fold
+            self._pending = _get_executor().submit(self._summarize, self.summary, turns, until)
+            return self._pending
+
+    def _build_prompt(self, summary: str, turns: List[str]) -> str:
+        parts = []
+        if summary:
+            parts.append(f"已有摘要:\n{summary}")
+        parts.append("新的对话:\n" + "\n".join(turns))
+        return "\n\n".join(parts)
+
+    def _summarize(self, summary: str, turns: List[str], until: int):
+        """在后台线程中生成新的摘要"""
+        kwargs: Dict[str, Any] = {
+            'system': SUMMARY_SYSTEM_PROMPT,
+            'max_tokens': self.summary_max_tokens,
+            'temperature': 0.3,
+            'priority': 'batch'
+        }
+        if self.model:
+            kwargs['model'] = self.model
+        prompt = self._build_prompt(summary, turns)
+        if self.provider:
+            result = self.ai_manager.send_request(self.provider, prompt, **kwargs)
+        else:
+            result = self.ai_manager.send_request_to_best_provider(prompt, routing_policy='cheapest', **kwargs)
+
+        if not result.get('success'):
+            self.logger.warning(f"对话摘要生成失败，下次写入时重试: {result.get('error')}")
+            return
+        with self._lock:
+            self.summary = result['response'].strip()
+            self.summarized_until = until
+            if self.memory.backend is not None:
+                self.memory.backend.save_summary(self.memory.session_id, self.summary, until)
+        self.logger.info(f"已把{len(turns)}条记录并入对话摘要")
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待进行中的摘要任务完成（用于测试和关闭前）"""
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
+
+    def get_state(self) -> Dict[str, Any]:
+        """当前摘要及其覆盖范围"""
+        with self._lock:
+            self._ensure_loaded()
+            return {'summary': self.summary, 'summarized_until': self.summarized_until}
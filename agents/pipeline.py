@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import Dict, Any, Optional, Callable, Iterable, Tuple
+from utils.client_registry import get_client_registry
+from utils.deadline import Deadline
+
+class TaskGraph:
+    """子任务组成的有向无环图
+
+    每个子任务在它依赖的子任务全部完成后立即开始，互不依赖的子任务并发执行，
+    总耗时约等于关键路径而不是所有子任务之和。子任务函数接收依赖结果组成的字典，
+    可以是普通函数（本地计算）或协程函数（AI请求）。某个子任务出错时，
+    依赖它的子任务不会执行，其余子任务照常完成。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, Tuple[Callable[[Dict[str, Any]], Any], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = ()) -> 'TaskGraph':
+        """添加子任务，依赖必须已经添加（因此图中不会有环）"""
+        deps = tuple(deps)
+        missing = [dep for dep in deps if dep not in self._tasks]
+        if name in self._tasks or missing:
+            raise ValueError(f"无效的子任务: {name}（重复或依赖未定义: {missing}）")
+        self._tasks[name] = (fn, deps)
+        return self
+
+    @property
+    def width(self) -> int:
+        """最宽一层的子任务数，即理想情况下的最大并发数"""
+        levels: Dict[str, int] = {}
+        for name, (_, deps) in self._tasks.items():
+            levels[name] = max((levels[dep] + 1 for dep in deps), default=0)
+        counts: Dict[int, int] = {}
+        for level in levels.values():
+            counts[level] = counts.get(level, 0) + 1
+        return max(counts.values(), default=0)
+
+    async def run_async(self, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """执行所有子任务，返回 {'results', 'errors', 'timings', 'elapsed'}
+
+        给定 deadline 时，到期或取消标记触发后未完成的子任务被取消，错误为超时或取消原因。
+        """
+        futures: Dict[str, asyncio.Future] = {}
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+
+        async def _run(name: str):
+            fn, deps = self._tasks[name]
+            inputs = {}
+            for dep in deps:
+                try:
+                    inputs[dep] = await futures[dep]
+                except Exception:
+                    raise RuntimeError(f"依赖的子任务 {dep} 失败")
+            task_start = time.perf_counter()
+            value = fn(inputs)
+            if asyncio.iscoroutine(value):
+                value = await value
+            timings[name] = time.perf_counter() - task_start
+            return value
+
+        for name in self._tasks:
+            futures[name] = asyncio.ensure_future(_run(name))
+        if deadline is not None:
+            try:
+                await deadline.wait_async(asyncio.wait(list(futures.values())))
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.wait(list(futures.values()))
+        pending = {future for future in futures.values() if not future.done()}
+        for future in pending:
+            future.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        pending_error = deadline.result()['error'] if deadline is not None else '超时'
+
+        results: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for name, future in futures.items():
+            if future in pending:
+                errors[name] = pending_error
+            elif future.exception() is not None:
+                errors[name] = str(future.exception()) or type(future.exception()).__name__
+            else:
+                results[name] = future.result()
+        return {
+            'results': results,
+            'errors': errors,
+            'timings': timings,
+            'elapsed': time.perf_counter() - start
+        }
+
+    def run(self, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """同步入口（供Streamlit脚本线程使用），在客户端注册表的长期事件循环上执行"""
+        return get_client_registry().run(self.run_async(deadline))
@@ -0,0 +1,140 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Any, Optional, List, Hashable
+
+# 连续的中日韩字符、或连续的ASCII字母数字各成一段
+_SEGMENT_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]+|[a-z0-9]+')
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文和数字按整词，中日韩文本切成相邻二元组（单字段保留单字）"""
+    tokens = []
+    for segment in _SEGMENT_PATTERN.findall(text.lower()):
+        if segment.isascii() or len(segment) == 1:
+            tokens.append(segment)
+        else:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return tokens
+
+class BM25Index:
+    """增量更新的BM25倒排索引
+
+    文档可以随时添加和删除，只更新涉及的词项，不需要重建索引；
+    查询只遍历查询词的倒排表。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._doc_terms: Dict[Hashable, List[str]] = {}
+        self._payloads: Dict[Hashable, Any] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id: Hashable, text: str, payload: Any = None):
+        """添加（或替换）一篇文档，payload 在检索时原样返回"""
+        if doc_id in self._doc_lengths:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        self._doc_lengths[doc_id] = len(tokens)
+        self._doc_terms[doc_id] = list(counts)
+        self._payloads[doc_id] = payload
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: Hashable):
+        """删除一篇文档，不存在时忽略"""
+        if doc_id not in self._doc_lengths:
+            return
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        del self._payloads[doc_id]
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """返回得分最高的 top_k 篇文档 [{'id', 'score', 'payload'}]，按得分从高到低排列"""
+        doc_count = len(self._doc_lengths)
+        if not doc_count or top_k <= 0:
+            return []
+        average_length = self._total_length / doc_count or 1.0
+        scores: Dict[Hashable, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        # 得分相同时较晚添加的文档优先（倒排表按添加顺序排列）
+        ranked = sorted(
+            [item for item in scores.items() if item[1] > min_score][::-1],
+            key=lambda item: -item[1]
+        )[:top_k]
+        return [{'id': doc_id, 'score': score, 'payload': self._payloads[doc_id]} for doc_id, score in ranked]
+
+class MemoryRetriever:
+    """会话记忆和游戏设计的相关性检索
+
+    记忆记录按全局序号建索引，写入记忆时增量追加，被环形缓冲淘汰的记录同步删除；
+    持久化后端懒加载的记录在第一次同步时补建索引。
+    """
+
+    def __init__(self, memory, max_designs: int = 50):
+        self.memory = memory
+        self.max_designs = max_designs
+        self.memory_index = BM25Index()
+        self.design_index = BM25Index()
+        self._indexed_from = 0
+        self._indexed_until = 0
+        self._design_count = 0
+
+    def sync(self):
+        """把新写入的记录加入索引，并删除已被淘汰的记录"""
+        first_index, total = self.memory.first_index, self.memory.total
+        if total < self._indexed_until:
+            # 记忆被清空后重建
+            self.memory_index = BM25Index()
+            self._indexed_from = self._indexed_until = 0
+        for index in range(self._indexed_from, min(first_index, self._indexed_until)):
+            self.memory_index.remove(index)
+        self._indexed_from = max(self._indexed_from, first_index)
+        start = max(self._indexed_until, first_index)
+        for offset, record in enumerate(self.memory.since(start)):
+            self.memory_index.add(start + offset, record.rendered, record)
+        self._indexed_until = total
+
+    def add_design(self, title: str, content: str, game_type: str = 'general'):
+        """记录一个生成过的游戏设计，超过 max_designs 时删除最早的设计"""
+        self.design_index.add(self._design_count, f"{title}\n{content}", {
+            'title': title, 'game_type': game_type, 'content': content
+        })
+        self.design_index.remove(self._design_count - self.max_designs)
+        self._design_count += 1
+
+    def retrieve(self, query: str, top_k: int = 3, exclude_from: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """检索与请求相关的记忆记录和游戏设计
+
+        exclude_from 之后（含）的记录已经作为历史消息发送，不再重复检索。
+        """
+        self.sync()
+        excluded = self.memory.total - exclude_from if exclude_from is not None else 0
+        hits = self.memory_index.search(query, top_k + max(0, excluded))
+        memories = [item for item in hits if exclude_from is None or item['id'] < exclude_from][:top_k]
+        return {
+            'memories': memories,
+            'designs': self.design_index.search(query, top_k)
+        }
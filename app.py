@@ -2,19 +2,22 @@ import streamlit as st
 import os
 import sys
 import json
+import re
+import secrets
 from dotenv import load_dotenv
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config.settings import Config
-from utils.logger import setup_logger
+from utils.logger import setup_logger, get_log_pipeline
+from agents.agent_pool import AgentPool
 from agents.game_agent import GameAgent
+from agents.game_pipeline import get_game_generators
+from agents.memory_backend import get_memory_backend
 from utils.ai_manager import AIProviderManager
-from games.math_game import MathGameGenerator
-from games.chinese_game import ChineseGameGenerator
-from games.english_game import EnglishGameGenerator
-from games.scene_generator import GameSceneGenerator
+from utils.deadline import CancelToken, Deadline
+from utils.metrics import start_metrics_server
 from game_code_generator import GameCodeGenerator
 from mobile_game_generator import MobileGameGenerator
 
@@ -24,15 +27,73 @@ load_dotenv()
 # 设置日志
 logger = setup_logger()
 
-# 初始化游戏智能体和AI管理器
-game_agent = GameAgent()
-ai_manager = AIProviderManager()
-math_game_generator = MathGameGenerator()
-chinese_game_generator = ChineseGameGenerator()
-english_game_generator = EnglishGameGenerator()
-scene_generator = GameSceneGenerator()
-game_code_generator = GameCodeGenerator()
-mobile_game_generator = MobileGameGenerator()
+@st.cache_resource
+def get_ai_manager() -> AIProviderManager:
+    """进程内共享的AI管理器，跨会话和脚本重跑复用连接池、缓存和统计"""
+    if Config.AI_METRICS_PORT:
+        start_metrics_server(Config.AI_METRICS_PORT, Config.AI_METRICS_HOST)
+    return AIProviderManager()
+
+def new_request_deadline() -> Deadline:
+    """为本次脚本运行中的AI请求创建截止时间
+
+    Streamlit 每次重新运行脚本时，上一次运行中还没结束的请求会被取消，
+    避免僵尸请求长期占用线程。
+    """
+    previous = st.session_state.get('ai_cancel_token')
+    if previous is not None:
+        previous.cancel('会话已重新运行')
+    token = st.session_state['ai_cancel_token'] = CancelToken()
+    return Deadline(Config.AI_REQUEST_TIMEOUT or None, token)
+
+# 恢复令牌即会话id（secrets.token_urlsafe(32) 生成，43个URL安全字符）
+RESUME_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43,}$')
+
+def get_session_id() -> str:
+    """当前Streamlit会话的id，会话记忆和智能体池都以它为键
+
+    id只保存在会话状态中、不写入URL，分享或收藏页面地址不会共用同一份记忆。
+    只有显式带上难以猜测的恢复令牌（?resume=<令牌>）打开页面时才恢复之前的会话，
+    令牌读取后立即从地址栏移除。
+    """
+    session_id = st.session_state.get('session_id')
+    if session_id is None:
+        resume = st.query_params.get('resume')
+        if resume is not None:
+            del st.query_params['resume']
+        session_id = resume if resume and RESUME_TOKEN_PATTERN.match(resume) else secrets.token_urlsafe(32)
+        st.session_state['session_id'] = session_id
+    return session_id
+
+@st.cache_resource
+def get_code_generators():
+    """进程内共享的游戏代码生成器和移动端代码生成器"""
+    return GameCodeGenerator(), MobileGameGenerator()
+
+@st.cache_resource
+def get_agent_pool() -> AgentPool:
+    """进程内共享的会话智能体池，限制常驻智能体数量，空闲会话的记忆换出到持久化后端"""
+    return AgentPool(
+        lambda session_id: GameAgent(
+            get_ai_manager(), session_id=session_id, memory_backend=get_memory_backend(),
+            code_generator=get_code_generators()[0]
+        ),
+        max_agents=Config.AI_AGENT_POOL_SIZE,
+        idle_timeout=Config.AI_AGENT_IDLE_TIMEOUT
+    )
+
+def lease_game_agent():
+    """租用当前会话的游戏智能体（记忆按会话id持久化），租约期间智能体不会被换出"""
+    return get_agent_pool().lease(get_session_id())
+
+# AI管理器和生成器在进程内共享，脚本重跑时不会重新创建
+ai_manager = get_ai_manager()
+game_generators = get_game_generators()
+math_game_generator = game_generators['math']
+chinese_game_generator = game_generators['chinese']
+english_game_generator = game_generators['english']
+scene_generator = game_generators['scene']
+game_code_generator, mobile_game_generator = get_code_generators()
 
 def main():
     """主应用函数"""
@@ -58,7 +119,7 @@ def main():
         st.header("游戏类型选择")
         game_type = st.selectbox(
             "选择游戏类型",
-            ["数字游戏", "汉字游戏", "英语游戏", "自定义游戏场景"]
+            ["数字游戏", "汉字游戏", "英语游戏", "自定义游戏场景", "智能体咨询", "系统监控"]
         )
         
         st.header("平台选择")
@@ -77,6 +138,10 @@ def main():
             "适合年龄",
             ["3-6岁", "7-10岁", "11-14岁"]
         )
+        
+        with st.expander("恢复对话"):
+            st.caption("以后用 ?resume=<令牌> 打开页面可以继续本次对话，令牌等同于对话的访问权限，请勿分享")
+            st.code(get_session_id())
     
     # 主内容区域
     if game_type == "数字游戏":
@@ -105,9 +170,11 @@ def main():
                         # 显示游戏说明
                         st.success(f"✅ 数字游戏 '{game_title}' 生成成功！")
                         
+                        instructions = math_game_generator.generate_game_instructions(game_data)
+                        
                         # 显示游戏预览
                         with st.expander("游戏预览"):
-                            st.markdown(math_game_generator.generate_game_instructions(game_data))
+                            st.markdown(instructions)
                             
                             # 显示示例题目
                             st.subheader("示例题目")
@@ -117,6 +184,10 @@ def main():
                                 st.write(f"选项: {', '.join(map(str, sample_problem['options']))}")
                                 st.write(f"正确答案: {sample_problem['answer']}")
                         
+                        # 记录设计，后续对话可以检索到
+                        with lease_game_agent() as agent:
+                            agent.add_design(game_title, instructions, 'math')
+                        
                         # 存储游戏数据供下载
                         st.session_state.current_math_game = game_data
                         st.session_state.current_math_game_title = game_title
@@ -253,9 +324,11 @@ def main():
                         # 显示游戏说明
                         st.success(f"✅ 汉字游戏 '{game_title}' 生成成功！")
                         
+                        instructions = chinese_game_generator.generate_game_instructions(game_data)
+                        
                         # 显示游戏预览
                         with st.expander("游戏预览"):
-                            st.markdown(chinese_game_generator.generate_game_instructions(game_data))
+                            st.markdown(instructions)
                             
                             # 显示示例题目
                             st.subheader("示例题目")
@@ -267,6 +340,10 @@ def main():
                                 if 'meaning' in sample_question:
                                     st.write(f"含义: {sample_question['meaning']}")
                         
+                        # 记录设计，后续对话可以检索到
+                        with lease_game_agent() as agent:
+                            agent.add_design(game_title, instructions, 'chinese')
+                        
                         # 存储游戏数据供下载
                         st.session_state.current_chinese_game = game_data
                         st.session_state.current_chinese_game_title = game_title
@@ -403,9 +480,11 @@ def main():
                         # 显示游戏说明
                         st.success(f"✅ 英语游戏 '{game_title}' 生成成功！")
                         
+                        instructions = english_game_generator.generate_game_instructions(game_data)
+                        
                         # 显示游戏预览
                         with st.expander("游戏预览"):
-                            st.markdown(english_game_generator.generate_game_instructions(game_data))
+                            st.markdown(instructions)
                             
                             # 显示示例题目
                             st.subheader("示例题目")
@@ -419,6 +498,10 @@ def main():
                                 if 'explanation' in sample_question:
                                     st.write(f"解释: {sample_question['explanation']}")
                         
+                        # 记录设计，后续对话可以检索到
+                        with lease_game_agent() as agent:
+                            agent.add_design(game_title, instructions, 'english')
+                        
                         # 存储游戏数据供下载
                         st.session_state.current_english_game = game_data
                         st.session_state.current_english_game_title = game_title
@@ -553,9 +636,15 @@ def main():
                         # 显示场景说明
                         st.success(f"✅ 自定义游戏场景 '{game_title}' 生成成功！")
                         
+                        instructions = scene_generator.generate_scene_instructions(scene_data)
+                        
                         # 显示场景详情
                         with st.expander("场景详情"):
-                            st.markdown(scene_generator.generate_scene_instructions(scene_data))
+                            st.markdown(instructions)
+                        
+                        # 记录设计，后续对话可以检索到
+                        with lease_game_agent() as agent:
+                            agent.add_design(game_title, instructions, 'scene')
                         
                         # 存储场景数据供下载
                         st.session_state.current_scene = scene_data
@@ -667,6 +756,124 @@ def main():
                         
                         with st.expander("查看iOS游戏代码"):
                             st.code(st.session_state.current_scene_mobile_games["iOS"], language='python')
+    
+    elif game_type == "智能体咨询":
+        st.subheader("💬 智能体咨询")
+        st.write("与游戏开发智能体对话，获取游戏设计建议")
+        
+        if 'agent_chat_history' not in st.session_state:
+            st.session_state.agent_chat_history = []
+        
+        # 显示历史对话
+        for message in st.session_state.agent_chat_history:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+        
+        user_request = st.chat_input("描述您想开发的游戏")
+        if user_request:
+            with st.chat_message("user"):
+                st.markdown(user_request)
+            
+            with st.chat_message("assistant"):
+                deadline = new_request_deadline()
+                result = {}
+                # 取得智能体或处理请求时出错也要有回复文本，写入对话历史
+                error_text = '抱歉，处理您的请求时出现了错误。'
+                response_text = error_text
+                try:
+                    with lease_game_agent() as agent:
+                        try:
+                            result = agent.process_request_stream(user_request, deadline=deadline)
+                            if 'stream' in result:
+                                # 边生成边显示，缩短首字等待时间
+                                response_text = st.write_stream(result['stream'])
+                                if result['stream'].error:
+                                    st.error(f"生成中断: {result['stream'].error}")
+                            else:
+                                response_text = result.get('response', '')
+                                st.markdown(response_text)
+                                if result.get('error_type') == 'timeout':
+                                    st.warning("AI服务响应超时，请稍后重试")
+                                if result.get('code'):
+                                    st.download_button(
+                                        label="下载游戏代码",
+                                        data=result['code'],
+                                        file_name=f"{result['game_data']['title']}_game.py",
+                                        mime="text/plain"
+                                    )
+                        finally:
+                            # 脚本被重新运行或会话断开时，立即取消请求并关闭流式连接
+                            deadline.cancel_token.cancel('会话已中断')
+                            if 'stream' in result:
+                                result['stream'].close()
+                except Exception as e:
+                    logger.error(f"智能体咨询请求失败: {str(e)}")
+                    response_text = error_text
+                    st.error(error_text)
+            
+            st.session_state.agent_chat_history.append({"role": "user", "content": user_request})
+            st.session_state.agent_chat_history.append({"role": "assistant", "content": response_text})
+    
+    elif game_type == "系统监控":
+        show_admin_page()
+
+def show_admin_page():
+    """AI提供商监控页面：请求量、延迟、错误、token用量、缓存和限流状态"""
+    import pandas as pd
+    
+    st.subheader("📈 系统监控")
+    if Config.AI_METRICS_PORT:
+        st.caption(f"Prometheus指标端点: http://{Config.AI_METRICS_HOST}:{Config.AI_METRICS_PORT}/metrics")
+    if st.button("刷新"):
+        st.rerun()
+    
+    snapshot = ai_manager.get_metrics_snapshot()
+    
+    def _table(name):
+        rows = snapshot.get(name) or []
+        return pd.DataFrame(rows) if rows else None
+    
+    col1, col2, col3, col4 = st.columns(4)
+    requests_rows = snapshot.get('ai_requests_total') or []
+    total_requests = sum(row['value'] for row in requests_rows)
+    failed_requests = sum(row['value'] for row in requests_rows if row['status'] == 'error')
+    cache_stats = ai_manager.get_cache_stats()
+    col1.metric("上游调用", int(total_requests))
+    col2.metric("错误率", f"{failed_requests / total_requests * 100:.1f}%" if total_requests else "-")
+    col3.metric("重试", int(sum(row['value'] for row in snapshot.get('ai_retries_total') or [])))
+    col4.metric("缓存命中率", f"{cache_stats['hit_rate'] * 100:.1f}%" if cache_stats.get('enabled') else "未启用")
+    
+    sections = [
+        ("请求数", 'ai_requests_total'),
+        ("延迟（秒）", 'ai_request_latency_seconds'),
+        ("错误类别", 'ai_errors_total'),
+        ("Token用量", 'ai_tokens_total'),
+        ("限流排队（秒）", 'ai_rate_limit_wait_seconds'),
+    ]
+    for title, name in sections:
+        table = _table(name)
+        if table is not None:
+            st.markdown(f"**{title}**")
+            st.dataframe(table, use_container_width=True, hide_index=True)
+    
+    with st.expander("提供商状态"):
+        st.json({
+            'circuit': ai_manager.get_circuit_status(),
+            'scores': ai_manager.get_provider_scores(),
+            'latency_percentiles': ai_manager.get_latency_percentiles(),
+            'rate_limits': ai_manager.get_rate_limit_stats(),
+            'coalescing': ai_manager.get_coalescing_stats(),
+            'cache': cache_stats,
+            'agent_pool': get_agent_pool().get_stats(),
+            'logging': get_log_pipeline().get_stats()
+        })
+    
+    recent = ai_manager.get_recent_requests()
+    if recent:
+        st.markdown("**最近请求**")
+        table = pd.DataFrame(recent)
+        table['time'] = pd.to_datetime(table['time'], unit='s')
+        st.dataframe(table, use_container_width=True, hide_index=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
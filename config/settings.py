@@ -1,5 +1,6 @@
 import os
-from typing import Optional
+import json
+from typing import Optional, Dict
 
 class Config:
     """应用配置类"""
@@ -12,6 +13,122 @@ class Config:
     
     QWEN_API_KEY: Optional[str] = os.getenv("QWEN_API_KEY")
     
+    # AI HTTP连接池配置
+    AI_HTTP_MAX_CONNECTIONS: int = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "100"))
+    AI_HTTP_MAX_KEEPALIVE: int = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "20"))
+    AI_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "60"))
+    AI_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("AI_HTTP_CONNECT_TIMEOUT", "5"))
+    AI_HTTP_READ_TIMEOUT: float = float(os.getenv("AI_HTTP_READ_TIMEOUT", "60"))
+    AI_HTTP2_ENABLED: bool = os.getenv("AI_HTTP2_ENABLED", "true").lower() == "true"
+    AI_PREWARM_CLIENTS: bool = os.getenv("AI_PREWARM_CLIENTS", "true").lower() == "true"
+    
+    # 模拟提供商配置（压测和离线开发用）
+    AI_MOCK_ENABLED: bool = os.getenv("AI_MOCK_ENABLED", "false").lower() == "true"
+    AI_MOCK_LATENCY_MS: float = float(os.getenv("AI_MOCK_LATENCY_MS", "500"))
+    AI_MOCK_LATENCY_JITTER_MS: float = float(os.getenv("AI_MOCK_LATENCY_JITTER_MS", "200"))
+    AI_MOCK_LATENCY_DISTRIBUTION: str = os.getenv("AI_MOCK_LATENCY_DISTRIBUTION", "lognormal")
+    AI_MOCK_ERROR_RATE: float = float(os.getenv("AI_MOCK_ERROR_RATE", "0"))
+    
+    # AI请求并发配置
+    AI_MAX_CONCURRENCY: int = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+    AI_COALESCE_ENABLED: bool = os.getenv("AI_COALESCE_ENABLED", "true").lower() == "true"
+    
+    # 请求总超时（秒，包含重试和故障切换，0表示不限制），调用方可传入deadline覆盖
+    AI_REQUEST_TIMEOUT: float = float(os.getenv("AI_REQUEST_TIMEOUT", "60"))
+    
+    # Token预算配置：输入上限（不超过模型上下文窗口）、默认/最小输出长度、智能体历史对话上限
+    AI_MAX_INPUT_TOKENS: int = int(os.getenv("AI_MAX_INPUT_TOKENS", "6000"))
+    AI_DEFAULT_MAX_TOKENS: int = int(os.getenv("AI_DEFAULT_MAX_TOKENS", "1000"))
+    AI_MIN_OUTPUT_TOKENS: int = int(os.getenv("AI_MIN_OUTPUT_TOKENS", "256"))
+    AI_HISTORY_MAX_TOKENS: int = int(os.getenv("AI_HISTORY_MAX_TOKENS", "2000"))
+    
+    # 记忆压缩配置：未摘要的原文超过 AI_MEMORY_RECENT_TOKENS 时后台生成滚动摘要，
+    # AI_SUMMARY_PROVIDER / AI_SUMMARY_MODEL 为空时按成本最低的提供商路由
+    AI_MEMORY_COMPACTION_ENABLED: bool = os.getenv("AI_MEMORY_COMPACTION_ENABLED", "true").lower() == "true"
+    AI_MEMORY_RECENT_TOKENS: int = int(os.getenv("AI_MEMORY_RECENT_TOKENS", "1500"))
+    AI_MEMORY_SUMMARY_MAX_TOKENS: int = int(os.getenv("AI_MEMORY_SUMMARY_MAX_TOKENS", "300"))
+    AI_SUMMARY_PROVIDER: str = os.getenv("AI_SUMMARY_PROVIDER", "")
+    AI_SUMMARY_MODEL: str = os.getenv("AI_SUMMARY_MODEL", "")
+    
+    # 相关性检索配置：历史对话只保留最近几轮，更早的记录和生成过的游戏设计按BM25相关性检索 top_k 条
+    AI_RETRIEVAL_ENABLED: bool = os.getenv("AI_RETRIEVAL_ENABLED", "true").lower() == "true"
+    AI_RETRIEVAL_TOP_K: int = int(os.getenv("AI_RETRIEVAL_TOP_K", "3"))
+    AI_RETRIEVAL_RECENT_TURNS: int = int(os.getenv("AI_RETRIEVAL_RECENT_TURNS", "2"))
+    AI_RETRIEVAL_MAX_TOKENS: int = int(os.getenv("AI_RETRIEVAL_MAX_TOKENS", "800"))
+    
+    # 会话智能体池配置：最多常驻的智能体数，以及空闲多久（秒）后换出
+    AI_AGENT_POOL_SIZE: int = int(os.getenv("AI_AGENT_POOL_SIZE", "256"))
+    AI_AGENT_IDLE_TIMEOUT: float = float(os.getenv("AI_AGENT_IDLE_TIMEOUT", "1800"))
+    
+    # 记忆持久化配置：sqlite 按会话保存到 AI_MEMORY_DB_PATH（WAL模式，后台批量写入），memory 只保存在进程内
+    AI_MEMORY_BACKEND: str = os.getenv("AI_MEMORY_BACKEND", "sqlite").lower()
+    AI_MEMORY_DB_PATH: str = os.getenv(
+        "AI_MEMORY_DB_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "agent_memory.db")
+    )
+    AI_MEMORY_FLUSH_INTERVAL: float = float(os.getenv("AI_MEMORY_FLUSH_INTERVAL", "1.0"))
+    AI_MEMORY_FLUSH_BATCH_SIZE: int = int(os.getenv("AI_MEMORY_FLUSH_BATCH_SIZE", "50"))
+    
+    # 指标端点配置（Prometheus文本格式，端口为0表示不启动）
+    AI_METRICS_PORT: int = int(os.getenv("AI_METRICS_PORT", "9464"))
+    AI_METRICS_HOST: str = os.getenv("AI_METRICS_HOST", "127.0.0.1")
+    
+    # 批量生成配置：短于 AI_BATCH_PACK_MAX_CHARS 的提示词每 AI_BATCH_PACK_MAX_ITEMS 条打包成一次请求
+    AI_BATCH_MAX_WORKERS: int = int(os.getenv("AI_BATCH_MAX_WORKERS", "8"))
+    AI_BATCH_PACK_MAX_ITEMS: int = int(os.getenv("AI_BATCH_PACK_MAX_ITEMS", "5"))
+    AI_BATCH_PACK_MAX_CHARS: int = int(os.getenv("AI_BATCH_PACK_MAX_CHARS", "300"))
+    
+    # AI限流配置（0表示不限制），AI_RATE_LIMITS 为JSON，
+    # 例如 {"openai": {"rpm": 500, "tpm": 90000}, "qwen/qwen-turbo": {"rpm": 300}}
+    AI_RATE_LIMIT_RPM: int = int(os.getenv("AI_RATE_LIMIT_RPM", "0"))
+    AI_RATE_LIMIT_TPM: int = int(os.getenv("AI_RATE_LIMIT_TPM", "0"))
+    AI_RATE_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.getenv("AI_RATE_LIMITS", "{}"))
+    AI_RATE_LIMIT_MAX_WAIT: float = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT", "60"))
+    
+    # AI请求重试与熔断配置
+    AI_MAX_RETRIES: int = int(os.getenv("AI_MAX_RETRIES", "2"))
+    AI_RETRY_BASE_DELAY: float = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+    AI_RETRY_MAX_DELAY: float = float(os.getenv("AI_RETRY_MAX_DELAY", "4.0"))
+    AI_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("AI_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    AI_CIRCUIT_RECOVERY_TIMEOUT: float = float(os.getenv("AI_CIRCUIT_RECOVERY_TIMEOUT", "30"))
+    
+    # AI路由配置: fastest / cheapest / balanced
+    AI_ROUTING_POLICY: str = os.getenv("AI_ROUTING_POLICY", "balanced")
+    AI_SCORER_ALPHA: float = float(os.getenv("AI_SCORER_ALPHA", "0.3"))
+    
+    # AI对冲请求配置
+    AI_HEDGING_ENABLED: bool = os.getenv("AI_HEDGING_ENABLED", "false").lower() == "true"
+    AI_HEDGE_PERCENTILE: float = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+    AI_HEDGE_MIN_DELAY: float = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.5"))
+    AI_HEDGE_MAX_DELAY: float = float(os.getenv("AI_HEDGE_MAX_DELAY", "10"))
+    AI_HEDGE_DEFAULT_DELAY: float = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "3"))
+    
+    # AI响应缓存配置
+    AI_CACHE_ENABLED: bool = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+    AI_CACHE_DB_PATH: str = os.getenv(
+        "AI_CACHE_DB_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "ai_responses.db")
+    )
+    AI_CACHE_MEMORY_SIZE: int = int(os.getenv("AI_CACHE_MEMORY_SIZE", "256"))
+    AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+    AI_CACHE_TTL: int = int(os.getenv("AI_CACHE_TTL", "86400"))  # 24小时
+    
+    # 日志配置：所有记录器写入一个有界队列，由后台线程批量写控制台和文件；
+    # 队列满时 drop 丢弃新记录，block 让写日志的线程等待
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_QUEUE_POLICY: str = os.getenv("LOG_QUEUE_POLICY", "drop").lower()
+    LOG_BATCH_SIZE: int = int(os.getenv("LOG_BATCH_SIZE", "100"))
+    LOG_FLUSH_INTERVAL: float = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+    # 记录持续稀疏到达时，缓冲中最早的记录最多等待的秒数
+    LOG_FLUSH_MAX_DELAY: float = float(os.getenv("LOG_FLUSH_MAX_DELAY", "5.0"))
+    # 所有记录器共用 logs/app.log，超过大小或跨天时轮转，归档可压缩，总大小有上限
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_MAX_TOTAL_BYTES: int = int(os.getenv("LOG_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+    LOG_COMPRESS: bool = os.getenv("LOG_COMPRESS", "true").lower() == "true"
+    # 结构化日志：输出JSON Lines；高频事件按类型采样（WARNING及以上总是记录，文本模式不采样）
+    LOG_STRUCTURED: bool = os.getenv("LOG_STRUCTURED", "false").lower() == "true"
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "cache_hit=0.01,ai_request=0.1,game_created=0.1")
+    
     # 应用配置
     APP_NAME: str = "游戏开发智能体"
     APP_VERSION: str = "1.0.0"
@@ -29,7 +146,7 @@ class Config:
     @classmethod
     def validate_config(cls) -> bool:
         """验证配置是否有效"""
-        # 至少需要一个AI提供商的API密钥
-        if not any([cls.OPENAI_API_KEY, cls.ANTHROPIC_API_KEY, cls.QWEN_API_KEY]):
+        # 至少需要一个AI提供商的API密钥（或启用模拟提供商）
+        if not any([cls.OPENAI_API_KEY, cls.ANTHROPIC_API_KEY, cls.QWEN_API_KEY, cls.AI_MOCK_ENABLED]):
             return False
         return True
\ No newline at end of file
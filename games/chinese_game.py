@@ -1,7 +1,7 @@
 import random
 import json
 from typing import Dict, Any, List
-from utils.logger import setup_logger
+from utils.logger import setup_logger, log_event
 
 class ChineseGameGenerator:
     """汉字游戏生成器"""
@@ -12,8 +12,9 @@ class ChineseGameGenerator:
     
     def _init_character_database(self):
         """初始化汉字数据库"""
+        # 题库只读（元组），多个会话共享同一个生成器并发出题时无需加锁
         # 基础汉字数据库
-        self.basic_characters = [
+        self.basic_characters = (
             {'char': '人', 'pinyin': 'rén', 'meaning': '人', 'stroke_count': 2},
             {'char': '大', 'pinyin': 'dà', 'meaning': '大', 'stroke_count': 3},
             {'char': '小', 'pinyin': 'xiǎo', 'meaning': '小', 'stroke_count': 3},
@@ -40,10 +41,10 @@ class ChineseGameGenerator:
             {'char': '西', 'pinyin': 'xī', 'meaning': '西方', 'stroke_count': 6},
             {'char': '南', 'pinyin': 'nán', 'meaning': '南方', 'stroke_count': 9},
             {'char': '北', 'pinyin': 'běi', 'meaning': '北方', 'stroke_count': 5},
-        ]
+        )
         
         # 常用词语
-        self.common_words = [
+        self.common_words = (
             {'word': '你好', 'pinyin': 'nǐ hǎo', 'meaning': '问候'},
             {'word': '谢谢', 'pinyin': 'xiè xiè', 'meaning': '感谢'},
             {'word': '再见', 'pinyin': 'zài jiàn', 'meaning': '告别'},
@@ -54,16 +55,16 @@ class ChineseGameGenerator:
             {'word': '家庭', 'pinyin': 'jiā tíng', 'meaning': '家庭'},
             {'word': '快乐', 'pinyin': 'kuài lè', 'meaning': '快乐'},
             {'word': '学习', 'pinyin': 'xué xí', 'meaning': '学习'},
-        ]
+        )
         
         # 成语
-        self.idioms = [
+        self.idioms = (
             {'idiom': '一心一意', 'pinyin': 'yī xīn yī yì', 'meaning': '专心致志'},
             {'idiom': '四面八方', 'pinyin': 'sì miàn bā fāng', 'meaning': '各个方向'},
             {'idiom': '五颜六色', 'pinyin': 'wǔ yán liù sè', 'meaning': '色彩丰富'},
             {'idiom': '七上八下', 'pinyin': 'qī shàng bā xià', 'meaning': '心神不定'},
             {'idiom': '十全十美', 'pinyin': 'shí quán shí měi', 'meaning': '完美无缺'},
-        ]
+        )
     
     def generate_character_questions(self, character_type: str, difficulty: str, count: int = 10) -> List[Dict[str, Any]]:
         """生成汉字题目"""
@@ -170,6 +171,8 @@ class ChineseGameGenerator:
             }
         }
         
+        log_event(self.logger, 'game_created', game_type='chinese', character_type=character_type, difficulty=difficulty,
+                  age_group=age_group, questions=len(game_data['questions']))
         return game_data
     
     def generate_game_instructions(self, game_data: Dict[str, Any]) -> str:
@@ -1,7 +1,7 @@
 import random
 import json
 from typing import Dict, Any, List
-from utils.logger import setup_logger
+from utils.logger import setup_logger, log_event
 
 class EnglishGameGenerator:
     """英语游戏生成器"""
@@ -12,8 +12,9 @@ class EnglishGameGenerator:
     
     def _init_english_database(self):
         """初始化英语数据库"""
+        # 题库只读（元组），多个会话共享同一个生成器并发出题时无需加锁
         # 字母数据库
-        self.alphabet = [
+        self.alphabet = (
             {'letter': 'A', 'word': 'Apple', 'sound': '/eɪ/', 'example': 'A for Apple'},
             {'letter': 'B', 'word': 'Ball', 'sound': '/biː/', 'example': 'B for Ball'},
             {'letter': 'C', 'word': 'Cat', 'sound': '/siː/', 'example': 'C for Cat'},
@@ -40,10 +41,10 @@ class EnglishGameGenerator:
             {'letter': 'X', 'word': 'X-ray', 'sound': '/eks/', 'example': 'X for X-ray'},
             {'letter': 'Y', 'word': 'Yellow', 'sound': '/waɪ/', 'example': 'Y for Yellow'},
             {'letter': 'Z', 'word': 'Zoo', 'sound': '/ziː/', 'example': 'Z for Zoo'},
-        ]
+        )
         
         # 常用单词
-        self.common_words = [
+        self.common_words = (
             {'word': 'hello', 'translation': '你好', 'category': 'greeting'},
             {'word': 'goodbye', 'translation': '再见', 'category': 'greeting'},
             {'word': 'thank you', 'translation': '谢谢', 'category': 'polite'},
@@ -68,10 +69,10 @@ class EnglishGameGenerator:
             {'word': 'three', 'translation': '三', 'category': 'number'},
             {'word': 'four', 'translation': '四', 'category': 'number'},
             {'word': 'five', 'translation': '五', 'category': 'number'},
-        ]
+        )
         
         # 简单对话
-        self.simple_dialogues = [
+        self.simple_dialogues = (
             {
                 'question': 'What is your name?',
                 'answer': 'My name is...',
@@ -102,10 +103,10 @@ class EnglishGameGenerator:
                 'translation': '这是什么？',
                 'options': ['This is a...', 'I am fine.', 'Thank you.', 'Hello.']
             }
-        ]
+        )
         
         # 语法练习
-        self.grammar_exercises = [
+        self.grammar_exercises = (
             {
                 'question': 'I ___ a student.',
                 'answer': 'am',
@@ -136,7 +137,7 @@ class EnglishGameGenerator:
                 'options': ['am', 'is', 'are', 'be'],
                 'explanation': '主语是第一人称复数，用are'
             }
-        ]
+        )
     
     def generate_english_questions(self, english_type: str, difficulty: str, count: int = 10) -> List[Dict[str, Any]]:
         """生成英语题目"""
@@ -193,7 +194,7 @@ class EnglishGameGenerator:
                 'type': 'dialogue',
                 'question': f"如何回答: '{item['question']}'?",
                 'answer': item['answer'],
-                'options': item['options'],
+                'options': list(item['options']),
                 'translation': item['translation']
             }
         elif english_type == "语法练习":
@@ -201,7 +202,7 @@ class EnglishGameGenerator:
                 'type': 'grammar',
                 'question': item['question'],
                 'answer': item['answer'],
-                'options': item['options'],
+                'options': list(item['options']),
                 'explanation': item.get('explanation', '')
             }
     
@@ -254,6 +255,8 @@ class EnglishGameGenerator:
             }
         }
         
+        log_event(self.logger, 'game_created', game_type='english', english_type=english_type, difficulty=difficulty,
+                  age_group=age_group, questions=len(game_data['questions']))
         return game_data
     
     def generate_game_instructions(self, game_data: Dict[str, Any]) -> str:
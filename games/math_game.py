@@ -1,7 +1,7 @@
 import random
 import json
 from typing import Dict, Any, List, Tuple
-from utils.logger import setup_logger
+from utils.logger import setup_logger, log_event
 
 class MathGameGenerator:
     """数字游戏生成器"""
@@ -142,6 +142,8 @@ class MathGameGenerator:
             }
         }
         
+        log_event(self.logger, 'game_created', game_type='math', operation=operation, difficulty=difficulty,
+                  age_group=age_group, questions=len(game_data['problems']))
         return game_data
     
     def generate_game_instructions(self, game_data: Dict[str, Any]) -> str:
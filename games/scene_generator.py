@@ -1,6 +1,6 @@
 import json
 from typing import Dict, Any, List
-from utils.logger import setup_logger
+from utils.logger import setup_logger, log_event
 
 class GameSceneGenerator:
     """游戏场景生成器"""
@@ -22,6 +22,8 @@ class GameSceneGenerator:
             'technical_requirements': self._define_technical_requirements()
         }
         
+        log_event(self.logger, 'game_created', game_type='scene', age_group=age_group,
+                  characters=lambda elements=scene_data['scene_elements']: len(elements.get('characters', [])))
         return scene_data
     
     def _analyze_scene_elements(self, description: str, action_logic: str) -> Dict[str, Any]:
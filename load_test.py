@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+AI提供商管理器压测脚本
+按目标QPS向 AIProviderManager 发送请求，统计吞吐量和延迟分位数。
+默认使用模拟提供商，不消耗API额度。
+
+示例:
+    python3 load_test.py --qps 20 --duration 30 --latency-ms 800 --error-rate 0.02
+    python3 load_test.py --provider best --qps 5 --duration 10
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.ai_manager import AIProviderManager
+from utils.ai_providers import MockProvider
+
+SAMPLE_PROMPTS = [
+    "我想创建一个加法游戏，适合3-6岁",
+    "设计一个汉字认读游戏，适合7-10岁",
+    "生成一个英语字母配对游戏",
+    "根据跳跃和收集金币的动作逻辑生成游戏场景",
+    "设计一个乘法口诀闯关游戏",
+]
+
+def percentile(sorted_values, percent):
+    """计算分位数（最近秩法）"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AIProviderManager 压测")
+    parser.add_argument("--qps", type=float, default=10.0, help="目标每秒请求数")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长（秒）")
+    parser.add_argument("--workers", type=int, default=64, help="最大并发线程数")
+    parser.add_argument("--provider", default="mock", help="提供商名称，best 表示使用最佳提供商路由")
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="模拟提供商平均延迟")
+    parser.add_argument("--jitter-ms", type=float, default=200.0, help="模拟提供商延迟抖动")
+    parser.add_argument("--distribution", default="lognormal",
+                        choices=["constant", "uniform", "exponential", "lognormal"], help="模拟延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟错误率")
+    parser.add_argument("--unique", action="store_true", help="每个请求使用不同的提示词（避开缓存和请求合并）")
+    parser.add_argument("--no-cache", action="store_true", help="关闭响应缓存")
+    return parser.parse_args()
+
+def run_load_test(args):
+    """按固定间隔发送请求（开环），避免慢请求拖低实际QPS"""
+    manager = AIProviderManager()
+    if args.no_cache:
+        manager.cache = None
+    if args.provider == "mock":
+        manager.providers["mock"] = MockProvider(
+            latency_ms=args.latency_ms,
+            latency_jitter_ms=args.jitter_ms,
+            latency_distribution=args.distribution,
+            error_rate=args.error_rate
+        )
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def send(index):
+        prompt = SAMPLE_PROMPTS[index % len(SAMPLE_PROMPTS)]
+        if args.unique:
+            prompt = f"{prompt} #{index}"
+        start = time.monotonic()
+        if args.provider == "best":
+            result = manager.send_request_to_best_provider(prompt)
+        else:
+            result = manager.send_request(args.provider, prompt)
+        elapsed = time.monotonic() - start
+        with lock:
+            if result.get('success'):
+                latencies.append(elapsed)
+            else:
+                errors.append(result.get('error', '未知错误'))
+
+    total_requests = int(args.qps * args.duration)
+    interval = 1.0 / args.qps
+    print(f"🚀 开始压测: 目标 {args.qps} QPS，持续 {args.duration} 秒，共 {total_requests} 个请求")
+
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for index in range(total_requests):
+            delay = start_time + index * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, index)
+    elapsed = time.monotonic() - start_time
+
+    return manager, latencies, errors, elapsed
+
+def print_report(manager, latencies, errors, elapsed):
+    """输出压测报告"""
+    completed = len(latencies) + len(errors)
+    sorted_latencies = sorted(latencies)
+
+    print("\n" + "=" * 50)
+    print("📊 压测结果:")
+    print(f"   完成请求: {completed}（成功 {len(latencies)}，失败 {len(errors)}）")
+    print(f"   总耗时: {elapsed:.2f}秒")
+    print(f"   吞吐量: {completed / elapsed:.2f} 请求/秒")
+    print(f"   错误率: {len(errors) / completed * 100 if completed else 0:.2f}%")
+    if sorted_latencies:
+        print("   延迟分位数:")
+        for percent in (50, 90, 95, 99):
+            print(f"      p{percent}: {percentile(sorted_latencies, percent) * 1000:.1f} ms")
+        print(f"      max: {sorted_latencies[-1] * 1000:.1f} ms")
+    if errors:
+        print(f"   错误示例: {errors[0]}")
+    print(f"   缓存: {manager.get_cache_stats()}")
+    print(f"   请求合并: {manager.get_coalescing_stats()}")
+    print("=" * 50)
+
+def main():
+    args = parse_args()
+    manager, latencies, errors, elapsed = run_load_test(args)
+    print_report(manager, latencies, errors, elapsed)
+
+if __name__ == "__main__":
+    main()
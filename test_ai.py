@@ -5,8 +5,51 @@ AI提供商功能测试脚本
 
 import sys
 import os
+import atexit
+import shutil
+import tempfile
+import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from config.settings import Config
+from utils.ai_providers import AIProvider
+
+# 测试不预热SDK客户端（不建立网络连接），响应缓存和记忆数据库放在临时目录
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="game_agent_test_")
+atexit.register(shutil.rmtree, TEST_DATA_DIR, True)
+Config.AI_PREWARM_CLIENTS = False
+Config.AI_CACHE_DB_PATH = os.path.join(TEST_DATA_DIR, "ai_responses.db")
+Config.AI_MEMORY_DB_PATH = os.path.join(TEST_DATA_DIR, "memory.db")
+
+class ScriptedProvider(AIProvider):
+    """测试用提供商：返回固定结果或 handler(prompt, **kwargs) 的结果，可选延迟，记录调用次数"""
+    
+    def __init__(self, name, result=None, handler=None, delay=0.0):
+        super().__init__(name)
+        self.handler = handler or (lambda prompt, **kwargs: dict(result))
+        self.delay = delay
+        self.calls = 0
+    
+    def send_request(self, prompt, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.handler(prompt, **kwargs)
+    
+    def is_available(self):
+        return True
+
+def make_manager(providers, **attributes):
+    """测试用的AI管理器：不使用响应缓存，只包含给定的提供商，attributes 覆盖管理器的属性"""
+    from utils.ai_manager import AIProviderManager
+    
+    manager = AIProviderManager()
+    manager.cache = None
+    manager.providers = providers
+    for name, value in attributes.items():
+        setattr(manager, name, value)
+    return manager
+
 def test_ai_providers():
     """测试AI提供商功能"""
     print("🤖 测试AI提供商功能...")
@@ -60,6 +103,1124 @@ def test_game_agent():
         print(f"❌ 游戏智能体测试失败: {str(e)}")
         return False
 
+def test_concurrent_gather():
+    """测试并发请求"""
+    print("\n⚡ 测试并发请求...")
+    
+    manager = make_manager({'slow': ScriptedProvider(
+        'slow', handler=lambda prompt, **kwargs: {'success': True, 'response': prompt.upper(), 'usage': {'total_tokens': 1}},
+        delay=0.1
+    )})
+    
+    prompts = [f"prompt {i}" for i in range(10)]
+    start = time.time()
+    results = manager.gather(prompts, provider='slow', max_concurrency=10)
+    elapsed = time.time() - start
+    
+    print(f"10个请求耗时: {elapsed:.2f}秒")
+    assert [r['response'] for r in results] == [p.upper() for p in prompts]
+    assert elapsed < 0.5
+    
+    print("✅ 并发请求功能正常!")
+    return True
+
+def test_streaming_response():
+    """测试流式响应"""
+    print("\n📡 测试流式响应...")
+    
+    from utils.ai_providers import StreamResponse
+    
+    def source():
+        yield "你好"
+        yield "，世界"
+        yield {'total_tokens': 5}
+    
+    stream = StreamResponse('test', source())
+    done = []
+    stream.add_done_callback(lambda s: done.append(s.text))
+    
+    deltas = list(stream)
+    assert deltas == ["你好", "，世界"]
+    assert stream.usage == {'total_tokens': 5}
+    assert done == ["你好，世界"]
+    assert stream.get_result()['response'] == "你好，世界"
+    
+    # 从未读取就关闭的流同样执行回调（指标和熔断结果不会丢失）
+    closed = StreamResponse('test', source())
+    done = []
+    closed.add_done_callback(lambda s: done.append(s.error_type))
+    closed.close()
+    assert done == ['cancelled'] and list(closed) == []
+    
+    # 读到一半出错的回复不写入对话历史
+    from agents.game_agent import GameAgent
+    
+    def broken_source():
+        yield "半句"
+        raise RuntimeError("连接中断")
+    
+    agent = GameAgent(make_manager({'broken': ScriptedProvider(
+        'broken', handler=lambda prompt, **kwargs: {'success': True, 'stream': StreamResponse('broken', broken_source())}
+    )}))
+    stream = agent.process_request_stream("设计一个拼图游戏")['stream']
+    assert list(stream) == ["半句"] and stream.error and stream.error_type is None
+    assert not agent.memory
+    
+    print("✅ 流式响应功能正常!")
+    return True
+
+def test_response_cache():
+    """测试响应缓存"""
+    print("\n💾 测试响应缓存...")
+    
+    from utils.response_cache import ResponseCache
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "cache.db")
+        cache = ResponseCache(db_path=db_path, memory_size=2, max_entries=3, ttl=60)
+        
+        key = ResponseCache.make_key('openai', '加法游戏 for 3-6岁', model='gpt-3.5-turbo')
+        assert key != ResponseCache.make_key('openai', '加法游戏 for 3-6岁', model='gpt-4')
+        assert cache.get(key) is None
+        
+        cache.set(key, {'success': True, 'response': '好的'})
+        assert cache.get(key)['response'] == '好的'
+        
+        # 新实例只能从SQLite读取
+        disk_cache = ResponseCache(db_path=db_path, memory_size=2, max_entries=3, ttl=60)
+        assert disk_cache.get(key)['response'] == '好的'
+        assert disk_cache.get_stats()['disk_hits'] == 1
+        
+        for i in range(5):
+            disk_cache.set(f"key{i}", {'success': True, 'response': str(i)})
+        assert disk_cache.get_stats()['disk_entries'] == 3
+        assert disk_cache.get(key) is None
+        
+        stats = cache.get_stats()
+        print(f"缓存统计: {stats}")
+        assert stats['hits'] == 1 and stats['misses'] == 1
+        
+        # 写入和读取的都是副本，调用方之后修改结果不会污染缓存
+        result = {'success': True, 'response': '好的'}
+        cache.set(key, result)
+        result['provider'] = 'openai'
+        hit = cache.get(key)
+        hit['hedged'] = True
+        assert cache.get(key) == {'success': True, 'response': '好的'}
+    
+    # 故障切换给结果标记的 provider 不会出现在之后的缓存命中里
+    from utils.ai_providers import MockProvider
+    manager = make_manager({'qwen': MockProvider(latency_ms=0, latency_jitter_ms=0)})
+    manager.cache = ResponseCache(memory_size=8)
+    assert manager.send_request_to_best_provider("缓存副本")['provider'] == 'qwen'
+    assert 'provider' not in manager.send_request('qwen', "缓存副本")
+    
+    print("✅ 响应缓存功能正常!")
+    return True
+
+def test_failover_and_circuit_breaker():
+    """测试故障切换与熔断"""
+    print("\n🛡️ 测试故障切换与熔断...")
+    
+    from utils.resilience import CircuitBreaker, RetryPolicy
+    
+    manager = make_manager(
+        {
+            'openai': ScriptedProvider('openai', {'success': False, 'error': 'timeout', 'retryable': True}),
+            'qwen': ScriptedProvider('qwen', {'success': True, 'response': 'qwen', 'usage': {}})
+        },
+        retry_policy=RetryPolicy(max_retries=1, base_delay=0.001, max_delay=0.001),
+        breakers={'openai': CircuitBreaker('openai', failure_threshold=2, recovery_timeout=60)}
+    )
+    
+    result = manager.send_request_to_best_provider("你好")
+    assert result['success'] and result['provider'] == 'qwen'
+    assert manager.providers['openai'].calls == 2
+    assert manager.get_circuit_status()['openai']['state'] == CircuitBreaker.OPEN
+    
+    # 熔断后直接跳过openai
+    manager.send_request_to_best_provider("你好")
+    assert manager.providers['openai'].calls == 2
+    assert manager.get_healthy_providers() == ['qwen']
+    
+    # half_open的探测请求超时或以不可重试的错误结束时归还探测名额，不会一直卡在half_open
+    from utils.ai_providers import MockProvider
+    from utils.deadline import Deadline
+    from utils.rate_limiter import RateLimiterRegistry
+    
+    manager = make_manager(
+        {'mock': MockProvider(latency_ms=0, latency_jitter_ms=0, error_rate=1.0)},
+        retry_policy=RetryPolicy(max_retries=0),
+        breakers={'mock': CircuitBreaker('mock', failure_threshold=1, recovery_timeout=0.05)},
+        rate_limiters=RateLimiterRegistry(default_rpm=60)
+    )
+    manager.send_request('mock', "熔断")
+    assert manager.breakers['mock'].state == CircuitBreaker.OPEN
+    # 熔断时直接返回，不占用限流配额
+    assert manager.send_request('mock', "熔断中")['circuit_open']
+    assert manager.rate_limiters.get('mock').request_bucket.tokens > 58.5
+    time.sleep(0.06)
+    manager.providers = {'mock': MockProvider(latency_ms=300, latency_jitter_ms=0)}
+    assert manager.send_request('mock', "探测超时", deadline=Deadline(0.05))['error_type'] == 'timeout'
+    assert manager.breakers['mock'].state == CircuitBreaker.HALF_OPEN and manager.get_healthy_providers() == ['mock']
+    manager.providers = {'mock': ScriptedProvider('mock', {'success': False, 'error': '参数错误', 'retryable': False})}
+    assert not manager.send_request('mock', "探测失败").get('circuit_open')
+    assert manager.get_healthy_providers() == ['mock']
+    manager.providers = {'mock': MockProvider(latency_ms=0, latency_jitter_ms=0)}
+    assert manager.send_request('mock', "探测成功")['success']
+    assert manager.breakers['mock'].state == CircuitBreaker.CLOSED
+    
+    # 单次调用的SDK超时只算该提供商失败，整体截止时间未到时继续切换（同步、异步和对冲）
+    manager = make_manager(
+        {
+            'openai': MockProvider(latency_ms=3000, latency_jitter_ms=0),
+            'qwen': MockProvider(latency_ms=0, latency_jitter_ms=0)
+        },
+        retry_policy=RetryPolicy(max_retries=0)
+    )
+    assert manager._get_provider_order(None) == ['openai', 'qwen']
+    result = manager.send_request_to_best_provider("你好", timeout=0.2, deadline=Deadline(5))
+    assert result['success'] and result['provider'] == 'qwen'
+    assert manager.gather(["你好"], timeout=0.2, deadline=Deadline(5))[0]['provider'] == 'qwen'
+    result = manager.send_request_to_best_provider("对冲", timeout=0.2, hedge=True, deadline=Deadline(5))
+    assert result['success'] and result['provider'] == 'qwen'
+    
+    print("✅ 故障切换与熔断功能正常!")
+    return True
+
+def test_adaptive_routing():
+    """测试自适应路由"""
+    print("\n🧭 测试自适应路由...")
+    
+    from utils.provider_scorer import ProviderScorer
+    
+    scorer = ProviderScorer(policy='fastest', alpha=0.5)
+    names = ['openai', 'anthropic', 'qwen']
+    
+    # 没有数据时保持静态优先级
+    assert scorer.rank(names) == names
+    
+    scorer.record('openai', None, 3.0, True, {'completion_tokens': 300})
+    scorer.record('anthropic', None, 2.0, True, {'output_tokens': 300})
+    scorer.record('qwen', None, 1.0, True, {'output_tokens': 300})
+    assert scorer.rank(names) == ['qwen', 'anthropic', 'openai']
+    
+    # qwen变慢后流量自动切走
+    for _ in range(5):
+        scorer.record('qwen', None, 6.0, True, {'output_tokens': 300})
+    assert scorer.rank(names)[0] == 'anthropic'
+    assert scorer.rank(names, policy='cheapest')[0] == 'qwen'
+    
+    snapshot = scorer.get_snapshot()
+    print(f"评分快照: {list(snapshot.keys())}")
+    assert snapshot['openai/default']['tokens_per_second'] == 100
+    
+    print("✅ 自适应路由功能正常!")
+    return True
+
+def test_hedged_request():
+    """测试对冲请求"""
+    print("\n⏱️ 测试对冲请求...")
+    
+    from utils.hedging import HedgePolicy, LatencyHistogram
+    
+    manager = make_manager(
+        {
+            'openai': ScriptedProvider('openai', {'success': True, 'response': 'openai', 'usage': {}}, delay=1.0),
+            'qwen': ScriptedProvider('qwen', {'success': True, 'response': 'qwen', 'usage': {}}, delay=0.01)
+        },
+        hedge_policy=HedgePolicy(default_delay=0.05, min_delay=0.01)
+    )
+    
+    start = time.time()
+    result = manager.send_request_hedged("你好", ['openai', 'qwen'])
+    elapsed = time.time() - start
+    print(f"对冲请求耗时: {elapsed:.2f}秒")
+    assert result['provider'] == 'qwen' and result['hedged']
+    assert elapsed < 0.5
+    
+    histogram = LatencyHistogram()
+    for latency in [0.1] * 90 + [2.0] * 10:
+        histogram.record(latency)
+    assert histogram.percentile(50) < 0.15
+    assert 1.9 < histogram.percentile(95) < 2.5
+    
+    print("✅ 对冲请求功能正常!")
+    return True
+
+def test_request_coalescing():
+    """测试相同请求合并"""
+    print("\n🔗 测试相同请求合并...")
+    
+    from concurrent.futures import ThreadPoolExecutor
+    
+    provider = ScriptedProvider('counting', handler=lambda prompt, **kwargs: {'success': True, 'response': prompt, 'usage': {}},
+                                delay=0.1)
+    manager = make_manager({'counting': provider})
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: manager.send_request('counting', '加法游戏'), range(8)))
+    assert all(r['response'] == '加法游戏' for r in results)
+    assert provider.calls == 1
+    
+    # 异步路径同样合并
+    manager.gather(['减法游戏'] * 5, provider='counting')
+    assert provider.calls == 2
+    
+    stats = manager.get_coalescing_stats()
+    print(f"合并统计: {stats}")
+    assert stats['shared'] == 11 and stats['in_flight'] == 0
+    
+    print("✅ 相同请求合并功能正常!")
+    return True
+
+def test_rate_limiter():
+    """测试限流排队"""
+    print("\n🚦 测试限流排队...")
+    
+    import threading
+    from utils.rate_limiter import RateLimiter, RateLimiterRegistry
+    
+    limiter = RateLimiter('test', rpm=6000, tpm=600000)
+    limiter.request_bucket.tokens = -20  # 约0.2秒后才有配额
+    order = []
+    
+    def worker(priority):
+        ticket = limiter.acquire(10, priority=priority, timeout=5)
+        assert ticket.acquired
+        order.append(priority)
+    
+    threads = [threading.Thread(target=worker, args=('batch',)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=worker, args=('interactive',)))
+    threads[-1].start()
+    for thread in threads:
+        thread.join()
+    
+    print(f"放行顺序: {order}")
+    assert order[0] == 'interactive'
+    
+    stats = limiter.get_stats()
+    assert stats['queue_length'] == 0
+    assert stats['priorities']['batch']['max_wait'] > 0.1
+    
+    # 用实际用量对账
+    before = limiter.token_bucket.tokens
+    limiter.reconcile(limiter.acquire(100), {'total_tokens': 40})
+    assert limiter.token_bucket.tokens > before - 100
+    
+    # 未指定模型和显式指定默认模型的请求共用同一份配额
+    provider = ScriptedProvider('openai', {'success': True, 'response': '好的', 'usage': {}})
+    provider.default_model = 'gpt-3.5-turbo'
+    manager = make_manager({'openai': provider}, rate_limiters=RateLimiterRegistry(default_rpm=60))
+    for model in (None, 'default', 'gpt-3.5-turbo'):
+        assert manager.send_request('openai', f"限流键{model}", model=model)['success']
+    assert list(manager.rate_limiters.get_stats()) == ['openai/gpt-3.5-turbo']
+    
+    print("✅ 限流排队功能正常!")
+    return True
+
+def test_mock_provider():
+    """测试模拟提供商"""
+    print("\n🧪 测试模拟提供商...")
+    
+    from utils.ai_providers import MockProvider
+    
+    provider = MockProvider(latency_ms=10, latency_jitter_ms=5, seed=42)
+    first = provider.send_request("我想创建一个加法游戏")
+    second = provider.send_request("我想创建一个加法游戏")
+    assert first['success'] and first['response'] == second['response']
+    assert first['usage']['total_tokens'] > 0
+    
+    stream = provider.send_request("设计一个汉字游戏", stream=True)['stream']
+    assert "".join(stream) == stream.text and stream.usage['total_tokens'] > 0
+    
+    failing = MockProvider(latency_ms=0, error_rate=1.0)
+    result = failing.send_request("你好")
+    assert not result['success'] and result['retryable']
+    
+    # 模拟的前缀缓存按LRU淘汰：最近用过的前缀命中，被挤出的前缀不再命中
+    lru = MockProvider(latency_ms=0, latency_jitter_ms=0, max_cached_prefixes=2)
+    for system in ["系统A", "系统B", "系统A", "系统C"]:
+        lru.send_request("你好", system=system)
+    assert len(lru._seen_prefixes) == 2
+    assert lru.send_request("再来", system="系统A")['usage']['cached_tokens'] > 0
+    assert lru.send_request("再来", system="系统B")['usage']['cached_tokens'] == 0
+    
+    print("✅ 模拟提供商功能正常!")
+    return True
+
+def test_client_registry():
+    """测试客户端注册表"""
+    print("\n🔌 测试客户端注册表...")
+    
+    import asyncio
+    import threading
+    from utils.client_registry import ClientRegistry
+    
+    class AsyncClient:
+        closed = False
+        async def aclose(self):
+            self.closed = True
+    
+    registry = ClientRegistry()
+    built = []
+    registry.register('demo', lambda http_client: built.append(1) or object(),
+                      lambda http_client: AsyncClient())
+    
+    # 并发获取只构建一次
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.get('demo'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1 and all(client is clients[0] for client in clients)
+    
+    # 异步客户端只在注册表的长期事件循环上构建，多次同步/异步调用之间复用
+    async def get_async():
+        return registry.get_async('demo')
+    first = registry.run(get_async())
+    second = asyncio.run(registry.run_async(get_async()))
+    assert first is second
+    try:
+        asyncio.run(get_async())
+        assert False, "注册表事件循环之外不能获取异步客户端"
+    except RuntimeError:
+        pass
+    
+    registry.warm_up(background=False)
+    
+    # 关闭时释放异步客户端并停止事件循环
+    loop = registry.loop
+    registry.close()
+    assert first.closed and loop.is_closed()
+    
+    print("✅ 客户端注册表功能正常!")
+    return True
+
+def test_prompt_prefix_caching():
+    """测试提示词前缀缓存"""
+    print("\n🧩 测试提示词前缀缓存...")
+    
+    from agents.game_agent import GameAgent
+    from utils.ai_providers import MockProvider
+    
+    manager = make_manager({'mock': MockProvider(latency_ms=0, latency_jitter_ms=0)})
+    agent = GameAgent(manager)
+    agent.memory_compactor = None  # 按步长对齐的窗口是未启用记忆压缩时的行为
+    
+    # 历史窗口按步长对齐，连续多轮前缀保持稳定
+    for index in range(12):
+        agent.add_to_memory({'user_input': f'问题{index}', 'assistant_response': f'回答{index}'})
+    window = agent.get_memory_messages(max_items=10, step=5)
+    assert window[0]['content'] == '问题5' and len(window) == 14
+    agent.add_to_memory({'user_input': '问题12', 'assistant_response': '回答12'})
+    assert agent.get_memory_messages(max_items=10, step=5)[:14] == window
+    
+    usages = []
+    for request in ['设计一个拼图游戏', '再设计一个迷宫游戏']:
+        result = agent.process_request_stream(request)
+        assert result['success']
+        stream = result['stream']
+        assert ''.join(stream)
+        usages.append(stream.usage)
+    
+    assert usages[0]['cached_tokens'] == 0
+    assert usages[1]['cached_tokens'] > 0
+    print(f"   第二轮命中缓存 {usages[1]['cached_tokens']} tokens")
+    print("✅ 提示词前缀缓存功能正常!")
+    return True
+
+def test_send_batch():
+    """测试批量生成"""
+    print("\n📦 测试批量生成...")
+    
+    from utils.ai_providers import MockProvider
+    
+    provider = MockProvider(latency_ms=0, latency_jitter_ms=0)
+    calls = []
+    original_send = provider.send_request
+    provider.send_request = lambda prompt, **kwargs: calls.append(prompt) or original_send(prompt, **kwargs)
+    manager = make_manager({'mock': provider})
+    
+    prompts = [f"{grade}年级加法题" for grade in range(1, 7)] * 2 + ["长" * 400]
+    results = manager.send_batch(prompts, provider='mock', pack_max_items=3)
+    
+    assert len(results) == len(prompts)
+    assert all(result['success'] for result in results)
+    # 去重后7个提示词：6个短提示词打包成2次调用，长提示词单独调用
+    assert len(calls) == 3
+    assert results[0]['packed'] and results[0]['response'] == results[6]['response']
+    assert '1年级加法题' in results[0]['response'] and '2年级加法题' in results[1]['response']
+    # 打包请求的用量分摊到各条目，合计与实际调用一致；重复的提示词不重复计费
+    assert all(result['provider'] == 'mock' for result in results)
+    packed_total = sum(result['usage']['total_tokens'] for result in results[:6])
+    assert all(result['usage']['total_tokens'] > 0 for result in results[:6])
+    assert results[6]['duplicate'] and results[6]['usage'] == {}
+    assert packed_total + results[-1]['usage']['total_tokens'] == sum(
+        provider._build_result(prompt)['usage']['total_tokens'] for prompt in calls
+    )
+    
+    # 未知提供商时每条结果单独返回错误
+    failed = manager.send_batch(["题目A", "题目B"], provider='missing')
+    assert len(failed) == 2 and not any(result['success'] for result in failed)
+    
+    print(f"   {len(prompts)}个提示词实际调用{len(calls)}次")
+    print("✅ 批量生成功能正常!")
+    return True
+
+def test_request_deadline():
+    """测试请求截止时间与取消"""
+    print("\n⏱️ 测试请求截止时间与取消...")
+    
+    import asyncio
+    import threading
+    from agents.game_agent import GameAgent
+    from utils.ai_providers import MockProvider
+    from utils.deadline import CancelToken, Deadline
+    
+    manager = make_manager({'mock': MockProvider(latency_ms=500, latency_jitter_ms=0)})
+    
+    # 上游挂起时在截止时间内返回超时结果
+    start = time.monotonic()
+    result = manager.send_request('mock', "超时测试", deadline=Deadline(0.1))
+    assert result['error_type'] == 'timeout' and time.monotonic() - start < 0.4
+    
+    # 取消会打断重试退避
+    manager.providers = {'mock': MockProvider(latency_ms=0, latency_jitter_ms=0, error_rate=1.0)}
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    start = time.monotonic()
+    result = manager.send_request_to_best_provider("取消测试", deadline=Deadline(None, token))
+    assert result['error_type'] == 'cancelled' and time.monotonic() - start < 1.0
+    
+    # 流式回复读到一半被取消，不完整的回复不写入对话历史
+    manager.providers = {'mock': MockProvider(latency_ms=300, latency_jitter_ms=0)}
+    agent = GameAgent(manager)
+    token = CancelToken()
+    result = agent.process_request_stream("设计一个拼图游戏", deadline=Deadline(5, token))
+    stream = result['stream']
+    for _ in stream:
+        token.cancel()
+    assert stream.error_type == 'cancelled' and not agent.memory
+    
+    expired = agent.process_request("设计一个拼图游戏", deadline=Deadline(0))
+    assert expired['error_type'] == 'timeout' and not expired['success']
+    
+    # 异步路径：取消标记立即打断进行中的调用和流水线子任务，不等到截止时间
+    from agents.pipeline import TaskGraph
+    manager.providers = {'mock': MockProvider(latency_ms=2000, latency_jitter_ms=0)}
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel, args=("用户重新提交",)).start()
+    start = time.monotonic()
+    results = manager.gather(["异步取消A", "异步取消B"], provider='mock', deadline=Deadline(10, token))
+    assert all(result['error_type'] == 'cancelled' for result in results)
+    assert time.monotonic() - start < 1.0
+    
+    token = CancelToken()
+    graph = TaskGraph().add('slow', lambda inputs: asyncio.sleep(5))
+    threading.Timer(0.05, token.cancel, args=("用户重新提交",)).start()
+    start = time.monotonic()
+    outcome = graph.run(Deadline(10, token))
+    assert outcome['errors']['slow'] == "用户重新提交" and time.monotonic() - start < 1.0
+    
+    print("✅ 请求截止时间与取消功能正常!")
+    return True
+
+def test_metrics():
+    """测试请求指标"""
+    print("\n📈 测试请求指标...")
+    
+    import urllib.request
+    from utils.ai_providers import MockProvider
+    from utils.metrics import MetricsRegistry, start_metrics_server
+    
+    manager = make_manager({'mock': MockProvider(latency_ms=0, latency_jitter_ms=0)}, metrics=MetricsRegistry())
+    
+    manager.send_request('mock', "指标测试", model='mock-1')
+    manager.providers = {'mock': MockProvider(latency_ms=0, latency_jitter_ms=0, error_rate=1.0)}
+    manager.send_request('mock', "指标测试失败", model='mock-1')
+    
+    metrics = manager.metrics
+    attempts = manager.retry_policy.max_attempts
+    assert metrics.get_value('ai_requests_total', provider='mock', model='mock-1', status='success') == 1
+    assert metrics.get_value('ai_requests_total', provider='mock', model='mock-1', status='error') == attempts
+    assert metrics.get_value('ai_retries_total', provider='mock', model='mock-1') == attempts - 1
+    assert metrics.get_value('ai_errors_total', provider='mock', model='mock-1', error_class='transient') == attempts
+    assert metrics.get_value('ai_tokens_total', provider='mock', model='mock-1', kind='output') > 0
+    assert len(manager.get_recent_requests()) == 2
+    
+    text = metrics.render_prometheus()
+    assert 'ai_requests_total{model="mock-1",provider="mock",status="success"} 1' in text
+    assert 'ai_request_latency_seconds_bucket{model="mock-1",provider="mock",le="+Inf"}' in text
+    
+    server = start_metrics_server(0, registry=metrics)
+    if server is not None:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        assert 'ai_requests_total' in urllib.request.urlopen(url, timeout=5).read().decode('utf-8')
+    
+    print("✅ 请求指标功能正常!")
+    return True
+
+def test_token_budget():
+    """测试token估算与预算"""
+    print("\n🧮 测试token估算与预算...")
+    
+    from utils.ai_providers import MockProvider
+    from utils.token_budget import TokenBudget, TokenEstimator
+    
+    estimator = TokenEstimator()
+    assert estimator.count("加法游戏" * 10, 'qwen') < estimator.count("加法游戏" * 10, 'anthropic')
+    assert estimator.count("") == 0
+    
+    budget = TokenBudget(estimator, max_input_tokens=300, default_max_tokens=1000, min_output_tokens=100)
+    history = []
+    for index in range(10):
+        history += [{"role": "user", "content": f"问题{index}" * 10},
+                    {"role": "assistant", "content": f"回答{index}" * 10}]
+    kwargs = {'history': history}
+    assert budget.apply('qwen', "设计一个游戏", kwargs) is None
+    # 从最早的一轮开始裁剪，保留最近的对话
+    assert 0 < len(kwargs['history']) < len(history) and len(kwargs['history']) % 2 == 0
+    assert kwargs['history'][-1] == history[-1]
+    assert kwargs['estimated_input_tokens'] <= 300 and kwargs['max_tokens'] == 1000
+    
+    # 小上下文窗口时 max_tokens 按剩余空间缩小
+    kwargs = {'model': 'qwen-turbo', 'max_tokens': 9000}
+    budget.max_input_tokens = 0
+    assert budget.apply('qwen', "设计一个游戏", kwargs) is None
+    assert kwargs['max_tokens'] == 8192 - kwargs['estimated_input_tokens']
+    
+    # 超大的请求在发出前被拒绝
+    provider = MockProvider(latency_ms=0, latency_jitter_ms=0)
+    calls = []
+    provider.send_request = lambda prompt, **kwargs: calls.append(prompt)
+    manager = make_manager({'mock': provider})
+    result = manager.send_request('mock', "长" * 20000)
+    assert result['error_type'] == 'too_large' and not calls
+    
+    print("✅ token估算与预算功能正常!")
+    return True
+
+def test_intent_classifier():
+    """测试意图分类"""
+    print("\n🧭 测试意图分类...")
+    
+    from agents.game_agent import GameAgent
+    from agents.intent_classifier import AhoCorasick, IntentClassifier
+    
+    automaton = AhoCorasick()
+    for keyword in ["he", "she", "his", "hers"]:
+        automaton.add(keyword, keyword)
+    assert sorted(keyword for _, keyword, _ in automaton.iter_matches("ushers")) == ["he", "hers", "she"]
+    
+    classifier = IntentClassifier()
+    assert classifier.predict("设计一个加法游戏") == 'math'
+    assert classifier.predict("英语数字歌闯关游戏") == 'english'
+    assert classifier.predict("Make a fun ADDITION game") == 'math'
+    # 英文关键词按整词匹配
+    assert classifier.predict("password game") == 'general'
+    ranked = classifier.classify("用汉字拼出数字的识字游戏")
+    assert [item['intent'] for item in ranked] == ['chinese', 'math']
+    assert abs(sum(item['confidence'] for item in ranked) - 1.0) < 1e-9
+    
+    agent = GameAgent()
+    result = agent.process_request("英语数字歌闯关游戏")
+    assert result['game_type'] == 'english' and result['intents'][0]['intent'] == 'english'
+    
+    print("✅ 意图分类功能正常!")
+    return True
+
+def test_memory_store():
+    """测试环形缓冲记忆"""
+    print("\n🧠 测试环形缓冲记忆...")
+    
+    from agents.game_agent import GameAgent
+    from agents.memory import MemoryStore
+    
+    store = MemoryStore(capacity=5, context_size=3)
+    for index in range(8):
+        store.append({'user_input': f'问题{index}', 'assistant_response': f'回答{index}'})
+    assert len(store) == 5 and store.total == 8 and store.first_index == 3
+    assert [record.user_input for record in store.recent(2)] == ['问题6', '问题7']
+    assert [record.user_input for record in store.since(5)] == ['问题5', '问题6', '问题7']
+    
+    context = store.get_context()
+    assert context == "\n".join(f"用户: 问题{index}\n助手: 回答{index}" for index in (5, 6, 7))
+    assert store.get_context() is context  # 未写入时复用缓存
+    store.append({'user_input': '问题8', 'assistant_response': '回答8'})
+    assert store.get_context().startswith("用户: 问题6") and store.get_context().endswith("回答8")
+    assert store.get_context(max_tokens=store.recent(1)[0].tokens) == "用户: 问题8\n助手: 回答8"
+    # 写入和淘汰时增量维护：已在窗口中的记录不会被重新拼接，文本始终与窗口内记录一致
+    store.recent(1)[0].rendered = "不会被重新拼接"
+    store.append({'user_input': '问题9', 'assistant_response': '回答9'})
+    assert "不会被重新拼接" not in store.get_context() and store.get_context().endswith("回答9")
+    for size in (1, 3):
+        window = MemoryStore(capacity=5, context_size=size)
+        for index in range(7):
+            window.append({'user_input': f'问题{index}', 'assistant_response': f'回答{index}'})
+            assert window.get_context() == "\n".join(record.rendered for record in window.recent(size))
+    
+    agent = GameAgent()
+    for index in range(120):
+        agent.add_to_memory({'user_input': f'问题{index}', 'assistant_response': f'回答{index}'})
+    assert len(agent.memory) == 100 and agent.memory_count == 120
+    assert agent.get_memory_context().count("用户:") == 10
+    assert agent.memory.recent(1)[0].get('user_input') == '问题119'
+    
+    print("✅ 环形缓冲记忆功能正常!")
+    return True
+
+def test_memory_compaction():
+    """测试记忆滚动摘要"""
+    print("\n🗜️ 测试记忆滚动摘要...")
+    
+    from agents.game_agent import GameAgent
+    from agents.memory_compaction import MemoryCompactor
+    from utils.ai_providers import MockProvider
+    
+    manager = make_manager({'mock': MockProvider(latency_ms=0, latency_jitter_ms=0)})
+    agent = GameAgent(manager)
+    agent.memory_compactor = MemoryCompactor(agent.memory, manager, recent_tokens=60, summary_max_tokens=50)
+    
+    for index in range(10):
+        agent.add_to_memory({'user_input': f'设计问题{index}', 'assistant_response': f'设计回答{index}'})
+        agent.memory_compactor.wait(5)
+    
+    state = agent.memory_compactor.get_state()
+    assert state['summary'] and state['summarized_until'] > 0
+    unsummarized = agent.memory.since(state['summarized_until'])
+    assert sum(record.tokens for record in unsummarized) <= 60
+    
+    # 摘要之后只保留尚未摘要的原文，并附在系统提示词后
+    messages = agent.get_memory_messages()
+    assert len(messages) == 2 * len(unsummarized)
+    assert messages[-2]['content'] == '设计问题9'
+    assert agent.get_memory_context().startswith("对话摘要:")
+    assert state['summary'] in agent.build_request_segments('再设计一个游戏')['system']
+    print(f"   前{state['summarized_until']}条记录已并入摘要")
+    
+    print("✅ 记忆滚动摘要功能正常!")
+    return True
+
+def test_memory_persistence():
+    """测试会话记忆持久化"""
+    print("\n💽 测试会话记忆持久化...")
+    
+    import sqlite3
+    import threading
+    from agents.game_agent import GameAgent
+    from agents.memory_backend import SQLiteMemoryBackend
+    from agents.memory_compaction import MemoryCompactor
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "memory.db")
+        backend = SQLiteMemoryBackend(db_path, flush_interval=60, batch_size=1000)
+        GameAgent(session_id='bob', memory_backend=backend).add_to_memory(
+            {'user_input': '你好', 'assistant_response': '你好呀'})
+        agent = GameAgent(session_id='alice', memory_backend=backend)
+        for index in range(120):
+            agent.add_to_memory({'user_input': f'问题{index}', 'assistant_response': f'回答{index}',
+                                 'context': {'round': index}})
+        
+        # 写入先在队列里攒批，关闭时一次性提交
+        count_sql = "SELECT COUNT(*) FROM memories WHERE session_id = 'alice'"
+        assert sqlite3.connect(db_path).execute(count_sql).fetchone()[0] == 0
+        agent.memory_compactor = MemoryCompactor(agent.memory, None)
+        agent.memory_compactor.summary, agent.memory_compactor.summarized_until = '旧摘要', 115
+        backend.save_summary('alice', '旧摘要', 115)
+        backend.close()
+        assert sqlite3.connect(db_path).execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        
+        # 模拟重启：新进程只加载最近的窗口
+        backend = SQLiteMemoryBackend(db_path, flush_interval=60)
+        restored = GameAgent(session_id='alice', memory_backend=backend)
+        assert len(restored.memory) == 100 and restored.memory_count == 120
+        assert restored.memory.recent(1)[0].context == {'round': 119}
+        assert restored.memory.get_context() == agent.memory.get_context()
+        assert GameAgent(session_id='bob', memory_backend=backend).memory_count == 1
+        
+        restored.memory_compactor = MemoryCompactor(restored.memory, None)
+        assert restored.memory_compactor.get_state() == {'summary': '旧摘要', 'summarized_until': 115}
+        assert len(restored.get_memory_messages()) == 10
+        
+        restored.add_to_memory({'user_input': '问题120', 'assistant_response': '回答120'})
+        restored.memory.clear()
+        backend.close()
+        assert GameAgent(session_id='alice', memory_backend=SQLiteMemoryBackend(db_path)).memory_count == 0
+        
+        # 同一会话的两个写入方各自追加，记录都保留而不是按相同序号互相覆盖
+        backend = SQLiteMemoryBackend(db_path, flush_interval=60, batch_size=1000)
+        first = GameAgent(session_id='carol', memory_backend=backend)
+        second = GameAgent(session_id='carol', memory_backend=backend)
+        for index in range(3):
+            first.add_to_memory({'user_input': f'甲{index}', 'assistant_response': '好'})
+            second.add_to_memory({'user_input': f'乙{index}', 'assistant_response': '好'})
+        backend.flush()
+        assert backend.load_recent('carol', 10)[1] == 6
+        
+        # 刷新取出队列后暂停：另一个线程后入队的批次不能抢先提交，最后保存的摘要不会被覆盖
+        class PausingLock:
+            def __init__(self):
+                self._lock = threading.Lock()
+            def __enter__(self):
+                self._lock.acquire()
+            def __exit__(self, *exc_info):
+                self._lock.release()
+                if threading.current_thread().name == 'slow_flush':
+                    time.sleep(0.2)
+        backend._pending_lock = PausingLock()
+        backend.save_summary('carol', '旧摘要', 1)
+        slow_flush = threading.Thread(target=backend.flush, name='slow_flush')
+        slow_flush.start()
+        time.sleep(0.05)
+        backend.save_summary('carol', '新摘要', 2)
+        backend.flush()
+        slow_flush.join()
+        assert backend.load_summary('carol')['summarized_until'] == 2
+        backend.close()
+    
+    print("✅ 会话记忆持久化功能正常!")
+    return True
+
+def test_memory_retrieval():
+    """测试相关性检索"""
+    print("\n🔎 测试相关性检索...")
+    
+    from agents.game_agent import GameAgent
+    from agents.memory import MemoryStore
+    from agents.retrieval import BM25Index, MemoryRetriever, tokenize
+    
+    assert tokenize("加法游戏 for Kids") == ['加法', '法游', '游戏', 'for', 'kids']
+    index = BM25Index()
+    index.add('a', '设计一个加法游戏')
+    index.add('b', '设计一个英语单词游戏')
+    index.add('c', '汉字笔画练习')
+    assert {hit['id'] for hit in index.search('加法练习', top_k=2)} == {'a', 'c'}
+    index.remove('a')
+    assert 'a' not in index and index.search('加法') == []
+    
+    agent = GameAgent()
+    agent.memory = MemoryStore(capacity=20)
+    agent.memory_retriever = MemoryRetriever(agent.memory)
+    topics = ['恐龙主题的加法闯关', '英语字母配对', '汉字笔画描红', '太空主题的减法游戏']
+    for index in range(30):
+        topic = topics[index % len(topics)]
+        agent.add_to_memory({'user_input': f'第{index}轮: {topic}', 'assistant_response': f'{topic}的设计方案'})
+    # 增量索引与环形缓冲保持一致
+    assert len(agent.memory_retriever.memory_index) == 20
+    agent.add_design('星际数学冒险', '太空飞船答对减法题后加速前进', 'math')
+    
+    segments = agent.build_request_segments('再做一个恐龙加法游戏')
+    assert len(segments['history']) == 4
+    assert '相关的历史对话' in segments['prompt'] and segments['prompt'].endswith('再做一个恐龙加法游戏')
+    related = agent.memory_retriever.retrieve('恐龙加法', top_k=3, exclude_from=28)
+    assert [hit['id'] for hit in related['memories']] == [24, 20, 16]
+    assert agent.memory_retriever.retrieve('太空减法')['designs'][0]['payload']['title'] == '星际数学冒险'
+    
+    print("✅ 相关性检索功能正常!")
+    return True
+
+def test_game_pipeline():
+    """测试游戏生成流水线"""
+    print("\n🏭 测试游戏生成流水线...")
+    
+    import json
+    from agents.game_agent import GameAgent
+    from agents.game_pipeline import extract_game_spec, parse_questions
+    from agents.pipeline import TaskGraph
+    from utils.ai_providers import MockProvider
+    
+    spec = extract_game_spec('math', '给5-7岁孩子做一个中等难度的加法游戏')
+    assert spec == {'difficulty': '中等', 'age_group': '5-7岁', 'operation': '加法', 'title': '加法数字游戏'}
+    assert extract_game_spec('math', '加法和减法', {'title': '混合'})['operation'] == '混合运算'
+    assert parse_questions('```json\n[{"question": "1 + 1 = ?", "answer": 2, "options": [1, 2]}, {"question": "x"}]\n```') == \
+        [{'question': '1 + 1 = ?', 'answer': 2, 'options': [1, 2]}]
+    assert parse_questions('没有题目') is None
+    
+    # 失败的子任务只影响依赖它的子任务
+    graph = TaskGraph().add('a', lambda _: 1).add('b', lambda _: 1 / 0).add('c', lambda inputs: inputs['b'], deps=['b'])
+    run = graph.run()
+    assert run['results'] == {'a': 1} and set(run['errors']) == {'b', 'c'}
+    
+    class QuizProvider(MockProvider):
+        def _render_reply(self, prompt):
+            if 'JSON' in prompt:
+                return json.dumps([{'question': f'{i} + 1 = ?', 'answer': i + 1, 'options': [i, i + 1, i + 2, i + 3]}
+                                   for i in range(12)])
+            return super()._render_reply(prompt)
+    
+    class CodeGenerator:
+        def generate_math_game_code(self, game_data):
+            return f"GAME_DATA = {json.dumps(game_data, ensure_ascii=False)}"
+    
+    manager = make_manager({'mock': QuizProvider(latency_ms=200, latency_distribution='constant')})
+    agent = GameAgent(manager, code_generator=CodeGenerator())
+    result = agent.process_request('我想创建一个加法游戏')
+    assert result['success'] and result['game_type'] == 'math'
+    assert result['game_data']['question_source'] == 'ai' and len(result['game_data']['problems']) == 10
+    assert result['code'].startswith('GAME_DATA') and '模拟回复' in result['response']
+    # 三个AI子任务并发执行，总耗时接近一次请求
+    pipeline = result['pipeline']
+    assert pipeline['width'] == 3 and not pipeline['errors']
+    assert pipeline['elapsed'] < 0.45 < sum(pipeline['timings'].values())
+    print(f"   流水线耗时 {pipeline['elapsed']:.2f}秒，子任务合计 {sum(pipeline['timings'].values()):.2f}秒")
+    
+    # 聊天入口先分类：游戏类请求走流水线（带代码），结果写入记忆并记录为可检索的设计；通用请求才流式回复
+    agent = GameAgent(manager, code_generator=CodeGenerator())
+    result = agent.process_request_stream('我想创建一个加法游戏')
+    assert 'stream' not in result and result['game_type'] == 'math' and result['code'].startswith('GAME_DATA')
+    assert result['intents'][0]['intent'] == 'math'
+    assert agent.memory.recent(1)[0].assistant_response == result['response']
+    designs = agent.memory_retriever.retrieve('加法游戏')['designs']
+    assert designs and designs[0]['payload']['game_type'] == 'math'
+    result = agent.process_request_stream('设计一个拼图游戏')
+    assert ''.join(result['stream']) and result['intents'] == [] and agent.memory.total == 2
+    
+    # 模型没有返回题目时使用生成器的内置题库
+    manager.providers = {'mock': MockProvider(latency_ms=0, latency_jitter_ms=0)}
+    result = agent.process_request('英语字母闯关游戏')
+    assert result['game_data']['english_type'] == '字母学习' and 'question_source' not in result['game_data']
+    
+    # 离线时退回固定建议
+    assert 'game_data' not in GameAgent().process_request('我想创建一个加法游戏')
+    
+    print("✅ 游戏生成流水线功能正常!")
+    return True
+
+def test_agent_pool():
+    """测试会话智能体池"""
+    print("\n🏊 测试会话智能体池...")
+    
+    import threading
+    from agents.agent_pool import AgentPool
+    from agents.game_agent import GameAgent
+    from agents.game_pipeline import GamePipeline
+    from agents.memory_backend import SQLiteMemoryBackend
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = SQLiteMemoryBackend(os.path.join(tmp_dir, "memory.db"), flush_interval=60)
+        pool = AgentPool(lambda session_id: GameAgent(session_id=session_id, memory_backend=backend),
+                         max_agents=2, idle_timeout=60)
+        
+        alice = pool.get('alice')
+        alice.add_to_memory({'user_input': '加法游戏', 'assistant_response': '好的'})
+        assert pool.get('alice') is alice
+        pool.get('bob')
+        pool.get('alice')
+        pool.get('carol')  # 超出容量，换出最久未使用的 bob
+        assert 'bob' not in pool and 'alice' in pool and len(pool) == 2
+        
+        # 空闲超时的会话被换出，记忆已写入后端，再次访问时重新加载
+        pool.idle_timeout = 0.05
+        time.sleep(0.1)
+        assert pool.evict_idle() == 2 and len(pool) == 0
+        restored = pool.get('alice')
+        assert restored is not alice and restored.memory.recent(1)[0].user_input == '加法游戏'
+        assert pool.get_stats()['lru_evictions'] == 1 and pool.get_stats()['idle_evictions'] == 2
+        
+        # 持有租约的智能体（例如流式回复尚未读完）不会被空闲或超限换出
+        pool.idle_timeout = 60
+        with pool.lease('alice') as leased:
+            pool.get('bob')
+            pool.get('carol')  # 超出容量时跳过更久未使用但被租用的 alice，换出 bob
+            assert 'alice' in pool and 'bob' not in pool
+            pool.idle_timeout = 0
+            assert pool.evict_idle() == 1 and 'alice' in pool
+            assert pool.get_stats()['leased'] == 1
+        assert pool.evict_idle() == 1 and len(pool) == 0
+        assert leased.memory.recent(1)[0].user_input == '加法游戏'
+        backend.close()
+    
+    # 智能体在锁外构造：同一会话的并发调用方共用一次构造，其他会话不被阻塞
+    built, release_build = [], threading.Event()
+    def slow_factory(session_id):
+        built.append(session_id)
+        if session_id == 'slow':
+            release_build.wait(5)
+        return GameAgent(session_id=session_id)
+    pool = AgentPool(slow_factory, max_agents=4, idle_timeout=60)
+    agents = []
+    threads = [threading.Thread(target=lambda: agents.append(pool.get('slow'))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    assert pool.get('fast').session_id == 'fast' and not agents
+    release_build.set()
+    for thread in threads:
+        thread.join()
+    assert built.count('slow') == 1 and all(agent is agents[0] for agent in agents)
+    
+    # 生成器和意图分类器在所有会话间共享
+    first, second = GamePipeline(None), GamePipeline(None)
+    assert first.generators['english'] is second.generators['english']
+    assert isinstance(first.generators['english'].alphabet, tuple)
+    assert GameAgent().intent_classifier is GameAgent().intent_classifier
+    
+    print("✅ 会话智能体池功能正常!")
+    return True
+
+def test_log_pipeline():
+    """测试非阻塞日志管道"""
+    print("\n📝 测试非阻塞日志管道...")
+    
+    import gzip
+    import logging
+    import threading
+    from utils.logger import LogPipeline, BoundedQueueHandler, RotatingLogSink, LOG_FORMAT, setup_logger
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pipeline = LogPipeline(tmp_dir, queue_size=4, policy='drop', batch_size=100, flush_interval=60)
+        logger = logging.getLogger("test_log_pipeline")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(pipeline.handler)
+        
+        # 阻塞监听线程，模拟磁盘变慢：队列满后新记录被丢弃，写日志的线程不等待
+        release = threading.Event()
+        router = pipeline.listener.handlers[1]
+        original_emit = router.emit
+        router.emit = lambda record: (release.wait(5), original_emit(record))
+        console = pipeline.listener.handlers[0]
+        console.setLevel(logging.CRITICAL)
+        for i in range(20):
+            logger.info(f"消息{i}")
+        assert pipeline.get_stats()['dropped'] >= 20 - 4 - 1
+        release.set()
+        
+        # 缓冲中的记录在停止时一次写出
+        pipeline.stop()
+        logger.removeHandler(pipeline.handler)
+        with open(os.path.join(tmp_dir, "app.log"), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines and len(lines) + pipeline.get_stats()['dropped'] == 20
+        assert " - test_log_pipeline - INFO - 消息0" in lines[0]
+    
+    # 记录稀疏但持续到达、队列从不空闲超过 flush_interval 时，最早的记录不超过 max_delay 就被写出
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pipeline = LogPipeline(tmp_dir, batch_size=100, flush_interval=60, flush_max_delay=0.1)
+        pipeline.listener.handlers[0].setLevel(logging.CRITICAL)
+        record = logging.makeLogRecord({'name': 'trickle', 'msg': '稀疏消息', 'levelno': logging.INFO,
+                                        'levelname': 'INFO'})
+        for _ in range(5):
+            pipeline.handler.handle(record)
+            time.sleep(0.05)
+        time.sleep(0.1)
+        with open(os.path.join(tmp_dir, "app.log"), encoding='utf-8') as f:
+            assert f.read().count("稀疏消息") >= 4
+        pipeline.stop()
+    
+    # 共用的日志文件按大小轮转，归档在后台压缩，总大小不超过上限
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sink = RotatingLogSink(tmp_dir, max_bytes=200, max_total_bytes=1000, compress=True, batch_size=1)
+        sink.setFormatter(logging.Formatter(LOG_FORMAT))
+        for i in range(100):
+            sink.emit(logging.makeLogRecord({'name': f"logger{i % 3}", 'msg': f"消息{i}" * 5}))
+        sink.close()
+        archives = sink.archives()
+        assert sink.rotations > 10 and sink.deleted > 0
+        assert archives and all(path.endswith('.log.gz') for path in archives)
+        total = sum(os.path.getsize(path) for path in archives + [sink.baseFilename])
+        assert total <= 1000 + sink.max_bytes
+        with gzip.open(archives[-1], 'rt', encoding='utf-8') as f:
+            assert "logger" in f.read()
+    
+    # 记录器只挂一个共享的队列处理器
+    handlers = setup_logger("test_log_pipeline_shared").handlers
+    assert len(handlers) == 1 and isinstance(handlers[0], BoundedQueueHandler)
+    assert setup_logger("game_agent").handlers[0] is handlers[0]
+    
+    print("✅ 非阻塞日志管道功能正常!")
+    return True
+
+def test_structured_logging():
+    """测试结构化日志与采样"""
+    print("\n🧾 测试结构化日志与采样...")
+    
+    import json
+    import logging
+    import threading
+    from utils.logger import JsonFormatter, LogEvent, LogPipeline, get_log_pipeline, log_event, parse_sample_rates
+    
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = []
+        
+        def emit(self, record):
+            self.records.append(record)
+    
+    assert parse_sample_rates("cache_hit=0.01, ai_request=2,bad") == {'cache_hit': 0.01, 'ai_request': 1.0}
+    
+    handler = ListHandler()
+    logger = logging.getLogger("test_structured_logging")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    sampler = get_log_pipeline().sampler
+    original_rates = sampler.rates
+    sampler.rates = {'cache_hit': 0.0}
+    try:
+        # 被采样丢弃的事件不会计算惰性字段
+        calls = []
+        for _ in range(5):
+            log_event(logger, 'cache_hit', provider='mock', size=lambda: calls.append(1) or 42)
+        assert not handler.records and not calls
+        assert sampler.sampled_out['cache_hit'] >= 5
+        
+        # 告警级别总是记录；未配置采样率的事件全部记录
+        log_event(logger, 'cache_hit', logging.WARNING, provider='mock')
+        log_event(logger, 'ai_request', provider='mock', latency=0.25, size=lambda: calls.append(1) or 42)
+        log_event(logger, 'ai_request', logging.DEBUG, provider='mock')
+        assert len(handler.records) == 2 and not calls
+    finally:
+        sampler.rates = original_rates
+        logger.removeHandler(handler)
+    
+    # 惰性字段在格式化时只求值一次，JSON和文本格式共用结果
+    record = handler.records[1]
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['event'] == 'ai_request' and entry['logger'] == 'test_structured_logging'
+    assert entry['provider'] == 'mock' and entry['size'] == 42 and entry['level'] == 'INFO'
+    assert record.getMessage() == "ai_request provider=mock latency=0.25 size=42"
+    assert len(calls) == 1
+    
+    # 普通日志和无法序列化的字段
+    plain = logging.makeLogRecord({'name': 'game_agent', 'msg': '游戏%s已生成', 'args': ('A',)})
+    assert json.loads(JsonFormatter().format(plain))['msg'] == '游戏A已生成'
+    odd = logging.makeLogRecord({'name': 'x', 'msg': LogEvent('odd', {'value': {1, 2}, 'bad': lambda: 1 / 0}, 0.5)})
+    entry = json.loads(JsonFormatter().format(odd))
+    assert entry['sample_rate'] == 0.5 and entry['bad'].startswith('<ZeroDivisionError')
+    
+    # 与保留键同名的字段改名，不覆盖公共字段
+    clash = logging.makeLogRecord({'name': 'x', 'levelname': 'INFO',
+                                   'msg': LogEvent('clash', {'ts': 'fake', 'logger': 'y', 'msg': 'm'})})
+    entry = json.loads(JsonFormatter().format(clash))
+    assert entry['logger'] == 'x' and entry['ts'] != 'fake' and entry['event'] == 'clash'
+    assert (entry['field_ts'], entry['field_logger'], entry['field_msg']) == ('fake', 'y', 'm')
+    
+    # 文本模式不采样；并发采样丢弃的计数不丢失
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        text_pipeline = LogPipeline(tmp_dir, sample_rates={'cache_hit': 0.0})
+        json_pipeline = LogPipeline(tmp_dir, structured=True, sample_rates={'cache_hit': 0.0})
+        assert text_pipeline.sampler.rate('cache_hit', logging.INFO) == 1.0
+        assert json_pipeline.sampler.rate('cache_hit', logging.INFO) == 0.0
+        threads = [threading.Thread(target=lambda: [json_pipeline.sampler.sample('cache_hit', 0.0)
+                                                    for _ in range(1000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert json_pipeline.get_stats()['sampled_out'] == {'cache_hit': 8000}
+        text_pipeline.stop()
+        json_pipeline.stop()
+    
+    print("✅ 结构化日志与采样功能正常!")
+    return True
+
 def main():
     """主测试函数"""
     print("🤖 AI功能测试")
@@ -69,6 +1230,30 @@ def main():
     tests = [
         ("AI提供商", test_ai_providers),
         ("游戏智能体", test_game_agent),
+        ("并发请求", test_concurrent_gather),
+        ("流式响应", test_streaming_response),
+        ("响应缓存", test_response_cache),
+        ("故障切换与熔断", test_failover_and_circuit_breaker),
+        ("自适应路由", test_adaptive_routing),
+        ("对冲请求", test_hedged_request),
+        ("相同请求合并", test_request_coalescing),
+        ("限流排队", test_rate_limiter),
+        ("模拟提供商", test_mock_provider),
+        ("客户端注册表", test_client_registry),
+        ("提示词前缀缓存", test_prompt_prefix_caching),
+        ("批量生成", test_send_batch),
+        ("截止时间与取消", test_request_deadline),
+        ("请求指标", test_metrics),
+        ("Token预算", test_token_budget),
+        ("意图分类", test_intent_classifier),
+        ("环形缓冲记忆", test_memory_store),
+        ("记忆滚动摘要", test_memory_compaction),
+        ("会话记忆持久化", test_memory_persistence),
+        ("相关性检索", test_memory_retrieval),
+        ("游戏生成流水线", test_game_pipeline),
+        ("会话智能体池", test_agent_pool),
+        ("非阻塞日志", test_log_pipeline),
+        ("结构化日志", test_structured_logging),
     ]
     
     results = []
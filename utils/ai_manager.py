@@ -1,7 +1,21 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from config.settings import Config
-from utils.ai_providers import OpenAIProvider, AnthropicProvider, QwenProvider
-from utils.logger import setup_logger
+from utils.ai_providers import OpenAIProvider, AnthropicProvider, QwenProvider, MockProvider
+from utils.client_registry import get_client_registry
+from utils.response_cache import ResponseCache
+from utils.resilience import CircuitBreaker, RetryPolicy
+from utils.provider_scorer import ProviderScorer
+from utils.hedging import HedgePolicy
+from utils.single_flight import SingleFlight
+from utils.rate_limiter import RateLimiterRegistry
+from utils.token_budget import TokenBudget, get_token_estimator
+from utils.batching import pack_prompts, build_packed_prompt, split_packed_response, split_usage
+from utils.deadline import Deadline, is_deadline_result
+from utils.metrics import get_metrics_registry
+from utils.logger import setup_logger, log_event
 
 class AIProviderManager:
     """AI提供商管理器"""
@@ -9,7 +23,40 @@ class AIProviderManager:
     def __init__(self):
         self.logger = setup_logger("ai_provider_manager")
         self.providers = {}
+        self.cache = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retry_policy = RetryPolicy(
+            max_retries=Config.AI_MAX_RETRIES,
+            base_delay=Config.AI_RETRY_BASE_DELAY,
+            max_delay=Config.AI_RETRY_MAX_DELAY
+        )
+        self.scorer = ProviderScorer(policy=Config.AI_ROUTING_POLICY, alpha=Config.AI_SCORER_ALPHA)
+        self.hedge_policy = HedgePolicy(
+            percentile=Config.AI_HEDGE_PERCENTILE,
+            min_delay=Config.AI_HEDGE_MIN_DELAY,
+            max_delay=Config.AI_HEDGE_MAX_DELAY,
+            default_delay=Config.AI_HEDGE_DEFAULT_DELAY
+        )
+        self._hedge_executor = None
+        self.metrics = get_metrics_registry()
+        self.token_budget = TokenBudget(
+            get_token_estimator(),
+            max_input_tokens=Config.AI_MAX_INPUT_TOKENS,
+            default_max_tokens=Config.AI_DEFAULT_MAX_TOKENS,
+            min_output_tokens=Config.AI_MIN_OUTPUT_TOKENS
+        )
+        self.single_flight = SingleFlight() if Config.AI_COALESCE_ENABLED else None
+        self.rate_limiters = RateLimiterRegistry(
+            limits=Config.AI_RATE_LIMITS,
+            default_rpm=Config.AI_RATE_LIMIT_RPM,
+            default_tpm=Config.AI_RATE_LIMIT_TPM
+        )
         self._initialize_providers()
+        self._initialize_cache()
+        
+        # 后台预热SDK客户端和连接，避免首个请求承担冷启动开销
+        if Config.AI_PREWARM_CLIENTS:
+            get_client_registry().warm_up(list(self.providers))
     
     def _initialize_providers(self):
         """初始化AI提供商"""
@@ -30,13 +77,278 @@ class AIProviderManager:
         if Config.QWEN_API_KEY:
             self.providers['qwen'] = QwenProvider(Config.QWEN_API_KEY)
             self.logger.info("Qwen提供商已初始化")
+        
+        # 初始化模拟提供商
+        if Config.AI_MOCK_ENABLED:
+            self.providers['mock'] = MockProvider(
+                latency_ms=Config.AI_MOCK_LATENCY_MS,
+                latency_jitter_ms=Config.AI_MOCK_LATENCY_JITTER_MS,
+                latency_distribution=Config.AI_MOCK_LATENCY_DISTRIBUTION,
+                error_rate=Config.AI_MOCK_ERROR_RATE
+            )
+            self.logger.info("模拟提供商已初始化")
+    
+    def _initialize_cache(self):
+        """初始化响应缓存"""
+        if Config.AI_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                db_path=Config.AI_CACHE_DB_PATH,
+                memory_size=Config.AI_CACHE_MEMORY_SIZE,
+                max_entries=Config.AI_CACHE_MAX_ENTRIES,
+                ttl=Config.AI_CACHE_TTL
+            )
+            self.logger.info("AI响应缓存已启用")
+    
+    def _apply_default_deadline(self, kwargs: Dict[str, Any]):
+        """调用方未传入deadline时使用默认的请求总超时（AI_REQUEST_TIMEOUT）"""
+        if kwargs.get('deadline') is None and Config.AI_REQUEST_TIMEOUT > 0:
+            kwargs['deadline'] = Deadline(Config.AI_REQUEST_TIMEOUT)
+    
+    def _get_request_keys(self, provider_name: str, prompt: str,
+                          kwargs: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """获取 (请求键, 缓存键)；流式请求无法合并和缓存，返回 (None, None)"""
+        use_cache = kwargs.pop('use_cache', True)
+        if kwargs.get('stream'):
+            return None, None
+        request_key = ResponseCache.make_key(provider_name, prompt, **kwargs)
+        cache_key = request_key if self.cache is not None and use_cache else None
+        return request_key, cache_key
+    
+    def _get_breaker(self, provider_name: str) -> CircuitBreaker:
+        """获取提供商的熔断器"""
+        breaker = self.breakers.get(provider_name)
+        if breaker is None:
+            breaker = self.breakers.setdefault(provider_name, CircuitBreaker(
+                provider_name,
+                failure_threshold=Config.AI_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=Config.AI_CIRCUIT_RECOVERY_TIMEOUT
+            ))
+        return breaker
     
     def get_available_providers(self) -> List[str]:
         """获取可用的AI提供商列表"""
         return [name for name, provider in self.providers.items() if provider.is_available()]
     
+    def get_healthy_providers(self) -> List[str]:
+        """获取可用且未熔断的AI提供商列表"""
+        return [name for name in self.get_available_providers() if self._get_breaker(name).is_healthy()]
+    
+    def _circuit_open_result(self, provider_name: str) -> Dict[str, Any]:
+        return {'success': False, 'error': f'提供商已熔断: {provider_name}', 'retryable': True, 'circuit_open': True}
+    
+    @staticmethod
+    def _error_class(result: Dict[str, Any]) -> str:
+        """失败结果的错误类别，用作指标标签"""
+        if result.get('error_type'):
+            return result['error_type']
+        if result.get('circuit_open'):
+            return 'circuit_open'
+        if result.get('rate_limited'):
+            return 'rate_limited'
+        return result.get('error_class') or ('transient' if result.get('retryable') else 'error')
+    
+    def _record_usage(self, provider_name: str, model: str, usage: Optional[Dict[str, Any]]):
+        """记录token用量指标"""
+        if not usage:
+            return
+        tokens = {
+            'input': usage.get('input_tokens', usage.get('prompt_tokens')),
+            'output': usage.get('output_tokens', usage.get('completion_tokens')),
+            'cached': usage.get('cached_tokens')
+        }
+        for kind, count in tokens.items():
+            if count:
+                self.metrics.inc('ai_tokens_total', count, provider=provider_name, model=model, kind=kind)
+    
+    def _record_metrics(self, provider_name: str, result: Dict[str, Any], latency: float,
+                        kwargs: Dict[str, Any]):
+        """记录一次上游调用的请求数、延迟、错误类别和token用量"""
+        model = kwargs.get('model') or 'default'
+        status = 'success' if result.get('success') else 'error'
+        self.metrics.inc('ai_requests_total', provider=provider_name, model=model, status=status)
+        self.metrics.observe('ai_request_latency_seconds', latency, provider=provider_name, model=model)
+        if not result.get('success'):
+            self.metrics.inc('ai_errors_total', provider=provider_name, model=model,
+                             error_class=self._error_class(result))
+        elif 'stream' in result:
+            # 流式请求的用量在流结束时才知道
+            def _on_stream_done(stream):
+                self._record_usage(provider_name, model, stream.usage)
+                if stream.error:
+                    self.metrics.inc('ai_errors_total', provider=provider_name, model=model,
+                                     error_class=stream.error_type or 'stream_error')
+            result['stream'].add_done_callback(_on_stream_done)
+        else:
+            self._record_usage(provider_name, model, result.get('usage'))
+    
+    def _record_trace(self, provider_name: str, kwargs: Dict[str, Any], result: Dict[str, Any],
+                      start_time: float) -> Dict[str, Any]:
+        """记录请求摘要（管理页面展示）和成功请求的结构化日志，原样返回result"""
+        latency = time.monotonic() - start_time
+        if result.get('success'):
+            # 失败已有告警日志；成功和缓存命中是高频事件，按采样率记录
+            log_event(
+                self.logger, 'cache_hit' if result.get('cached') else 'ai_request',
+                provider=provider_name, model=kwargs.get('model') or 'default', latency=round(latency, 4),
+                attempts=result.get('attempts', 0), coalesced=bool(result.get('coalesced')),
+                response_chars=lambda response=result.get('response'): len(response or '')
+            )
+        self.metrics.record_trace({
+            'provider': provider_name,
+            'model': kwargs.get('model') or 'default',
+            'success': bool(result.get('success')),
+            'latency': latency,
+            'attempts': result.get('attempts', 0),
+            'cached': bool(result.get('cached')),
+            'coalesced': bool(result.get('coalesced')),
+            'stream': 'stream' in result,
+            'error': result.get('error')
+        })
+        return result
+    
+    def _record_outcome(self, provider_name: str, breaker: CircuitBreaker, result: Dict[str, Any],
+                        latency: float, kwargs: Dict[str, Any]):
+        """根据请求结果更新熔断器、评分和指标
+
+        只有瞬时错误计入熔断失败；不可重试的错误、超时和取消不影响熔断状态，
+        但要归还half_open的探测名额。
+        """
+        if result.get('success'):
+            breaker.record_success()
+        elif result.get('retryable'):
+            breaker.record_failure()
+        else:
+            breaker.release_probe()
+        self._record_metrics(provider_name, result, latency, kwargs)
+        # 流式请求只统计到建立连接，不计入延迟评分
+        if not kwargs.get('stream'):
+            self.scorer.record(provider_name, kwargs.get('model'), latency,
+                               bool(result.get('success')), result.get('usage'))
+            if result.get('success'):
+                self.hedge_policy.record(provider_name, latency)
+    
+    def _acquire_rate_limit(self, provider_name: str, prompt: str, kwargs: Dict[str, Any]):
+        """按优先级排队获取限流配额，返回 (限流器, 凭证)
+
+        未指定模型（或为 'default'）时按提供商的默认模型取限流器，显式指定默认模型的请求
+        与之共用同一份配额。
+        """
+        model = kwargs.get('model')
+        if not model or model == 'default':
+            model = self.providers[provider_name].default_model
+        limiter = self.rate_limiters.get(provider_name, model)
+        input_tokens = kwargs.get('estimated_input_tokens')
+        if input_tokens is None:
+            input_tokens = self.token_budget.estimator.count_request(prompt, kwargs, provider_name)
+        deadline = kwargs.get('deadline')
+        ticket = limiter.acquire(
+            input_tokens + kwargs.get('max_tokens', Config.AI_DEFAULT_MAX_TOKENS),
+            priority=kwargs.get('priority', 'interactive'),
+            timeout=deadline.timeout_for(Config.AI_RATE_LIMIT_MAX_WAIT) if deadline else Config.AI_RATE_LIMIT_MAX_WAIT
+        )
+        self.metrics.observe('ai_rate_limit_wait_seconds', ticket.wait_time, provider=provider_name,
+                             priority=kwargs.get('priority', 'interactive'))
+        if ticket.wait_time > 0.1:
+            self.logger.info(f"{provider_name}限流排队{ticket.wait_time:.2f}秒")
+        return limiter, ticket
+    
+    def _rate_limited_result(self, provider_name: str) -> Dict[str, Any]:
+        return {'success': False, 'error': f'提供商限流排队超时: {provider_name}', 'retryable': True, 'rate_limited': True}
+    
+    def _call_with_retry(self, provider_name: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        """在熔断器保护下调用提供商，瞬时错误按指数退避重试
+
+        给定deadline时，退避等待可被取消，截止后不再重试，返回超时/取消结果。
+        """
+        provider = self.providers[provider_name]
+        breaker = self._get_breaker(provider_name)
+        deadline = kwargs.get('deadline')
+        result = self._circuit_open_result(provider_name)
+        
+        for attempt in range(self.retry_policy.max_attempts):
+            if attempt:
+                delay = self.retry_policy.get_delay(attempt)
+                self.logger.warning(f"{provider_name}请求失败，{delay:.2f}秒后第{attempt}次重试: {result.get('error')}")
+                self.metrics.inc('ai_retries_total', provider=provider_name, model=kwargs.get('model') or 'default')
+                if deadline is None:
+                    time.sleep(delay)
+                else:
+                    deadline.sleep(delay)
+            if deadline is not None and deadline.done:
+                return {**deadline.result(), 'attempts': attempt}
+            # 先检查熔断器，熔断时不占用限流配额
+            if not breaker.allow_request():
+                return self._circuit_open_result(provider_name)
+            limiter, ticket = self._acquire_rate_limit(provider_name, prompt, kwargs)
+            if not ticket.acquired:
+                breaker.release_probe()
+                return deadline.result() if deadline is not None and deadline.done else self._rate_limited_result(provider_name)
+            
+            start_time = time.monotonic()
+            result = provider.send_request(prompt, **kwargs)
+            if not result.get('success') and deadline is not None and deadline.done:
+                # SDK超时由截止时间触发，不计入熔断失败
+                result = deadline.result()
+            self._record_outcome(provider_name, breaker, result, time.monotonic() - start_time, kwargs)
+            limiter.reconcile(ticket, result.get('usage'))
+            if result.get('success') or not result.get('retryable'):
+                break
+        
+        result['attempts'] = attempt + 1
+        return result
+    
+    async def _call_with_retry_async(self, provider_name: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        """_call_with_retry 的异步版本，截止时间到达或取消标记触发时直接取消进行中的调用"""
+        provider = self.providers[provider_name]
+        breaker = self._get_breaker(provider_name)
+        deadline = kwargs.get('deadline')
+        result = self._circuit_open_result(provider_name)
+        
+        for attempt in range(self.retry_policy.max_attempts):
+            if attempt:
+                delay = self.retry_policy.get_delay(attempt)
+                self.logger.warning(f"{provider_name}请求失败，{delay:.2f}秒后第{attempt}次重试: {result.get('error')}")
+                self.metrics.inc('ai_retries_total', provider=provider_name, model=kwargs.get('model') or 'default')
+                if deadline is not None:
+                    await deadline.sleep_async(delay)
+                else:
+                    await asyncio.sleep(delay)
+            if deadline is not None and deadline.done:
+                return {**deadline.result(), 'attempts': attempt}
+            if not breaker.allow_request():
+                return self._circuit_open_result(provider_name)
+            limiter, ticket = await asyncio.to_thread(self._acquire_rate_limit, provider_name, prompt, kwargs)
+            if not ticket.acquired:
+                breaker.release_probe()
+                return deadline.result() if deadline is not None and deadline.done else self._rate_limited_result(provider_name)
+            
+            start_time = time.monotonic()
+            try:
+                if deadline is not None:
+                    result = await deadline.wait_async(provider.send_request_async(prompt, **kwargs))
+                else:
+                    result = await provider.send_request_async(prompt, **kwargs)
+            except asyncio.TimeoutError:
+                result = deadline.result()
+            except asyncio.CancelledError:
+                # 外层任务被取消（例如流水线整体超时），探测名额同样要归还
+                breaker.release_probe()
+                raise
+            if not result.get('success') and deadline is not None and deadline.done:
+                result = deadline.result()
+            self._record_outcome(provider_name, breaker, result, time.monotonic() - start_time, kwargs)
+            limiter.reconcile(ticket, result.get('usage'))
+            if result.get('success') or not result.get('retryable'):
+                break
+        
+        result['attempts'] = attempt + 1
+        return result
+    
     def send_request(self, provider_name: str, prompt: str, **kwargs) -> Dict[str, Any]:
-        """发送请求到指定的AI提供商"""
+        """发送请求到指定的AI提供商
+
+        stream=True 时结果中的 'stream' 为 StreamResponse，可直接交给 st.write_stream。
+        """
         if provider_name not in self.providers:
             return {'success': False, 'error': f'未找到提供商: {provider_name}'}
         
@@ -44,31 +356,425 @@ class AIProviderManager:
         if not provider.is_available():
             return {'success': False, 'error': f'提供商不可用: {provider_name}'}
         
-        return provider.send_request(prompt, **kwargs)
+        start_time = time.monotonic()
+        self._apply_default_deadline(kwargs)
+        # 按预算裁剪历史、确定max_tokens，过大的请求不发出
+        rejected = self.token_budget.apply(provider_name, prompt, kwargs)
+        if rejected is not None:
+            self.logger.warning(f"{provider_name}请求被拒绝: {rejected['error']}")
+            return self._record_trace(provider_name, kwargs, rejected, start_time)
+        request_key, cache_key = self._get_request_keys(provider_name, prompt, kwargs)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            self.metrics.inc('ai_cache_requests_total', provider=provider_name,
+                             result='miss' if cached is None else 'hit')
+            if cached is not None:
+                return self._record_trace(provider_name, kwargs, {**cached, 'cached': True}, start_time)
+        
+        if request_key and self.single_flight:
+            # 相同请求并发时只发出一次上游调用，结果复制给每个调用方
+            deadline = kwargs.get('deadline')
+            try:
+                result, shared = self.single_flight.do(
+                    request_key, lambda: self._call_with_retry(provider_name, prompt, **kwargs),
+                    timeout=deadline.timeout_for() if deadline is not None else None
+                )
+            except TimeoutError:
+                if deadline is None:
+                    raise
+                return self._record_trace(provider_name, kwargs, deadline.result(), start_time)
+            if shared and is_deadline_result(result) and deadline is not None and not deadline.done:
+                # 发起方的截止时间比自己短，自己还有时间就单独再请求一次
+                result, shared = self._call_with_retry(provider_name, prompt, **kwargs), False
+            if shared:
+                self.metrics.inc('ai_coalesced_requests_total', provider=provider_name)
+            result = {**result, 'coalesced': True} if shared else result
+        else:
+            result = self._call_with_retry(provider_name, prompt, **kwargs)
+        
+        if cache_key and result.get('success') and not result.get('coalesced'):
+            self.cache.set(cache_key, result)
+        return self._record_trace(provider_name, kwargs, result, start_time)
     
-    def send_request_to_best_provider(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """发送请求到最佳可用的AI提供商"""
-        available_providers = self.get_available_providers()
+    async def send_request_async(self, provider_name: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        """异步发送请求到指定的AI提供商"""
+        if provider_name not in self.providers:
+            return {'success': False, 'error': f'未找到提供商: {provider_name}'}
         
-        if not available_providers:
-            return {'success': False, 'error': '没有可用的AI提供商'}
+        provider = self.providers[provider_name]
+        if not provider.is_available():
+            return {'success': False, 'error': f'提供商不可用: {provider_name}'}
+        
+        start_time = time.monotonic()
+        self._apply_default_deadline(kwargs)
+        # 按预算裁剪历史、确定max_tokens，过大的请求不发出
+        rejected = self.token_budget.apply(provider_name, prompt, kwargs)
+        if rejected is not None:
+            self.logger.warning(f"{provider_name}请求被拒绝: {rejected['error']}")
+            return self._record_trace(provider_name, kwargs, rejected, start_time)
+        request_key, cache_key = self._get_request_keys(provider_name, prompt, kwargs)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            self.metrics.inc('ai_cache_requests_total', provider=provider_name,
+                             result='miss' if cached is None else 'hit')
+            if cached is not None:
+                return self._record_trace(provider_name, kwargs, {**cached, 'cached': True}, start_time)
+        
+        if request_key and self.single_flight:
+            deadline = kwargs.get('deadline')
+            try:
+                result, shared = await self.single_flight.do_async(
+                    request_key, lambda: self._call_with_retry_async(provider_name, prompt, **kwargs),
+                    timeout=deadline.timeout_for() if deadline is not None else None
+                )
+            except asyncio.TimeoutError:
+                if deadline is None:
+                    raise
+                return self._record_trace(provider_name, kwargs, deadline.result(), start_time)
+            if shared and is_deadline_result(result) and deadline is not None and not deadline.done:
+                result, shared = await self._call_with_retry_async(provider_name, prompt, **kwargs), False
+            if shared:
+                self.metrics.inc('ai_coalesced_requests_total', provider=provider_name)
+            result = {**result, 'coalesced': True} if shared else result
+        else:
+            result = await self._call_with_retry_async(provider_name, prompt, **kwargs)
         
-        # 按优先级选择提供商
+        if cache_key and result.get('success') and not result.get('coalesced'):
+            self.cache.set(cache_key, result)
+        return self._record_trace(provider_name, kwargs, result, start_time)
+    
+    def _get_provider_order(self, model: Optional[str] = None, policy: Optional[str] = None) -> List[str]:
+        """按路由策略排列可用且未熔断的AI提供商"""
+        healthy_providers = self.get_healthy_providers()
+        
+        # 静态优先级只用于还没有统计数据的提供商
         priority_order = ['openai', 'anthropic', 'qwen']
+        ordered = [name for name in priority_order if name in healthy_providers]
+        ordered += [name for name in healthy_providers if name not in ordered]
+        return self.scorer.rank(ordered, model, policy)
+    
+    def _select_best_provider(self) -> Optional[str]:
+        """选择最佳可用的AI提供商"""
+        provider_order = self._get_provider_order()
+        return provider_order[0] if provider_order else None
+    
+    def set_routing_policy(self, policy: str):
+        """设置路由策略: fastest / cheapest / balanced"""
+        if policy not in ProviderScorer.POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}")
+        self.scorer.policy = policy
+        self.logger.info(f"路由策略已切换为: {policy}")
+    
+    def get_provider_scores(self) -> Dict[str, Dict[str, Any]]:
+        """获取各提供商/模型的延迟、错误率、吞吐和成本快照"""
+        return self.scorer.get_snapshot()
+    
+    def get_latency_percentiles(self) -> Dict[str, Dict[str, Any]]:
+        """获取各提供商的延迟分位数（对冲延迟依据）"""
+        return self.hedge_policy.get_snapshot()
+    
+    def send_request_to_best_provider(self, prompt: str, routing_policy: Optional[str] = None,
+                                      hedge: Optional[bool] = None, **kwargs) -> Dict[str, Any]:
+        """发送请求到最佳可用的AI提供商，失败时自动切换到下一个健康的提供商
+
+        hedge=True（或配置 AI_HEDGING_ENABLED）时使用对冲请求降低尾延迟。
+        deadline 覆盖整个故障切换过程，超时或被取消后不再切换；单次调用的SDK超时
+        （kwargs中的timeout）只算该提供商失败，截止时间还有剩余时继续切换。
+        """
+        self._apply_default_deadline(kwargs)
+        deadline = kwargs.get('deadline')
+        provider_order = self._get_provider_order(kwargs.get('model'), routing_policy)
         
-        for provider_name in priority_order:
-            if provider_name in available_providers:
-                self.logger.info(f"使用AI提供商: {provider_name}")
-                return self.send_request(provider_name, prompt, **kwargs)
+        if not provider_order:
+            return {'success': False, 'error': '没有可用的AI提供商'}
+        
+        if (Config.AI_HEDGING_ENABLED if hedge is None else hedge) and len(provider_order) > 1:
+            return self.send_request_hedged(prompt, provider_order, **kwargs)
         
-        # 如果优先级提供商都不可用，使用第一个可用的
-        fallback_provider = available_providers[0]
-        self.logger.info(f"使用备用AI提供商: {fallback_provider}")
-        return self.send_request(fallback_provider, prompt, **kwargs)
+        result = {}
+        for provider_name in provider_order:
+            self.logger.info(f"使用AI提供商: {provider_name}")
+            result = self.send_request(provider_name, prompt, **kwargs)
+            if result.get('success'):
+                result['provider'] = provider_name
+                return result
+            if deadline is not None and deadline.done:
+                self.logger.warning(f"{provider_name}请求未在截止时间内完成: {result.get('error')}")
+                return result
+            self.logger.warning(f"{provider_name}请求失败，切换提供商: {result.get('error')}")
+        return result
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        """对冲请求使用的线程池"""
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=Config.AI_MAX_CONCURRENCY * 2,
+                thread_name_prefix="ai_hedge"
+            )
+        return self._hedge_executor
+    
+    def _hedge_attempt(self, provider_name: str, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """对冲请求中的单次尝试；流式请求会预读首个token，以首token时间作为完成时间"""
+        start_time = time.monotonic()
+        result = self.send_request(provider_name, prompt, **kwargs)
+        if result.get('success') and 'stream' in result:
+            stream = result['stream']
+            if not stream.prime() and stream.error:
+                return {'success': False, 'error': stream.error, 'retryable': True}
+            self.hedge_policy.record(provider_name, time.monotonic() - start_time, 'ttft')
+        return result
+    
+    def _discard_hedge_result(self, future):
+        """关闭落败请求的流，释放连接"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if 'stream' in result:
+            result['stream'].close()
+    
+    def send_request_hedged(self, prompt: str, provider_order: Optional[List[str]] = None,
+                            **kwargs) -> Dict[str, Any]:
+        """对冲请求
+
+        先向首选提供商发送请求；若在自适应延迟（该提供商历史延迟的分位数）内仍未返回
+        （流式请求为未产出首个token），再向下一个提供商发送相同请求，取先成功者。
+        首选请求提前失败时立即切换。落败的流式请求会被关闭；非流式请求无法中断，
+        其结果会被丢弃。
+        """
+        self._apply_default_deadline(kwargs)
+        provider_order = provider_order or self._get_provider_order(kwargs.get('model'))
+        if not provider_order:
+            return {'success': False, 'error': '没有可用的AI提供商'}
+        
+        deadline = kwargs.get('deadline')
+        kind = 'ttft' if kwargs.get('stream') else 'total'
+        executor = self._get_hedge_executor()
+        remaining = list(provider_order)
+        futures = {}
+        result = {}
+        
+        def _launch():
+            provider_name = remaining.pop(0)
+            futures[executor.submit(self._hedge_attempt, provider_name, prompt, kwargs)] = provider_name
+            return provider_name
+        
+        primary = _launch()
+        delay = self.hedge_policy.get_delay(primary, kind)
+        pending = set(futures)
+        
+        while pending:
+            timeout = delay if remaining and len(futures) == 1 else None
+            if deadline is not None:
+                timeout = deadline.timeout_for(timeout)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            
+            if not done and deadline is not None and deadline.done:
+                # 截止时间已到：不再等待，进行中的请求会因SDK超时自行结束
+                for future in futures:
+                    if not future.cancel():
+                        future.add_done_callback(self._discard_hedge_result)
+                return deadline.result()
+            
+            if not done:
+                hedge_provider = _launch()
+                self.logger.info(f"{primary}在{delay:.2f}秒内未响应，发起对冲请求: {hedge_provider}")
+                pending = {future for future in futures if not future.done()}
+                continue
+            
+            for future in done:
+                result = future.result()
+                if result.get('success'):
+                    for other in futures:
+                        if other is not future and not other.cancel():
+                            other.add_done_callback(self._discard_hedge_result)
+                    result['provider'] = futures[future]
+                    result['hedged'] = len(futures) > 1
+                    return result
+                self.logger.warning(f"{futures[future]}请求失败: {result.get('error')}")
+            
+            # 已发出的请求都失败了，截止时间未到时立即切换到下一个提供商
+            if deadline is not None and deadline.done:
+                return deadline.result()
+            if not pending and remaining:
+                _launch()
+                pending = {future for future in futures if not future.done()}
+        
+        return result
+    
+    async def send_request_to_best_provider_async(self, prompt: str, routing_policy: Optional[str] = None,
+                                                  **kwargs) -> Dict[str, Any]:
+        """send_request_to_best_provider 的异步版本"""
+        self._apply_default_deadline(kwargs)
+        deadline = kwargs.get('deadline')
+        provider_order = self._get_provider_order(kwargs.get('model'), routing_policy)
+        
+        if not provider_order:
+            return {'success': False, 'error': '没有可用的AI提供商'}
+        
+        result = {}
+        for provider_name in provider_order:
+            result = await self.send_request_async(provider_name, prompt, **kwargs)
+            if result.get('success'):
+                result['provider'] = provider_name
+                return result
+            if deadline is not None and deadline.done:
+                return result
+            self.logger.warning(f"{provider_name}请求失败，切换提供商: {result.get('error')}")
+        return result
+    
+    async def gather_async(self, prompts: List[str], provider: Optional[str] = None,
+                           max_concurrency: Optional[int] = None, **kwargs) -> List[Dict[str, Any]]:
+        """并发发送多个请求，结果顺序与prompts一致
+
+        未指定provider时每个请求都走最佳提供商及其故障切换。
+        默认以 batch 优先级排队限流，交互请求会优先放行。
+        """
+        kwargs.setdefault('priority', 'batch')
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or Config.AI_MAX_CONCURRENCY))
+        
+        async def _run(prompt: str) -> Dict[str, Any]:
+            async with semaphore:
+                if provider:
+                    return await self.send_request_async(provider, prompt, **kwargs)
+                return await self.send_request_to_best_provider_async(prompt, **kwargs)
+        
+        self.logger.info(f"并发发送{len(prompts)}个请求到: {provider or '最佳提供商'}")
+        return await asyncio.gather(*[_run(prompt) for prompt in prompts])
+    
+    def gather(self, prompts: List[str], provider: Optional[str] = None,
+               max_concurrency: Optional[int] = None, **kwargs) -> List[Dict[str, Any]]:
+        """并发发送多个请求（同步入口，供Streamlit脚本线程和批处理任务使用）
+
+        在客户端注册表的长期事件循环上执行，复用已建立的异步客户端和连接。
+        """
+        return get_client_registry().run(self.gather_async(prompts, provider, max_concurrency, **kwargs))
+    
+    def _send_one(self, provider: Optional[str], prompt: str, **kwargs) -> Dict[str, Any]:
+        """发送单个请求，未指定provider时走最佳提供商；结果中带有实际使用的提供商"""
+        if provider:
+            return {**self.send_request(provider, prompt, **kwargs), 'provider': provider}
+        return self.send_request_to_best_provider(prompt, **kwargs)
+    
+    def _can_pack(self, provider: Optional[str]) -> bool:
+        """目标提供商（未指定时为全部可用提供商）是否都支持打包请求"""
+        names = [provider] if provider else self.get_available_providers()
+        return bool(names) and all(
+            name in self.providers and self.providers[name].supports_packing for name in names
+        )
+    
+    def _run_batch_group(self, provider: Optional[str], prompts: List[str],
+                         kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """执行一组请求；打包请求中未能解析出的条目逐条重新请求
+
+        打包请求的用量按提示词和回答长度分摊到解析出回答的各条目，用于按条目统计成本。
+        """
+        if len(prompts) == 1:
+            return [self._send_one(provider, prompts[0], **kwargs)]
+    
+        packed_kwargs = {**kwargs, 'max_tokens': kwargs.get('max_tokens', Config.AI_DEFAULT_MAX_TOKENS) * len(prompts)}
+        result = self._send_one(provider, build_packed_prompt(prompts), **packed_kwargs)
+        answers = split_packed_response(result.get('response', ''), len(prompts)) \
+            if result.get('success') else [None] * len(prompts)
+        usages = split_usage(
+            result.get('usage') or {},
+            [len(prompt) if answer is not None else 0 for prompt, answer in zip(prompts, answers)],
+            [len(answer) if answer is not None else 0 for answer in answers]
+        )
+    
+        results = []
+        for prompt, answer, usage in zip(prompts, answers, usages):
+            if answer is None:
+                results.append(self._send_one(provider, prompt, **kwargs))
+            else:
+                results.append({'success': True, 'response': answer, 'packed': True,
+                                'batch_size': len(prompts), 'provider': result.get('provider'),
+                                'usage': usage})
+        return results
+    
+    def send_batch(self, prompts: List[str], provider: Optional[str] = None,
+                   max_workers: Optional[int] = None, pack: bool = True,
+                   pack_max_items: Optional[int] = None, pack_max_chars: Optional[int] = None,
+                   **kwargs) -> List[Dict[str, Any]]:
+        """批量生成，结果顺序与prompts一致，每条结果单独标记成功或失败
+    
+        相同的提示词只请求一次；短提示词按 pack_max_items 条打包成一次请求
+        （提供商需支持打包），其余请求由有界线程池并发执行，以 batch 优先级排队限流。
+        """
+        kwargs.setdefault('priority', 'batch')
+        kwargs.pop('stream', None)
+        unique_prompts = list(dict.fromkeys(prompts))
+    
+        if pack and self._can_pack(provider):
+            groups = pack_prompts(
+                unique_prompts,
+                max_items=pack_max_items or Config.AI_BATCH_PACK_MAX_ITEMS,
+                max_chars=pack_max_chars or Config.AI_BATCH_PACK_MAX_CHARS
+            )
+        else:
+            groups = [[index] for index in range(len(unique_prompts))]
+        self.logger.info(
+            f"批量请求: {len(prompts)}个提示词，去重后{len(unique_prompts)}个，合并为{len(groups)}次调用"
+        )
+    
+        unique_results: List[Optional[Dict[str, Any]]] = [None] * len(unique_prompts)
+        workers = max(1, min(max_workers or Config.AI_BATCH_MAX_WORKERS, len(groups) or 1))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai_batch") as executor:
+            futures = {
+                executor.submit(self._run_batch_group, provider,
+                                [unique_prompts[index] for index in group], kwargs): group
+                for group in groups
+            }
+            for future, group in futures.items():
+                try:
+                    group_results = future.result()
+                except Exception as e:
+                    self.logger.error(f"批量请求出错: {str(e)}")
+                    group_results = [{'success': False, 'error': str(e)}] * len(group)
+                for index, result in zip(group, group_results):
+                    unique_results[index] = result
+    
+        # 重复的提示词共用第一次的结果，用量只计入第一次出现的位置
+        result_map = dict(zip(unique_prompts, unique_results))
+        results, seen = [], set()
+        for prompt in prompts:
+            result = dict(result_map[prompt])
+            if prompt in seen:
+                result.update({'usage': {}, 'duplicate': True})
+            seen.add(prompt)
+            results.append(result)
+        return results
+    
+    def get_rate_limit_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各提供商/模型的限流排队统计"""
+        return self.rate_limiters.get_stats()
+    
+    def get_metrics_snapshot(self) -> Dict[str, Any]:
+        """获取请求指标快照"""
+        return self.metrics.get_snapshot()
+    
+    def get_recent_requests(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取最近的请求记录"""
+        return self.metrics.get_recent_requests(limit)
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """获取请求合并统计"""
+        if self.single_flight is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.single_flight.get_stats()}
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取响应缓存统计"""
+        if self.cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.cache.get_stats()}
     
     def get_provider_status(self) -> Dict[str, bool]:
         """获取所有提供商的状态"""
         return {
             name: provider.is_available() 
             for name, provider in self.providers.items()
-        }
\ No newline at end of file
+        }
+    
+    def get_circuit_status(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有提供商的熔断器状态"""
+        return {name: self._get_breaker(name).get_status() for name in self.providers}
\ No newline at end of file
@@ -1,20 +1,244 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Callable, Union
+import asyncio
+import hashlib
 import json
+import random
+import threading
+import time
+from collections import OrderedDict
 from utils.logger import setup_logger
+from utils.client_registry import ClientRegistry, get_client_registry
+from utils.batching import PACKED_ITEM_MARKER, split_packed_prompt
+from utils.deadline import Deadline, cancelled_result
+
+class StreamResponse:
+    """流式响应
+
+    迭代得到文本增量；迭代结束后可通过 text / usage / get_result() 读取完整结果。
+    提供商的数据源可以产出 str（文本增量）或 dict（usage记录，会合并到 self.usage）。
+    给定deadline时，每收到一段数据都会检查是否超时或被取消，是则关闭底层连接并结束。
+    """
+    
+    def __init__(self, provider: str, source: Iterable[Union[str, Dict[str, Any]]],
+                 deadline: Optional[Deadline] = None):
+        self.provider = provider
+        self.usage: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.error_type: Optional[str] = None
+        self.deadline = deadline
+        self.finished = False
+        self._source = source
+        self._iterator: Optional[Iterator[str]] = None
+        self._primed: Optional[str] = None
+        self._parts: List[str] = []
+        self._callbacks: List[Callable[['StreamResponse'], None]] = []
+    
+    @property
+    def text(self) -> str:
+        """已接收的完整文本"""
+        return "".join(self._parts)
+    
+    def add_done_callback(self, callback: Callable[['StreamResponse'], None]):
+        """注册流结束后的回调"""
+        if self.finished:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+    
+    def prime(self) -> bool:
+        """预读第一个文本增量，返回是否在出错前收到了内容"""
+        if self._iterator is None:
+            self._iterator = self._iterate()
+            self._primed = next(self._iterator, None)
+        return self._primed is not None
+    
+    def close(self):
+        """提前关闭流并释放底层连接，未读完（包括从未读取）的流标记为已取消，回调照常执行"""
+        if not self.finished and self.error is None:
+            result = self.deadline.result() if self.deadline is not None and self.deadline.done \
+                else cancelled_result('流式响应已关闭')
+            self.error, self.error_type = result['error'], result['error_type']
+        if self._iterator is not None:
+            self._iterator.close()
+        close_source = getattr(self._source, 'close', None)
+        if close_source:
+            close_source()
+        self._finish()
+    
+    def __iter__(self) -> Iterator[str]:
+        if self._iterator is None:
+            self._iterator = self._iterate()
+        if self._primed is not None:
+            primed, self._primed = self._primed, None
+            yield primed
+        yield from self._iterator
+    
+    def _iterate(self) -> Iterator[str]:
+        if self.finished:
+            return
+        try:
+            for item in self._source:
+                if self.deadline is not None and self.deadline.done:
+                    self._stop(self.deadline.result())
+                    break
+                if isinstance(item, dict):
+                    self.usage.update(item)
+                elif item:
+                    self._parts.append(item)
+                    yield item
+        except Exception as e:
+            self.error = str(e)
+            if type(e).__name__ in TIMEOUT_ERROR_NAMES or isinstance(e, TimeoutError):
+                self.error_type = 'timeout'
+        finally:
+            self._finish()
+    
+    def _finish(self):
+        """标记流结束并执行回调（只执行一次）"""
+        if self.finished:
+            return
+        self.finished = True
+        for callback in self._callbacks:
+            callback(self)
+    
+    def _stop(self, result: Dict[str, Any]):
+        """因超时或取消结束流"""
+        self.error = result['error']
+        self.error_type = result['error_type']
+        close_source = getattr(self._source, 'close', None)
+        if close_source:
+            close_source()
+    
+    def get_result(self) -> Dict[str, Any]:
+        """把流式响应转换为与send_request一致的结果格式"""
+        if self.error:
+            result = {'success': False, 'error': self.error, 'response': self.text, 'usage': self.usage}
+            if self.error_type:
+                result['error_type'] = self.error_type
+            return result
+        return {'success': True, 'response': self.text, 'usage': self.usage}
+
+# 未经 TokenBudget 调整（直接调用提供商）时的默认最大输出token数
+DEFAULT_MAX_TOKENS = 1000
+
+# 可重试的瞬时错误（超时、限流、连接失败、服务端错误）
+TRANSIENT_ERROR_NAMES = {
+    'APITimeoutError', 'APIConnectionError', 'RateLimitError', 'InternalServerError',
+    'OverloadedError', 'ServiceUnavailableError', 'Timeout', 'TimeoutError',
+    'ConnectionError', 'ConnectTimeout', 'ReadTimeout'
+}
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+# 超时类异常，结果中标记 error_type='timeout'
+TIMEOUT_ERROR_NAMES = {'APITimeoutError', 'Timeout', 'TimeoutError', 'ConnectTimeout', 'ReadTimeout', 'TimeoutException'}
+
+def is_transient_error(error: Exception) -> bool:
+    """判断异常是否为可重试的瞬时错误"""
+    if type(error).__name__ in TRANSIENT_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, 'status_code', None) in TRANSIENT_STATUS_CODES
 
 class AIProvider(ABC):
     """AI提供商基类"""
     
-    def __init__(self, name: str):
+    # SDK名称，用于日志
+    sdk_name = ""
+    # 未指定model时使用的模型（限流等按实际模型区分配额）
+    default_model: Optional[str] = None
+    # 是否能在一次调用中回答多个打包的短请求（send_batch 使用）
+    supports_packing = True
+    
+    def __init__(self, name: str, client_registry: Optional[ClientRegistry] = None):
         self.name = name
         self.logger = setup_logger(f"{name}_provider")
+        self.client_registry = client_registry or get_client_registry()
+    
+    def _register_clients(self, warm_url: Optional[str] = None):
+        """把客户端工厂注册到共享的客户端注册表"""
+        self.client_registry.register(self.name, self._create_client, self._create_async_client, warm_url)
+    
+    def _create_client(self, http_client):
+        """构建同步SDK客户端，http_client为共享连接池（可能为None）"""
+        raise NotImplementedError
+    
+    def _create_async_client(self, http_client):
+        """构建异步SDK客户端，不支持时返回None"""
+        return None
+    
+    def _get_client(self):
+        """从注册表获取同步客户端"""
+        try:
+            return self.client_registry.get(self.name)
+        except ImportError:
+            self.logger.error(f"{self.sdk_name}库未安装")
+            return None
+    
+    def _get_async_client(self):
+        """从注册表获取异步客户端"""
+        try:
+            return self.client_registry.get_async(self.name)
+        except ImportError:
+            self.logger.error(f"{self.sdk_name}库未安装")
+            return None
+    
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        """把异常转换为失败结果
+
+        retryable 标记是否为瞬时错误，error_class 为异常类型（用于指标分类），超时额外标记 error_type。
+        """
+        result = {'success': False, 'error': str(error), 'retryable': is_transient_error(error),
+                  'error_class': type(error).__name__}
+        if type(error).__name__ in TIMEOUT_ERROR_NAMES or isinstance(error, TimeoutError):
+            result['error_type'] = 'timeout'
+        return result
+    
+    def _request_timeout(self, kwargs: Dict[str, Any]) -> Optional[float]:
+        """本次SDK调用的超时秒数
+
+        取截止时间（deadline）的剩余时间和显式timeout中较小者；都未设置时返回None，
+        使用共享连接池的默认超时。
+        """
+        deadline = kwargs.get('deadline')
+        if deadline is not None:
+            return deadline.timeout_for(kwargs.get('timeout'))
+        return kwargs.get('timeout')
     
     @abstractmethod
     def send_request(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """发送请求到AI提供商"""
+        """发送请求到AI提供商
+
+        可选的 system（系统提示词）和 history（[{'role', 'content'}] 历史消息）
+        会组装成可被提供商缓存的稳定前缀；usage 中的 cached_tokens 为命中缓存的token数。
+        stream=True 时返回 {'success': True, 'stream': StreamResponse}。
+        """
         pass
     
+    def _build_messages(self, prompt: str, kwargs: Dict[str, Any], include_system: bool = True) -> List[Dict[str, Any]]:
+        """按 系统提示词 / 历史对话 / 当前请求 的固定顺序组装消息
+
+        system 和 history 在多轮对话中保持不变，放在前面可以最大化提供商侧的前缀缓存命中。
+        """
+        messages = []
+        if include_system and kwargs.get('system'):
+            messages.append({"role": "system", "content": kwargs['system']})
+        messages.extend(kwargs.get('history') or [])
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    async def send_request_async(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """异步发送请求到AI提供商
+
+        请求在客户端注册表的长期事件循环上执行，异步客户端和连接池在多次调用之间复用。
+        """
+        return await self.client_registry.run_async(self._send_request_async(prompt, **kwargs))
+    
+    async def _send_request_async(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """在注册表事件循环上执行的异步请求
+
+        默认实现把同步请求放到线程池中执行，支持异步SDK的子类应当覆盖此方法。
+        """
+        return await asyncio.to_thread(self.send_request, prompt, **kwargs)
+    
     @abstractmethod
     def is_available(self) -> bool:
         """检查AI提供商是否可用"""
@@ -23,22 +247,70 @@ class AIProvider(ABC):
 class OpenAIProvider(AIProvider):
     """OpenAI提供商"""
     
-    def __init__(self, api_key: str, base_url: str = None):
-        super().__init__("openai")
+    sdk_name = "OpenAI"
+    default_model = "gpt-3.5-turbo"
+    
+    def __init__(self, api_key: str, base_url: str = None, client_registry: Optional[ClientRegistry] = None):
+        super().__init__("openai", client_registry)
         self.api_key = api_key
         self.base_url = base_url or "https://api.openai.com/v1"
-        self.client = None
-        
-    def _get_client(self):
-        """获取OpenAI客户端"""
-        if self.client is None:
-            try:
-                import openai
-                self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
-            except ImportError:
-                self.logger.error("OpenAI库未安装")
-                return None
-        return self.client
+        self._register_clients(warm_url=self.base_url)
+    
+    def _create_client(self, http_client):
+        """构建OpenAI客户端（重试由AIProviderManager统一处理）"""
+        import openai
+        return openai.OpenAI(api_key=self.api_key, base_url=self.base_url,
+                             http_client=http_client, max_retries=0)
+    
+    def _create_async_client(self, http_client):
+        """构建OpenAI异步客户端"""
+        import openai
+        return openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                  http_client=http_client, max_retries=0)
+    
+    def _build_params(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """构建OpenAI请求参数（OpenAI对相同的消息前缀自动缓存）"""
+        params = {
+            'model': kwargs.get('model') or self.default_model,
+            'messages': self._build_messages(prompt, kwargs),
+            'temperature': kwargs.get('temperature', 0.7),
+            'max_tokens': kwargs.get('max_tokens', DEFAULT_MAX_TOKENS)
+        }
+        timeout = self._request_timeout(kwargs)
+        if timeout is not None:
+            params['timeout'] = timeout
+        return params
+    
+    def _build_usage(self, usage) -> Dict[str, Any]:
+        """转换OpenAI用量，包含命中前缀缓存的token数"""
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return {
+            'prompt_tokens': usage.prompt_tokens,
+            'completion_tokens': usage.completion_tokens,
+            'total_tokens': usage.total_tokens,
+            'cached_tokens': (getattr(details, 'cached_tokens', None) or 0) if details else 0
+        }
+    
+    def _build_result(self, response) -> Dict[str, Any]:
+        """把OpenAI响应转换为统一的结果格式"""
+        return {
+            'success': True,
+            'response': response.choices[0].message.content,
+            'usage': self._build_usage(response.usage)
+        }
+    
+    def _iter_stream(self, response):
+        """解析OpenAI流式响应"""
+        try:
+            for chunk in response:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+                if getattr(chunk, 'usage', None):
+                    yield self._build_usage(chunk.usage)
+        finally:
+            response.close()
     
     def send_request(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """发送请求到OpenAI"""
@@ -47,29 +319,34 @@ class OpenAIProvider(AIProvider):
             if not client:
                 return {'success': False, 'error': 'OpenAI客户端初始化失败'}
             
-            model = kwargs.get('model', 'gpt-3.5-turbo')
-            temperature = kwargs.get('temperature', 0.7)
-            max_tokens = kwargs.get('max_tokens', 1000)
+            params = self._build_params(prompt, **kwargs)
+            if kwargs.get('stream'):
+                response = client.chat.completions.create(
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **params
+                )
+                return {'success': True, 'stream': StreamResponse(
+                    self.name, self._iter_stream(response), deadline=kwargs.get('deadline'))}
             
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            
-            return {
-                'success': True,
-                'response': response.choices[0].message.content,
-                'usage': {
-                    'prompt_tokens': response.usage.prompt_tokens,
-                    'completion_tokens': response.usage.completion_tokens,
-                    'total_tokens': response.usage.total_tokens
-                }
-            }
+            response = client.chat.completions.create(**params)
+            return self._build_result(response)
         except Exception as e:
             self.logger.error(f"OpenAI请求失败: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            return self._error_result(e)
+    
+    async def _send_request_async(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """异步发送请求到OpenAI"""
+        try:
+            client = self._get_async_client()
+            if not client:
+                return {'success': False, 'error': 'OpenAI客户端初始化失败'}
+            
+            response = await client.chat.completions.create(**self._build_params(prompt, **kwargs))
+            return self._build_result(response)
+        except Exception as e:
+            self.logger.error(f"OpenAI异步请求失败: {str(e)}")
+            return self._error_result(e)
     
     def is_available(self) -> bool:
         """检查OpenAI是否可用"""
@@ -78,21 +355,91 @@ class OpenAIProvider(AIProvider):
 class AnthropicProvider(AIProvider):
     """Anthropic提供商"""
     
-    def __init__(self, api_key: str):
-        super().__init__("anthropic")
+    sdk_name = "Anthropic"
+    default_model = "claude-3-sonnet-20240229"
+    
+    def __init__(self, api_key: str, client_registry: Optional[ClientRegistry] = None):
+        super().__init__("anthropic", client_registry)
         self.api_key = api_key
-        self.client = None
-        
-    def _get_client(self):
-        """获取Anthropic客户端"""
-        if self.client is None:
-            try:
-                import anthropic
-                self.client = anthropic.Anthropic(api_key=self.api_key)
-            except ImportError:
-                self.logger.error("Anthropic库未安装")
-                return None
-        return self.client
+        self._register_clients(warm_url="https://api.anthropic.com")
+    
+    def _create_client(self, http_client):
+        """构建Anthropic客户端（重试由AIProviderManager统一处理）"""
+        import anthropic
+        return anthropic.Anthropic(api_key=self.api_key, http_client=http_client, max_retries=0)
+    
+    def _create_async_client(self, http_client):
+        """构建Anthropic异步客户端"""
+        import anthropic
+        return anthropic.AsyncAnthropic(api_key=self.api_key, http_client=http_client, max_retries=0)
+    
+    def _build_params(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """构建Anthropic请求参数
+
+        在系统提示词和最后一条历史消息上设置 cache_control 断点，
+        使 系统提示词 + 历史对话 这段前缀可以被缓存复用。
+        """
+        params = {
+            'model': kwargs.get('model') or self.default_model,
+            'max_tokens': kwargs.get('max_tokens', DEFAULT_MAX_TOKENS),
+            'messages': self._build_messages(prompt, kwargs, include_system=False)
+        }
+        if kwargs.get('system'):
+            params['system'] = [{
+                "type": "text",
+                "text": kwargs['system'],
+                "cache_control": {"type": "ephemeral"}
+            }]
+        if len(params['messages']) > 1:
+            last_history = params['messages'][-2]
+            params['messages'][-2] = {
+                "role": last_history['role'],
+                "content": [{
+                    "type": "text",
+                    "text": last_history['content'],
+                    "cache_control": {"type": "ephemeral"}
+                }]
+            }
+        timeout = self._request_timeout(kwargs)
+        if timeout is not None:
+            params['timeout'] = timeout
+        return params
+    
+    def _build_usage(self, input_tokens: int, output_tokens: int, usage) -> Dict[str, Any]:
+        """转换Anthropic用量，input_tokens不含缓存部分，这里合并为总输入"""
+        cached_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_creation_tokens = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        total_input = input_tokens + cached_tokens + cache_creation_tokens
+        return {
+            'input_tokens': total_input,
+            'output_tokens': output_tokens,
+            'total_tokens': total_input + output_tokens,
+            'cached_tokens': cached_tokens,
+            'cache_creation_tokens': cache_creation_tokens
+        }
+    
+    def _build_result(self, response) -> Dict[str, Any]:
+        """把Anthropic响应转换为统一的结果格式"""
+        return {
+            'success': True,
+            'response': response.content[0].text,
+            'usage': self._build_usage(response.usage.input_tokens, response.usage.output_tokens, response.usage)
+        }
+    
+    def _iter_stream(self, response):
+        """解析Anthropic流式事件"""
+        start_usage = None
+        try:
+            for event in response:
+                if event.type == 'message_start':
+                    start_usage = event.message.usage
+                elif event.type == 'content_block_delta' and event.delta.type == 'text_delta':
+                    yield event.delta.text
+                elif event.type == 'message_delta':
+                    input_tokens = start_usage.input_tokens if start_usage else 0
+                    yield self._build_usage(input_tokens, event.usage.output_tokens, start_usage)
+        finally:
+            response.close()
     
     def send_request(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """发送请求到Anthropic"""
@@ -101,27 +448,30 @@ class AnthropicProvider(AIProvider):
             if not client:
                 return {'success': False, 'error': 'Anthropic客户端初始化失败'}
             
-            model = kwargs.get('model', 'claude-3-sonnet-20240229')
-            max_tokens = kwargs.get('max_tokens', 1000)
-            
-            response = client.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            params = self._build_params(prompt, **kwargs)
+            if kwargs.get('stream'):
+                response = client.messages.create(stream=True, **params)
+                return {'success': True, 'stream': StreamResponse(
+                    self.name, self._iter_stream(response), deadline=kwargs.get('deadline'))}
             
-            return {
-                'success': True,
-                'response': response.content[0].text,
-                'usage': {
-                    'input_tokens': response.usage.input_tokens,
-                    'output_tokens': response.usage.output_tokens,
-                    'total_tokens': response.usage.input_tokens + response.usage.output_tokens
-                }
-            }
+            response = client.messages.create(**params)
+            return self._build_result(response)
         except Exception as e:
             self.logger.error(f"Anthropic请求失败: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            return self._error_result(e)
+    
+    async def _send_request_async(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """异步发送请求到Anthropic"""
+        try:
+            client = self._get_async_client()
+            if not client:
+                return {'success': False, 'error': 'Anthropic客户端初始化失败'}
+            
+            response = await client.messages.create(**self._build_params(prompt, **kwargs))
+            return self._build_result(response)
+        except Exception as e:
+            self.logger.error(f"Anthropic异步请求失败: {str(e)}")
+            return self._error_result(e)
     
     def is_available(self) -> bool:
         """检查Anthropic是否可用"""
@@ -130,22 +480,84 @@ class AnthropicProvider(AIProvider):
 class QwenProvider(AIProvider):
     """Qwen提供商"""
     
-    def __init__(self, api_key: str):
-        super().__init__("qwen")
+    sdk_name = "Dashscope"
+    default_model = "qwen-turbo"
+    
+    def __init__(self, api_key: str, client_registry: Optional[ClientRegistry] = None):
+        super().__init__("qwen", client_registry)
         self.api_key = api_key
-        self.client = None
-        
-    def _get_client(self):
-        """获取Qwen客户端"""
-        if self.client is None:
-            try:
-                import dashscope
-                dashscope.api_key = self.api_key
-                self.client = dashscope
-            except ImportError:
-                self.logger.error("Dashscope库未安装")
-                return None
-        return self.client
+        self._register_clients()
+    
+    def _create_client(self, http_client):
+        """dashscope使用自己的HTTP会话，这里只完成模块加载；API密钥随每次请求传入，不修改全局配置"""
+        import dashscope
+        return dashscope
+    
+    def _get_async_client(self):
+        """dashscope的异步接口与同步接口在同一模块中"""
+        return self._get_client()
+    
+    def _build_params(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """构建Qwen请求参数，有系统提示词或历史对话时使用messages格式以便服务端前缀缓存"""
+        params = {
+            'api_key': self.api_key,
+            'model': kwargs.get('model') or self.default_model,
+            'max_tokens': kwargs.get('max_tokens', DEFAULT_MAX_TOKENS)
+        }
+        if kwargs.get('system') or kwargs.get('history'):
+            params['messages'] = self._build_messages(prompt, kwargs)
+            params['result_format'] = 'message'
+        else:
+            params['prompt'] = prompt
+        timeout = self._request_timeout(kwargs)
+        if timeout is not None:
+            params['request_timeout'] = timeout
+        return params
+    
+    def _extract_text(self, output) -> str:
+        """兼容text和message两种返回格式"""
+        if output.get('text') is not None:
+            return output.text
+        choices = output.get('choices') or []
+        return choices[0].message.content if choices else ""
+    
+    def _build_usage(self, usage) -> Dict[str, Any]:
+        """转换Qwen用量，包含命中前缀缓存的token数"""
+        details = usage.get('prompt_tokens_details') or {}
+        return {
+            'input_tokens': usage.input_tokens,
+            'output_tokens': usage.output_tokens,
+            'total_tokens': usage.total_tokens,
+            'cached_tokens': details.get('cached_tokens', 0)
+        }
+    
+    def _build_result(self, response) -> Dict[str, Any]:
+        """把Qwen响应转换为统一的结果格式"""
+        if response.status_code == 200:
+            return {
+                'success': True,
+                'response': self._extract_text(response.output),
+                'usage': self._build_usage(response.usage)
+            }
+        return {
+            'success': False,
+            'error': f"Qwen API错误: {response.code} - {response.message}",
+            'retryable': response.status_code in TRANSIENT_STATUS_CODES
+        }
+    
+    def _iter_stream(self, responses):
+        """解析Qwen增量输出"""
+        try:
+            for response in responses:
+                if response.status_code != 200:
+                    raise RuntimeError(f"Qwen API错误: {response.code} - {response.message}")
+                text = self._extract_text(response.output)
+                if text:
+                    yield text
+                if response.usage:
+                    yield self._build_usage(response.usage)
+        finally:
+            responses.close()
     
     def send_request(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """发送请求到Qwen"""
@@ -154,32 +566,174 @@ class QwenProvider(AIProvider):
             if not client:
                 return {'success': False, 'error': 'Qwen客户端初始化失败'}
             
-            model = kwargs.get('model', 'qwen-turbo')
-            
-            response = client.Generation.call(
-                model=model,
-                prompt=prompt
-            )
+            params = self._build_params(prompt, **kwargs)
+            if kwargs.get('stream'):
+                responses = client.Generation.call(stream=True, incremental_output=True, **params)
+                return {'success': True, 'stream': StreamResponse(
+                    self.name, self._iter_stream(responses), deadline=kwargs.get('deadline'))}
             
-            if response.status_code == 200:
-                return {
-                    'success': True,
-                    'response': response.output.text,
-                    'usage': {
-                        'input_tokens': response.usage.input_tokens,
-                        'output_tokens': response.usage.output_tokens,
-                        'total_tokens': response.usage.total_tokens
-                    }
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f"Qwen API错误: {response.code} - {response.message}"
-                }
+            response = client.Generation.call(**params)
+            return self._build_result(response)
         except Exception as e:
             self.logger.error(f"Qwen请求失败: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            return self._error_result(e)
+    
+    async def _send_request_async(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """异步发送请求到Qwen"""
+        try:
+            client = self._get_client()
+            if not client:
+                return {'success': False, 'error': 'Qwen客户端初始化失败'}
+            
+            # 旧版本dashscope没有AioGeneration，退回到线程池执行同步调用
+            aio_generation = getattr(client, 'AioGeneration', None)
+            if aio_generation is None:
+                return await super()._send_request_async(prompt, **kwargs)
+            
+            response = await aio_generation.call(**self._build_params(prompt, **kwargs))
+            return self._build_result(response)
+        except Exception as e:
+            self.logger.error(f"Qwen异步请求失败: {str(e)}")
+            return self._error_result(e)
     
     def is_available(self) -> bool:
         """检查Qwen是否可用"""
-        return self.api_key is not None and len(self.api_key) > 0
\ No newline at end of file
+        return self.api_key is not None and len(self.api_key) > 0
+
+class MockProvider(AIProvider):
+    """离线模拟提供商，用于压测和本地开发
+
+    根据提示词哈希从模板生成确定性的回复，可配置延迟分布、错误注入和token用量，
+    不会访问任何外部API。
+    """
+    
+    RESPONSE_TEMPLATES = [
+        "模拟回复：关于「{topic}」，建议先确定目标年龄段，再设计由易到难的关卡和即时奖励。",
+        "模拟回复：「{topic}」可以拆成热身、练习和挑战三个环节，每个环节5到10道题。",
+        "模拟回复：为「{topic}」加入角色引导、音效反馈和星星奖励，能明显提升孩子的参与度。"
+    ]
+    
+    def __init__(self, latency_ms: float = 500.0, latency_jitter_ms: float = 200.0,
+                 latency_distribution: str = 'lognormal', error_rate: float = 0.0,
+                 responses: Optional[List[str]] = None, seed: Optional[int] = None,
+                 max_cached_prefixes: int = 1024):
+        super().__init__("mock")
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.responses = responses
+        self._random = random.Random(seed)
+        # 模拟的前缀缓存按LRU淘汰，长时间压测时内存有上限
+        self.max_cached_prefixes = max_cached_prefixes
+        self._seen_prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+    
+    def _sample_latency(self) -> float:
+        """按配置的分布采样延迟（秒）"""
+        mean, jitter = self.latency_ms, self.latency_jitter_ms
+        if self.latency_distribution == 'constant' or jitter <= 0:
+            latency = mean
+        elif self.latency_distribution == 'uniform':
+            latency = self._random.uniform(mean - jitter, mean + jitter)
+        elif self.latency_distribution == 'exponential':
+            latency = self._random.expovariate(1.0 / mean) if mean > 0 else 0.0
+        else:
+            # 对数正态分布：与真实API一样有长尾
+            sigma = min(2.0, jitter / mean) if mean > 0 else 0.0
+            latency = self._random.lognormvariate(0, sigma) * mean
+        return max(0.0, latency) / 1000.0
+    
+    def _render_reply(self, prompt: str) -> str:
+        """按提示词哈希选择回复模板"""
+        digest = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16)
+        templates = self.responses or self.RESPONSE_TEMPLATES
+        topic = prompt.strip().splitlines()[-1][:30] if prompt.strip() else "游戏"
+        return templates[digest % len(templates)].format(topic=topic)
+    
+    def _build_result(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """生成确定性的回复（打包请求按条目分别回复）"""
+        if self._random.random() < self.error_rate:
+            return {'success': False, 'error': '模拟错误: 503 Service Unavailable', 'retryable': True}
+        
+        packed_items = split_packed_prompt(prompt)
+        if packed_items:
+            text = "\n".join(
+                f"{PACKED_ITEM_MARKER.format(index=index)}\n{self._render_reply(item)}"
+                for index, item in enumerate(packed_items, 1)
+            )
+        else:
+            text = self._render_reply(prompt)
+        
+        # 模拟提供商侧前缀缓存：命中之前请求出现过的最长消息前缀（system + history）
+        messages = self._build_messages(prompt, kwargs)
+        prefixes = [json.dumps(messages[:end], ensure_ascii=False) for end in range(1, len(messages))]
+        prefix_tokens = len(prefixes[-1]) // 2 if prefixes else 0
+        with self._prefix_lock:
+            cached_tokens = next((len(prefix) // 2 for prefix in reversed(prefixes)
+                                  if prefix in self._seen_prefixes), 0)
+            for prefix in prefixes:
+                self._seen_prefixes[prefix] = None
+                self._seen_prefixes.move_to_end(prefix)
+            while len(self._seen_prefixes) > self.max_cached_prefixes:
+                self._seen_prefixes.popitem(last=False)
+        
+        max_tokens = kwargs.get('max_tokens', DEFAULT_MAX_TOKENS)
+        input_tokens = max(1, len(prompt) // 2) + prefix_tokens
+        output_tokens = min(max_tokens, max(1, len(text) // 2))
+        return {
+            'success': True,
+            'response': text,
+            'usage': {
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                'total_tokens': input_tokens + output_tokens,
+                'cached_tokens': cached_tokens
+            }
+        }
+    
+    def _iter_stream(self, result: Dict[str, Any], latency: float):
+        """把回复切成小段并按延迟逐段输出"""
+        text = result['response']
+        chunks = [text[i:i + 4] for i in range(0, len(text), 4)] or [""]
+        # 约三分之一的延迟花在首个token之前
+        time.sleep(latency / 3)
+        for chunk in chunks:
+            yield chunk
+            time.sleep(latency * 2 / 3 / len(chunks))
+        yield result['usage']
+    
+    def _timeout_result(self, timeout: float) -> Dict[str, Any]:
+        """与SDK一样，延迟超过本次调用的超时时抛出超时错误"""
+        return self._error_result(TimeoutError(f"模拟请求超时（{timeout:.2f}秒）"))
+    
+    def send_request(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """返回模拟回复"""
+        latency = self._sample_latency()
+        result = self._build_result(prompt, **kwargs)
+        if kwargs.get('stream') and result['success']:
+            return {'success': True, 'stream': StreamResponse(
+                self.name, self._iter_stream(result, latency), deadline=kwargs.get('deadline'))}
+        timeout = self._request_timeout(kwargs)
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            return self._timeout_result(timeout)
+        time.sleep(latency)
+        return result
+    
+    async def _send_request_async(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """异步返回模拟回复"""
+        if kwargs.get('stream'):
+            return await super()._send_request_async(prompt, **kwargs)
+        latency = self._sample_latency()
+        result = self._build_result(prompt, **kwargs)
+        timeout = self._request_timeout(kwargs)
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            return self._timeout_result(timeout)
+        await asyncio.sleep(latency)
+        return result
+    
+    def is_available(self) -> bool:
+        """模拟提供商始终可用"""
+        return True
\ No newline at end of file
@@ -0,0 +1,96 @@
+import re
+from typing import Dict, Any, List, Optional
+
+# 打包请求中每一条的标记，回复也按相同标记分段
+PACKED_ITEM_MARKER = "【第{index}条】"
+_MARKER_PATTERN = re.compile(r"^\s*【第(\d+)条】\s*$", re.MULTILINE)
+# usage中按回答长度分摊的输出token字段，其余字段按提示词长度分摊
+_OUTPUT_USAGE_KEYS = ('completion_tokens', 'output_tokens')
+_PACKED_HEADER = "请依次完成以下{count}个相互独立的请求。"
+_PACKED_INSTRUCTION = (
+    "每个回答必须以单独一行的对应标记（例如 " + PACKED_ITEM_MARKER.format(index=1) +
+    "）开头，按编号顺序输出，不要输出标记以外的多余内容。"
+)
+
+def pack_prompts(prompts: List[str], max_items: int = 5, max_chars: int = 300) -> List[List[int]]:
+    """把短提示词分组打包，返回每组提示词的下标
+
+    长度超过 max_chars 的提示词单独成组；max_items 小于2时不打包。
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    for index, prompt in enumerate(prompts):
+        if max_items < 2 or len(prompt) > max_chars:
+            groups.append([index])
+            continue
+        current.append(index)
+        if len(current) >= max_items:
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    return groups
+
+def build_packed_prompt(prompts: List[str]) -> str:
+    """把多个提示词合并成一个带编号标记的请求"""
+    sections = [
+        f"{PACKED_ITEM_MARKER.format(index=index)}\n{prompt.strip()}"
+        for index, prompt in enumerate(prompts, 1)
+    ]
+    header = _PACKED_HEADER.format(count=len(prompts)) + _PACKED_INSTRUCTION
+    return header + "\n\n" + "\n\n".join(sections)
+
+def split_packed_prompt(prompt: str) -> Optional[List[str]]:
+    """解析 build_packed_prompt 生成的请求，不是打包请求时返回None"""
+    if not prompt.startswith(_PACKED_HEADER.split("{")[0]):
+        return None
+    items = split_packed_response(prompt.split("\n\n", 1)[-1], None)
+    return items if items and all(item is not None for item in items) else None
+
+def split_packed_response(text: str, count: Optional[int]) -> List[Optional[str]]:
+    """按编号标记拆分打包请求的回复
+
+    返回长度为count的列表，缺失或为空的条目为None；count为None时按出现的最大编号。
+    """
+    matches = list(_MARKER_PATTERN.finditer(text))
+    answers = {}
+    for position, match in enumerate(matches):
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(text)
+        answer = text[match.end():end].strip()
+        index = int(match.group(1))
+        if answer and index not in answers:
+            answers[index] = answer
+    if count is None:
+        count = max(answers, default=0)
+    return [answers.get(index) for index in range(1, count + 1)]
+
+def _apportion(value: int, weights: List[int]) -> List[int]:
+    """按权重把整数拆成若干份，取整的余数计入最后一个权重不为0的份额，合计不变"""
+    total_weight = sum(weights)
+    if not total_weight:
+        return [0] * len(weights)
+    parts = [value * weight // total_weight for weight in weights]
+    last = max(index for index, weight in enumerate(weights) if weight)
+    parts[last] += value - sum(parts)
+    return parts
+
+def split_usage(usage: Dict[str, Any], prompt_weights: List[int],
+                answer_weights: List[int]) -> List[Dict[str, Any]]:
+    """把打包请求的用量分摊到各条目
+
+    输出token按回答长度、输入token（含缓存token）按提示词长度、总数按两者之和分摊；
+    权重为0的条目（例如未能解析出回答的条目）不分摊，各条目合计与原用量一致。
+    """
+    shares: List[Dict[str, Any]] = [{} for _ in prompt_weights]
+    for key, value in usage.items():
+        if not isinstance(value, int) or isinstance(value, bool):
+            continue
+        if key in _OUTPUT_USAGE_KEYS:
+            weights = answer_weights
+        elif key == 'total_tokens':
+            weights = [prompt + answer if answer else 0 for prompt, answer in zip(prompt_weights, answer_weights)]
+        else:
+            weights = prompt_weights
+        for share, part in zip(shares, _apportion(value, weights)):
+            share[key] = part
+    return shares
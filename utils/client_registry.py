@@ -0,0 +1,224 @@
+import asyncio
+import importlib.util
+import threading
+from typing import Dict, Any, Optional, Callable, List, Awaitable
+from utils.logger import setup_logger
+
+class ClientRegistry:
+    """SDK客户端注册表
+
+    所有提供商共享一个调优过的 httpx 连接池（keep-alive、连接数上限、超时，
+    安装了 h2 时启用 HTTP/2），客户端在启动时由后台线程预先构建，
+    并且可以被多个 Streamlit 会话线程安全地并发使用。
+    异步客户端绑定事件循环，因此所有异步请求都在注册表持有的一个长期事件循环
+    （后台线程）上执行，异步客户端和连接池在多次调用之间复用，关闭时统一释放。
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0, connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0, http2: bool = True):
+        self.logger = setup_logger("client_registry")
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._factories: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._async_clients: Dict[str, Any] = {}
+        self._http_client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+
+    def _http_options(self) -> Optional[Dict[str, Any]]:
+        """httpx客户端参数，未安装httpx时返回None（SDK使用默认连接池）"""
+        try:
+            import httpx
+        except ImportError:
+            return None
+        return {
+            'limits': httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            'timeout': httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            'http2': self.http2
+        }
+
+    @property
+    def http_client(self):
+        """共享的同步httpx客户端"""
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    options = self._http_options()
+                    if options is not None:
+                        import httpx
+                        self._http_client = httpx.Client(**options)
+        return self._http_client
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """注册表持有的长期事件循环，首次使用时在后台线程中启动"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name="client_registry_loop", daemon=True)
+                    thread.start()
+                    self._loop, self._loop_thread = loop, thread
+        return self._loop
+
+    def _on_loop(self) -> bool:
+        """当前是否运行在注册表事件循环上"""
+        try:
+            return self._loop is not None and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        """在注册表事件循环上执行协程并阻塞等待结果，供同步代码调用"""
+        if self._on_loop():
+            coro.close()
+            raise RuntimeError("不能在注册表事件循环线程中同步等待协程")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def run_async(self, coro: Awaitable[Any]) -> Any:
+        """在注册表事件循环上执行协程；已经在该循环上时直接等待，取消会传递到注册表循环上的任务"""
+        if self._on_loop():
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def get_async_http_client(self):
+        """注册表事件循环共享的异步httpx客户端"""
+        return self._get_on_loop('__http__', self._build_async_http_client)
+
+    def _build_async_http_client(self):
+        options = self._http_options()
+        if options is None:
+            return None
+        import httpx
+        return httpx.AsyncClient(**options)
+
+    def register(self, name: str, factory: Callable[[Any], Any],
+                 async_factory: Optional[Callable[[Any], Any]] = None, warm_url: Optional[str] = None):
+        """注册客户端工厂
+
+        factory(http_client) 构建同步客户端，async_factory(async_http_client) 构建异步客户端，
+        warm_url 用于预热时提前建立TLS连接。
+        """
+        with self._lock:
+            self._factories[name] = {'factory': factory, 'async_factory': async_factory, 'warm_url': warm_url}
+            self._clients.pop(name, None)
+
+    def get(self, name: str):
+        """获取同步客户端（不存在时构建）"""
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = self._factories[name]['factory'](self.http_client)
+        return client
+
+    def get_async(self, name: str):
+        """获取异步客户端（只能在注册表事件循环上调用，见 run_async）"""
+        async_factory = self._factories[name]['async_factory']
+        if async_factory is None:
+            return None
+        return self._get_on_loop(name, lambda: async_factory(self.get_async_http_client()))
+
+    def _get_on_loop(self, name: str, build: Callable[[], Any]):
+        if not self._on_loop():
+            raise RuntimeError("异步客户端只能在注册表事件循环上使用")
+        with self._lock:
+            if name not in self._async_clients:
+                self._async_clients[name] = build()
+            return self._async_clients[name]
+
+    async def _aclose_async_clients(self, clients: List[Any]):
+        """关闭异步客户端（SDK客户端用 close，httpx客户端用 aclose）"""
+        for client in clients:
+            close = getattr(client, 'aclose', None) or getattr(client, 'close', None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                self.logger.warning(f"关闭异步客户端失败: {str(e)}")
+
+    def warm_up(self, names: Optional[List[str]] = None, connect: bool = True,
+                background: bool = True) -> Optional[threading.Thread]:
+        """预先构建客户端并建立连接，background=True 时在后台线程中执行"""
+        names = [name for name in (names or list(self._factories)) if name in self._factories]
+        if not names:
+            return None
+        if not background:
+            self._warm_up(names, connect)
+            return None
+        thread = threading.Thread(target=self._warm_up, args=(names, connect),
+                                  name="client_warm_up", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self, names: List[str], connect: bool):
+        for name in names:
+            try:
+                self.get(name)
+                warm_url = self._factories[name]['warm_url']
+                if connect and warm_url and self.http_client is not None:
+                    # 任何HTTP响应（包括401/404）都说明连接和TLS握手已完成并进入连接池
+                    self.http_client.get(warm_url)
+                self.logger.info(f"{name}客户端已预热")
+            except ImportError as e:
+                self.logger.warning(f"{name}客户端预热跳过: {str(e)}")
+            except Exception as e:
+                self.logger.warning(f"{name}连接预热失败: {str(e)}")
+
+    def close(self, timeout: float = 5.0):
+        """关闭共享连接池、异步客户端和注册表事件循环"""
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            self._clients.clear()
+            loop, thread = self._loop, self._loop_thread
+            clients = list(self._async_clients.values())
+            self._async_clients.clear()
+            self._loop = self._loop_thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._aclose_async_clients(clients), loop).result(timeout)
+        except Exception as e:
+            self.logger.warning(f"关闭异步客户端超时或失败: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            if not loop.is_running():
+                loop.close()
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_client_registry() -> ClientRegistry:
+    """获取全局客户端注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from config.settings import Config
+                _registry = ClientRegistry(
+                    max_connections=Config.AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.AI_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=Config.AI_HTTP_KEEPALIVE_EXPIRY,
+                    connect_timeout=Config.AI_HTTP_CONNECT_TIMEOUT,
+                    read_timeout=Config.AI_HTTP_READ_TIMEOUT,
+                    http2=Config.AI_HTTP2_ENABLED
+                )
+    return _registry
@@ -0,0 +1,163 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, List, Awaitable
+
+class CancelToken:
+    """协作式取消标记
+
+    调用方（例如Streamlit会话重新运行时）调用 cancel()，请求链路在重试、退避、
+    排队和读取流式响应的间隙检查标记并尽快退出。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "请求已取消"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消时的回调（在调用cancel的线程中执行），已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """最多等待timeout秒，期间被取消时立即返回True"""
+        return self._event.wait(timeout)
+
+class Deadline:
+    """请求截止时间
+
+    从 GameAgent 一直传递到每次SDK调用，各层用 remaining() 计算自己的超时，
+    保证整条链路（包括重试和故障切换）不会超过调用方给定的时间。
+    timeout为None表示不限时，只响应取消。
+    """
+
+    def __init__(self, timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout is not None else math.inf
+        self.cancel_token = cancel_token
+
+    def remaining(self) -> float:
+        """剩余秒数（不限时为inf）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout_for(self, default: Optional[float] = None) -> Optional[float]:
+        """给下游调用的超时：剩余时间与default中较小者，都不限时返回None"""
+        remaining = self.remaining()
+        if default is not None:
+            remaining = min(remaining, default)
+        return None if math.isinf(remaining) else remaining
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    @property
+    def done(self) -> bool:
+        """已超时或已取消"""
+        return self.expired or self.cancelled
+
+    def sleep(self, seconds: float) -> bool:
+        """可被取消的等待，不会超过截止时间；返回等待结束时是否仍可继续"""
+        seconds = min(seconds, self.remaining())
+        if self.cancel_token is not None:
+            self.cancel_token.wait(seconds)
+        elif seconds > 0:
+            time.sleep(seconds)
+        return not self.done
+
+    async def wait_async(self, awaitable: Awaitable[Any]) -> Any:
+        """等待awaitable完成；超时或被取消时取消它并抛出 asyncio.TimeoutError"""
+        task = asyncio.ensure_future(awaitable)
+        waiters = [task]
+        cancelled = on_cancel = None
+        if self.cancel_token is not None:
+            loop = asyncio.get_running_loop()
+            cancelled = loop.create_future()
+
+            def _wake():
+                if not cancelled.done():
+                    cancelled.set_result(None)
+
+            def on_cancel():
+                # cancel() 可能在其他线程调用，回到事件循环线程唤醒等待
+                try:
+                    loop.call_soon_threadsafe(_wake)
+                except RuntimeError:
+                    pass
+
+            self.cancel_token.add_callback(on_cancel)
+            waiters.append(cancelled)
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=self.timeout_for(),
+                                         return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if on_cancel is not None:
+                self.cancel_token.remove_callback(on_cancel)
+                cancelled.cancel()
+        if task in done:
+            return task.result()
+        task.cancel()
+        await asyncio.wait([task])
+        raise asyncio.TimeoutError()
+
+    async def sleep_async(self, seconds: float) -> bool:
+        """sleep 的异步版本，被取消时立即返回"""
+        try:
+            await self.wait_async(asyncio.sleep(min(seconds, self.remaining())))
+        except asyncio.TimeoutError:
+            pass
+        return not self.done
+
+    def result(self) -> Dict[str, Any]:
+        """截止时的失败结果：取消优先于超时"""
+        if self.cancelled:
+            return cancelled_result(self.cancel_token.reason)
+        return timeout_result(self.timeout)
+
+def timeout_result(timeout: Optional[float] = None) -> Dict[str, Any]:
+    """请求超时的结果"""
+    detail = f"（{timeout:.1f}秒）" if timeout is not None else ""
+    return {'success': False, 'error': f'请求超时{detail}', 'error_type': 'timeout', 'retryable': False}
+
+def cancelled_result(reason: Optional[str] = None) -> Dict[str, Any]:
+    """请求被取消的结果"""
+    return {'success': False, 'error': reason or '请求已取消', 'error_type': 'cancelled', 'retryable': False}
+
+def is_deadline_result(result: Dict[str, Any]) -> bool:
+    """结果是否为超时或取消类的失败
+
+    提供商的单次调用超时也标记为 'timeout'，是否还能故障切换要看调用方自己的 deadline.done。
+    """
+    return result.get('error_type') in ('timeout', 'cancelled')
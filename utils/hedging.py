@@ -0,0 +1,102 @@
+import math
+import threading
+from typing import Dict, Any, Optional, List
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图
+
+    桶边界从 min_latency 开始按 growth 倍数递增，样本数超过 max_samples 时
+    所有桶计数减半，使分位数跟随最近的延迟分布变化。
+    """
+
+    def __init__(self, min_latency: float = 0.01, max_latency: float = 120.0,
+                 growth: float = 1.2, max_samples: int = 2000):
+        self.min_latency = min_latency
+        self.growth = growth
+        self.max_samples = max_samples
+        bucket_count = int(math.ceil(math.log(max_latency / min_latency, growth))) + 1
+        self.bounds: List[float] = [min_latency * (growth ** i) for i in range(bucket_count)]
+        self.counts: List[float] = [0.0] * (bucket_count + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, latency: float) -> int:
+        if latency <= self.min_latency:
+            return 0
+        index = int(math.ceil(math.log(latency / self.min_latency, self.growth)))
+        return min(index, len(self.bounds))
+
+    def record(self, latency: float):
+        """记录一个延迟样本（秒）"""
+        with self._lock:
+            self.counts[self._bucket(latency)] += 1
+            self.total += 1
+            if self.total > self.max_samples:
+                self.counts = [count / 2 for count in self.counts]
+                self.total /= 2
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """估算分位数（返回所在桶的上边界），没有样本时返回None"""
+        with self._lock:
+            if self.total == 0:
+                return None
+            target = self.total * percent / 100.0
+            cumulative = 0.0
+            for index, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= target and count:
+                    return self.bounds[min(index, len(self.bounds) - 1)]
+            return self.bounds[-1]
+
+    def get_summary(self) -> Dict[str, Any]:
+        """获取常用分位数"""
+        return {
+            'samples': round(self.total),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+class HedgePolicy:
+    """对冲请求的延迟策略
+
+    主请求在 percentile 分位延迟内仍未返回（或未产出首个token）时发起对冲请求。
+    样本不足 min_samples 时使用 default_delay，结果限制在 [min_delay, max_delay]。
+    """
+
+    def __init__(self, percentile: float = 95.0, min_delay: float = 0.5, max_delay: float = 10.0,
+                 default_delay: float = 3.0, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def get_histogram(self, provider_name: str, kind: str = 'total') -> LatencyHistogram:
+        """获取提供商的延迟直方图，kind为 total（完整响应）或 ttft（首个token）"""
+        key = f"{provider_name}/{kind}"
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            return histogram
+
+    def record(self, provider_name: str, latency: float, kind: str = 'total'):
+        """记录一次成功请求的延迟"""
+        self.get_histogram(provider_name, kind).record(latency)
+
+    def get_delay(self, provider_name: str, kind: str = 'total') -> float:
+        """计算发起对冲请求前的等待时间"""
+        histogram = self.get_histogram(provider_name, kind)
+        if histogram.total < self.min_samples:
+            return self.default_delay
+        delay = histogram.percentile(self.percentile) or self.default_delay
+        return max(self.min_delay, min(self.max_delay, delay))
+
+    def get_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有直方图的分位数快照"""
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {key: histogram.get_summary() for key, histogram in histograms.items()}
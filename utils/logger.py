@@ -1,42 +1,467 @@
+import atexit
+import glob
+import gzip
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import shutil
+import sys
+import threading
+import time
 from datetime import datetime
+from typing import Dict, Any, Optional, List
+from config.settings import Config
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+try:
+    import orjson
+
+    def _dumps(entry: Dict[str, Any]) -> str:
+        return orjson.dumps(entry, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+except ImportError:
+    # 复用同一个编码器，避免 json.dumps 每次调用都新建编码器
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+    def _dumps(entry: Dict[str, Any]) -> str:
+        return _encoder.encode(entry)
+
+class LogEvent:
+    """结构化日志事件，作为日志记录的 msg 放进队列
+
+    字段值可以是无参的可调用对象，只在后台线程格式化时求值一次；
+    可调用字段应只读取之后不会再修改的数据。
+    """
+
+    __slots__ = ('event', 'fields', 'sample_rate', '_resolved')
+
+    def __init__(self, event: str, fields: Dict[str, Any], sample_rate: float = 1.0):
+        self.event = event
+        self.fields = fields
+        self.sample_rate = sample_rate
+        self._resolved: Optional[Dict[str, Any]] = None
+
+    def resolve(self) -> Dict[str, Any]:
+        """求值可调用字段（结果缓存，控制台和文件共用）"""
+        if self._resolved is None:
+            resolved = {}
+            for key, value in self.fields.items():
+                if callable(value):
+                    try:
+                        value = value()
+                    except Exception as e:
+                        value = f"<{type(e).__name__}: {e}>"
+                resolved[key] = value
+            self._resolved = resolved
+        return self._resolved
+
+    def __str__(self) -> str:
+        # 文本模式下渲染为 "事件 key=value ..."
+        return " ".join([self.event] + [f"{key}={value}" for key, value in self.resolve().items()])
+
+class JsonFormatter(logging.Formatter):
+    """JSON Lines 格式化器：每条记录一行 JSON，结构化事件的字段展开为顶层键
+
+    与保留键同名的字段改名为 field_<名称>，不会覆盖时间、级别等公共字段。
+    """
+
+    RESERVED_KEYS = frozenset(('ts', 'level', 'logger', 'event', 'msg', 'exc', 'sample_rate'))
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name
+        }
+        if isinstance(record.msg, LogEvent):
+            entry['event'] = record.msg.event
+            for key, value in record.msg.resolve().items():
+                entry[f"field_{key}" if key in self.RESERVED_KEYS else key] = value
+            if record.msg.sample_rate < 1.0:
+                entry['sample_rate'] = record.msg.sample_rate
+        else:
+            entry['msg'] = record.getMessage()
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return _dumps(entry)
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析采样率配置 "cache_hit=0.01,ai_request=0.1"，忽略格式错误的项"""
+    rates = {}
+    for item in spec.split(','):
+        event, _, rate = item.partition('=')
+        try:
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+class EventSampler:
+    """按事件类型采样：未配置的事件全部记录，WARNING 及以上级别总是记录"""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        self.rates = dict(rates or {})
+        self.sampled_out: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def rate(self, event: str, level: int) -> float:
+        if level >= logging.WARNING:
+            return 1.0
+        return self.rates.get(event, 1.0)
+
+    def sample(self, event: str, rate: float) -> bool:
+        """按采样率决定是否记录，未记录的事件计数"""
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        with self._lock:
+            self.sampled_out[event] = self.sampled_out.get(event, 0) + 1
+        return False
+
+    def get_sampled_out(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.sampled_out)
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """写入有界队列的日志处理器
+
+    请求线程只把日志记录放进队列，格式化和磁盘写入都由后台监听线程完成。
+    队列满时按策略处理：drop 丢弃记录并计数，block 等待队列有空位。
+    """
+
+    def __init__(self, log_queue: queue.Queue, policy: str = 'drop'):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 队列只在进程内使用，直接传递原始记录，格式化推迟到监听线程
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.policy == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """批量写入的队列监听器
+
+    队列空闲 flush_interval 秒后刷新各处理器的缓冲；记录持续稀疏到达、队列一直不空闲时，
+    缓冲中最早的记录最多等待 max_delay 秒也会被写出。
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, flush_interval: float = 1.0,
+                 max_delay: float = 5.0):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+        self.max_delay = max_delay
+        self._first_buffered_at: Optional[float] = None
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        if not block:
+            return self.queue.get_nowait()
+        while True:
+            timeout = self.flush_interval
+            if self._first_buffered_at is not None:
+                waited = time.monotonic() - self._first_buffered_at
+                if waited >= self.max_delay:
+                    self.flush()
+                    continue
+                timeout = min(timeout, self.max_delay - waited)
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush()
+                continue
+            if self._first_buffered_at is None:
+                self._first_buffered_at = time.monotonic()
+            return record
+
+    def enqueue_sentinel(self):
+        # 队列满时也要保证停止信号送达
+        self.queue.put(self._sentinel)
+
+    def flush(self):
+        self._first_buffered_at = None
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        self.flush()
+
+class StderrHandler(logging.StreamHandler):
+    """始终写入当前的 sys.stderr（测试框架或Streamlit替换标准错误后仍然有效）"""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+class BufferedFileHandler(logging.FileHandler):
+    """缓冲写入的文件处理器：攒够 batch_size 条或监听器刷新时一次写入并刷盘"""
+
+    def __init__(self, filename: str, batch_size: int = 100):
+        super().__init__(filename, encoding='utf-8', delay=True)
+        self.batch_size = batch_size
+        self._buffer: List[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write("".join(self._buffer))
+                self._buffer.clear()
+            if self.stream is not None:
+                self.stream.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+class RotatingLogSink(BufferedFileHandler):
+    """所有记录器共用的日志文件 logs/<basename>.log，按大小和日期轮转
+
+    每条记录带有记录器名称字段，不再为每个记录器单独打开文件。当前文件超过 max_bytes
+    或跨天时改名为 <basename>_YYYYMMDD.N.log，compress 为真时由后台线程压缩为 .gz；
+    轮转后从最旧的归档开始删除，使日志总大小不超过 max_total_bytes（0 表示不限制）。
+    """
+
+    def __init__(self, log_dir: str, basename: str = 'app', max_bytes: int = 10 * 1024 * 1024,
+                 max_total_bytes: int = 500 * 1024 * 1024, compress: bool = True, batch_size: int = 100):
+        super().__init__(os.path.join(log_dir, f"{basename}.log"), batch_size)
+        self.log_dir = log_dir
+        self.basename = basename
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self.rotations = 0
+        self.deleted = 0
+        self._cleanup_lock = threading.Lock()
+        self._compress_queue: queue.Queue = queue.Queue()
+        self._compressor: Optional[threading.Thread] = None
+        if os.path.exists(self.baseFilename):
+            self._size = os.path.getsize(self.baseFilename)
+            self._day = datetime.fromtimestamp(os.path.getmtime(self.baseFilename)).strftime('%Y%m%d')
+        else:
+            self._size = 0
+            self._day = datetime.now().strftime('%Y%m%d')
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._buffer and self._should_rollover():
+                self._rollover()
+            super().flush()
+            if self.stream is not None:
+                self._size = os.fstat(self.stream.fileno()).st_size
+        finally:
+            self.release()
+
+    def _should_rollover(self) -> bool:
+        if self.max_bytes > 0 and self._size >= self.max_bytes:
+            return True
+        return datetime.now().strftime('%Y%m%d') != self._day
+
+    def _rollover(self):
+        """关闭当前文件并改名归档，压缩和清理交给后台线程"""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self._size > 0:
+            archive = self._archive_name()
+            os.replace(self.baseFilename, archive)
+            self.rotations += 1
+            if self.compress:
+                self._submit(archive)
+            else:
+                self._enforce_limit()
+        self._size = 0
+        self._day = datetime.now().strftime('%Y%m%d')
+
+    def _archive_name(self) -> str:
+        index = 1
+        while True:
+            archive = os.path.join(self.log_dir, f"{self.basename}_{self._day}.{index}.log")
+            if not os.path.exists(archive) and not os.path.exists(archive + '.gz'):
+                return archive
+            index += 1
+
+    def _submit(self, archive: str):
+        if self._compressor is None:
+            self._compressor = threading.Thread(target=self._compress_loop, name="log_compress", daemon=True)
+            self._compressor.start()
+        self._compress_queue.put(archive)
+
+    def _compress_loop(self):
+        while True:
+            archive = self._compress_queue.get()
+            if archive is None:
+                return
+            try:
+                with open(archive, 'rb') as source, gzip.open(archive + '.gz', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(archive)
+            except OSError:
+                # 压缩失败时保留未压缩的归档
+                pass
+            self._enforce_limit()
+
+    def archives(self) -> List[str]:
+        """按从旧到新排列的归档文件"""
+        paths = glob.glob(os.path.join(self.log_dir, f"{self.basename}_*.log")) + \
+            glob.glob(os.path.join(self.log_dir, f"{self.basename}_*.log.gz"))
+        return sorted(paths, key=os.path.getmtime)
+
+    def _enforce_limit(self):
+        """删除最旧的归档，直到日志总大小不超过 max_total_bytes"""
+        if self.max_total_bytes <= 0:
+            return
+        with self._cleanup_lock:
+            try:
+                archives = [(path, os.path.getsize(path)) for path in self.archives()]
+            except OSError:
+                return
+            total = self._size + sum(size for _, size in archives)
+            for path, size in archives:
+                if total <= self.max_total_bytes:
+                    break
+                # 正在压缩的归档留给压缩线程处理
+                if path.endswith('.log') and os.path.exists(path + '.gz'):
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.deleted += 1
+
+    def close(self):
+        """写出缓冲，等待后台压缩完成后关闭"""
+        super().close()
+        if self._compressor is not None:
+            self._compress_queue.put(None)
+            self._compressor.join(timeout=10)
+            self._compressor = None
+
+class LogPipeline:
+    """进程内唯一的日志管道：所有记录器共用一个队列处理器，由一个后台线程写控制台和文件"""
+
+    def __init__(self, log_dir: str = LOG_DIR, queue_size: int = 10000, policy: str = 'drop',
+                 batch_size: int = 100, flush_interval: float = 1.0, flush_max_delay: float = 5.0,
+                 max_bytes: int = 10 * 1024 * 1024,
+                 max_total_bytes: int = 500 * 1024 * 1024, compress: bool = True, structured: bool = False,
+                 sample_rates: Optional[Dict[str, float]] = None):
+        os.makedirs(log_dir, exist_ok=True)
+        self.structured = structured
+        # 采样只用于结构化日志，文本模式下保留全部事件
+        self.sampler = EventSampler(sample_rates if structured else None)
+        formatter = JsonFormatter() if structured else logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+        console_handler = StderrHandler()
+        console_handler.setFormatter(formatter)
+        self.file_handler = RotatingLogSink(log_dir, max_bytes=max_bytes, max_total_bytes=max_total_bytes,
+                                            compress=compress, batch_size=batch_size)
+        self.file_handler.setFormatter(formatter)
+
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handler = BoundedQueueHandler(self.queue, policy)
+        self.listener = BatchingQueueListener(self.queue, console_handler, self.file_handler,
+                                              flush_interval=flush_interval, max_delay=flush_max_delay)
+        self.listener.start()
+
+    def stop(self):
+        """停止后台线程，写出所有缓冲的日志并关闭日志文件"""
+        self.listener.stop()
+        self.file_handler.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self.queue.qsize(),
+            'capacity': self.queue.maxsize,
+            'dropped': self.handler.dropped,
+            'policy': self.handler.policy,
+            'file_bytes': self.file_handler._size,
+            'rotations': self.file_handler.rotations,
+            'archives_deleted': self.file_handler.deleted,
+            'structured': self.structured,
+            'sampled_out': self.sampler.get_sampled_out()
+        }
+
+_pipeline: Optional[LogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+def get_log_pipeline() -> LogPipeline:
+    """获取全局日志管道（首次调用时启动后台线程，进程退出前自动写出缓冲）"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = LogPipeline(
+                    queue_size=Config.LOG_QUEUE_SIZE,
+                    policy=Config.LOG_QUEUE_POLICY,
+                    batch_size=Config.LOG_BATCH_SIZE,
+                    flush_interval=Config.LOG_FLUSH_INTERVAL,
+                    flush_max_delay=Config.LOG_FLUSH_MAX_DELAY,
+                    max_bytes=Config.LOG_MAX_BYTES,
+                    max_total_bytes=Config.LOG_MAX_TOTAL_BYTES,
+                    compress=Config.LOG_COMPRESS,
+                    structured=Config.LOG_STRUCTURED,
+                    sample_rates=parse_sample_rates(Config.LOG_SAMPLE_RATES)
+                )
+                atexit.register(_pipeline.stop)
+    return _pipeline
 
 def setup_logger(name: str = "game_agent", level: int = logging.INFO) -> logging.Logger:
-    """设置日志记录器"""
-    
-    # 创建日志目录
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # 创建日志记录器
+    """设置日志记录器
+
+    记录器只挂一个队列处理器，写日志的开销与磁盘延迟无关。
+    """
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    
+
     # 避免重复添加处理器
     if logger.handlers:
         return logger
-    
-    # 创建控制台处理器
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
-    
-    # 创建文件处理器
-    log_file = os.path.join(log_dir, f"{name}_{datetime.now().strftime('%Y%m%d')}.log")
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_handler.setLevel(level)
-    
-    # 创建格式化器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    console_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
-    
-    # 添加处理器到日志记录器
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    
-    return logger
\ No newline at end of file
+
+    logger.addHandler(get_log_pipeline().handler)
+    return logger
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any):
+    """记录一个结构化事件
+
+    先检查级别和该事件类型的采样率，没有被记录的事件不会创建记录、也不会计算任何字段；
+    字段值可以传无参函数，推迟到后台线程格式化时再求值。
+    """
+    if not logger.isEnabledFor(level):
+        return
+    sampler = (_pipeline or get_log_pipeline()).sampler
+    rate = sampler.rate(event, level)
+    if not sampler.sample(event, rate):
+        return
+    logger.log(level, LogEvent(event, fields, rate))
@@ -0,0 +1,203 @@
+import bisect
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, List, Tuple
+from utils.logger import setup_logger
+
+# 延迟直方图的桶边界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# AI请求相关指标: 名称 -> (类型, 说明)
+AI_METRICS = {
+    'ai_requests_total': ('counter', '上游调用次数（每次重试单独计数）'),
+    'ai_request_latency_seconds': ('histogram', '上游调用延迟（流式请求为建立连接的时间）'),
+    'ai_errors_total': ('counter', '上游调用失败次数（按错误类别）'),
+    'ai_retries_total': ('counter', '重试次数'),
+    'ai_tokens_total': ('counter', 'token用量（input/output/cached）'),
+    'ai_cache_requests_total': ('counter', '响应缓存查询次数（hit/miss）'),
+    'ai_coalesced_requests_total': ('counter', '合并到进行中相同请求的次数'),
+    'ai_rate_limit_wait_seconds': ('histogram', '限流排队等待时间'),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class MetricsRegistry:
+    """进程内指标注册表
+
+    记录计数器和直方图（按标签区分），可以渲染为Prometheus文本格式，
+    并保留最近的请求记录供管理页面排查问题。线程安全。
+    """
+
+    def __init__(self, recent_size: int = 200):
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # 直方图值: [各桶计数..., 总和, 总数]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._recent = deque(maxlen=recent_size)
+        for name, (kind, help_text) in AI_METRICS.items():
+            self.describe(name, kind, help_text)
+
+    def describe(self, name: str, kind: str, help_text: str = '',
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """声明指标类型（counter / histogram）和说明"""
+        with self._lock:
+            self._types[name] = kind
+            self._help[name] = help_text
+            if kind == 'histogram':
+                self._buckets[name] = tuple(sorted(buckets))
+                self._histograms.setdefault(name, {})
+            else:
+                self._counters.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """计数器加value"""
+        key = _label_key(labels)
+        with self._lock:
+            if name not in self._types:
+                self._types[name] = 'counter'
+                self._counters[name] = {}
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一次直方图观测"""
+        key = _label_key(labels)
+        with self._lock:
+            if name not in self._types:
+                self._types[name] = 'histogram'
+                self._buckets[name] = LATENCY_BUCKETS
+                self._histograms[name] = {}
+            buckets = self._buckets[name]
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = [0.0] * (len(buckets) + 2)
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def get_value(self, name: str, **labels) -> float:
+        """读取计数器的值（直方图返回观测次数）"""
+        key = _label_key(labels)
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name].get(key, 0.0)
+            series = self._histograms.get(name, {}).get(key)
+            return series[-1] if series else 0.0
+
+    def record_trace(self, trace: Dict[str, Any]):
+        """记录一次请求的摘要"""
+        with self._lock:
+            self._recent.append({'time': time.time(), **trace})
+
+    def get_recent_requests(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的请求记录，最新的在前"""
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+    def get_snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """按指标列出各标签组合的当前值，直方图给出次数、总和与平均值"""
+        snapshot = {}
+        with self._lock:
+            for name, series in self._counters.items():
+                snapshot[name] = [{**dict(key), 'value': value} for key, value in series.items()]
+            for name, series in self._histograms.items():
+                snapshot[name] = [
+                    {**dict(key), 'count': values[-1], 'sum': values[-2],
+                     'avg': values[-2] / values[-1] if values[-1] else 0.0}
+                    for key, values in series.items()
+                ]
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """渲染为Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                kind = self._types[name]
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == 'histogram':
+                    buckets = self._buckets[name]
+                    for key, values in sorted(self._histograms[name].items()):
+                        cumulative = 0.0
+                        for bound, count in zip(buckets, values):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {_format_value(cumulative)}")
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {_format_value(values[-1])}")
+                        lines.append(f"{name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+                        lines.append(f"{name}_count{_format_labels(key)} {_format_value(values[-1])}")
+                else:
+                    for key, value in sorted(self._counters[name].items()):
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取全局指标注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
+
+def start_metrics_server(port: int, host: str = '127.0.0.1',
+                         registry: Optional[MetricsRegistry] = None) -> Optional[ThreadingHTTPServer]:
+    """在后台线程中启动 /metrics HTTP端点，重复调用返回已启动的服务"""
+    global _server
+    with _registry_lock:
+        if _server is not None:
+            return _server
+        registry = registry or get_metrics_registry()
+        logger = setup_logger("metrics")
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logger.warning(f"指标端点启动失败（{host}:{port}）: {str(e)}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics_server", daemon=True).start()
+        logger.info(f"指标端点已启动: http://{host}:{_server.server_port}/metrics")
+        return _server
@@ -0,0 +1,147 @@
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+# 每千token的参考价格（美元，输入/输出取平均），未列出的模型按提供商的 default 估算
+MODEL_COST_PER_1K_TOKENS = {
+    'openai': {
+        'default': 0.001,
+        'gpt-3.5-turbo': 0.001,
+        'gpt-4': 0.045,
+        'gpt-4o': 0.01,
+        'gpt-4o-mini': 0.0004,
+    },
+    'anthropic': {
+        'default': 0.009,
+        'claude-3-haiku-20240307': 0.00075,
+        'claude-3-sonnet-20240229': 0.009,
+        'claude-3-opus-20240229': 0.045,
+    },
+    'qwen': {
+        'default': 0.0005,
+        'qwen-turbo': 0.0005,
+        'qwen-plus': 0.002,
+        'qwen-max': 0.01,
+    },
+}
+
+class ProviderStats:
+    """单个提供商/模型的EWMA统计"""
+
+    __slots__ = ('latency', 'error_rate', 'tokens_per_second', 'requests', 'last_updated')
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.tokens_per_second: Optional[float] = None
+        self.requests = 0
+        self.last_updated = 0.0
+
+class ProviderScorer:
+    """根据延迟、错误率和成本为提供商打分
+
+    策略:
+      fastest  - 只看延迟（含错误惩罚）
+      cheapest - 只看每千token成本（含错误惩罚）
+      balanced - 延迟与成本按各自的相对值加权
+    分数越低越好。尚无统计数据的提供商按静态优先级排在前面，以便获得初始样本。
+    """
+
+    POLICIES = ('fastest', 'cheapest', 'balanced')
+
+    def __init__(self, policy: str = 'balanced', alpha: float = 0.3, error_penalty: float = 5.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}")
+        self.policy = policy
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self._stats: Dict[Tuple[str, str], ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def _ewma(self, old: Optional[float], value: float) -> float:
+        return value if old is None else self.alpha * value + (1 - self.alpha) * old
+
+    def record(self, provider_name: str, model: Optional[str], latency: float, success: bool,
+               usage: Optional[Dict[str, Any]] = None):
+        """记录一次请求结果"""
+        key = (provider_name, model or 'default')
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ProviderStats()
+            stats.requests += 1
+            stats.last_updated = time.time()
+            stats.error_rate = self._ewma(stats.error_rate if stats.requests > 1 else None,
+                                          0.0 if success else 1.0)
+            if not success:
+                return
+            stats.latency = self._ewma(stats.latency, latency)
+            output_tokens = (usage or {}).get('completion_tokens', (usage or {}).get('output_tokens'))
+            if output_tokens and latency > 0:
+                stats.tokens_per_second = self._ewma(stats.tokens_per_second, output_tokens / latency)
+
+    def _aggregate(self, provider_name: str, model: Optional[str] = None) -> Optional[ProviderStats]:
+        """获取提供商的统计：指定模型有数据时直接使用，否则合并所有模型（按请求数加权）"""
+        if model and (provider_name, model) in self._stats:
+            return self._stats[(provider_name, model)]
+        entries = [s for (name, _), s in self._stats.items() if name == provider_name]
+        if not entries:
+            return None
+        total = sum(s.requests for s in entries)
+        merged = ProviderStats()
+        merged.requests = total
+        merged.error_rate = sum(s.error_rate * s.requests for s in entries) / total
+        latencies = [(s.latency, s.requests) for s in entries if s.latency is not None]
+        if latencies:
+            merged.latency = sum(l * n for l, n in latencies) / sum(n for _, n in latencies)
+        return merged
+
+    @staticmethod
+    def get_cost(provider_name: str, model: Optional[str] = None) -> float:
+        """估算每千token成本"""
+        costs = MODEL_COST_PER_1K_TOKENS.get(provider_name, {})
+        return costs.get(model or 'default', costs.get('default', 0.001))
+
+    def _score(self, provider_name: str, stats: ProviderStats, model: Optional[str], policy: str,
+               min_latency: float, min_cost: float) -> float:
+        penalty = 1 + self.error_penalty * stats.error_rate
+        cost = self.get_cost(provider_name, model)
+        if policy == 'fastest':
+            return (stats.latency or min_latency) * penalty
+        if policy == 'cheapest':
+            return cost * penalty
+        return ((stats.latency or min_latency) / min_latency + cost / min_cost) * penalty
+
+    def rank(self, provider_names: List[str], model: Optional[str] = None,
+             policy: Optional[str] = None) -> List[str]:
+        """按策略对提供商排序（输入顺序作为无数据时的优先级）"""
+        policy = policy or self.policy
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}")
+        with self._lock:
+            stats = {name: self._aggregate(name, model) for name in provider_names}
+        unscored = [name for name in provider_names if stats[name] is None]
+        scored = [name for name in provider_names if stats[name] is not None]
+        if not scored:
+            return unscored
+
+        latencies = [stats[name].latency for name in scored if stats[name].latency]
+        min_latency = min(latencies) if latencies else 1.0
+        min_cost = min(self.get_cost(name, model) for name in scored)
+        scored.sort(key=lambda name: self._score(name, stats[name], model, policy, min_latency, min_cost))
+        return unscored + scored
+
+    def get_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """获取当前所有提供商/模型的统计快照"""
+        with self._lock:
+            return {
+                f"{name}/{model}": {
+                    'latency': stats.latency,
+                    'error_rate': stats.error_rate,
+                    'tokens_per_second': stats.tokens_per_second,
+                    'cost_per_1k_tokens': self.get_cost(name, model),
+                    'requests': stats.requests,
+                    'last_updated': stats.last_updated
+                }
+                for (name, model), stats in self._stats.items()
+            }
@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# 优先级：数值越小越先放行，交互请求排在批量生成之前
+PRIORITIES = {'interactive': 0, 'batch': 1}
+
+class TokenBucket:
+    """令牌桶，容量为每分钟配额，按秒匀速补充；允许对账后余额为负"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """距离余额足够还需等待的秒数"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """按实际用量修正余额（delta为正表示多用了）"""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+class RateLimitTicket:
+    """一次放行的凭证，用于用量对账"""
+
+    __slots__ = ('estimated_tokens', 'wait_time', 'acquired')
+
+    def __init__(self, estimated_tokens: int, wait_time: float, acquired: bool):
+        self.estimated_tokens = estimated_tokens
+        self.wait_time = wait_time
+        self.acquired = acquired
+
+class RateLimiter:
+    """单个提供商/模型的限流器
+
+    同时维护每分钟请求数（RPM）和每分钟token数（TPM）两个令牌桶，配额不足时
+    调用方按优先级排队等待而不是直接失败。limit为0表示不限制。
+    """
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0):
+        self.name = name
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self.stats = {
+            priority: {'requests': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'timeouts': 0}
+            for priority in PRIORITIES
+        }
+
+    def _time_until_ready(self, tokens: int, now: float) -> float:
+        wait_time = 0.0
+        if self.request_bucket:
+            wait_time = max(wait_time, self.request_bucket.time_until(1, now))
+        if self.token_bucket:
+            wait_time = max(wait_time, self.token_bucket.time_until(tokens, now))
+        return wait_time
+
+    def acquire(self, tokens: int, priority: str = 'interactive',
+                timeout: Optional[float] = None) -> RateLimitTicket:
+        """等待配额，返回凭证；超过timeout仍未获得配额时 acquired=False"""
+        priority = priority if priority in PRIORITIES else 'interactive'
+        start_time = time.monotonic()
+        if not self.request_bucket and not self.token_bucket:
+            return RateLimitTicket(tokens, 0.0, True)
+
+        entry = (PRIORITIES[priority], next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] == entry:
+                        wait_time = self._time_until_ready(tokens, now)
+                        if wait_time <= 0:
+                            if self.request_bucket:
+                                self.request_bucket.consume(1)
+                            if self.token_bucket:
+                                self.token_bucket.consume(tokens)
+                            return self._record(priority, tokens, now - start_time, True)
+                    else:
+                        # 不在队首时等待前面的请求放行后被唤醒
+                        wait_time = 1.0
+                    if timeout is not None:
+                        remaining = timeout - (now - start_time)
+                        if remaining <= 0:
+                            return self._record(priority, tokens, now - start_time, False)
+                        wait_time = min(wait_time, remaining)
+                    self._condition.wait(wait_time)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+    def _record(self, priority: str, tokens: int, wait_time: float, acquired: bool) -> RateLimitTicket:
+        stats = self.stats[priority]
+        stats['requests'] += 1
+        stats['total_wait'] += wait_time
+        stats['max_wait'] = max(stats['max_wait'], wait_time)
+        if not acquired:
+            stats['timeouts'] += 1
+        return RateLimitTicket(tokens, wait_time, acquired)
+
+    def reconcile(self, ticket: RateLimitTicket, usage: Optional[Dict[str, Any]]):
+        """用返回的usage修正token桶"""
+        if not self.token_bucket or not ticket.acquired or not usage:
+            return
+        actual = usage.get('total_tokens')
+        if actual is None:
+            return
+        with self._condition:
+            self.token_bucket.adjust(actual - ticket.estimated_tokens)
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取排队等待统计"""
+        with self._condition:
+            return {
+                'queue_length': len(self._queue),
+                'priorities': {
+                    priority: {
+                        **stats,
+                        'avg_wait': stats['total_wait'] / stats['requests'] if stats['requests'] else 0.0
+                    }
+                    for priority, stats in self.stats.items()
+                }
+            }
+
+class RateLimiterRegistry:
+    """按 提供商/模型 管理限流器
+
+    limits 的键可以是 "provider/model" 或 "provider"，值为 {'rpm': int, 'tpm': int}；
+    都未配置时使用默认限额。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None,
+                 default_rpm: int = 0, default_tpm: int = 0):
+        self.limits = limits or {}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider_name: str, model: Optional[str] = None) -> RateLimiter:
+        """获取限流器"""
+        key = f"{provider_name}/{model or 'default'}"
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limits = self.limits.get(key) or self.limits.get(provider_name) or {}
+                limiter = self._limiters[key] = RateLimiter(
+                    key,
+                    rpm=limits.get('rpm', self.default_rpm),
+                    tpm=limits.get('tpm', self.default_tpm)
+                )
+            return limiter
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有限流器的统计"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {key: limiter.get_stats() for key, limiter in limiters.items()}
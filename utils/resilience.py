@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from typing import Dict, Any
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败达到阈值后进入 open 状态直接拒绝请求；冷却时间过后进入
+    half_open 状态放行少量探测请求，探测成功则恢复 closed，失败则重新 open。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """当前状态（open状态冷却结束后视为half_open）"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def is_healthy(self) -> bool:
+        """是否可以接收请求（不占用half_open的探测名额）"""
+        with self._lock:
+            state = self._current_state()
+            return state == self.CLOSED or (
+                state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls
+            )
+
+    def allow_request(self) -> bool:
+        """判断是否放行本次请求"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self):
+        """记录一次成功请求"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        """记录一次失败请求"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """归还half_open的探测名额
+
+        探测请求以不可重试的错误、超时或取消结束时既不算成功也不算失败，
+        名额必须归还，否则熔断器会一直停在half_open。
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'failures': self._failures
+            }
+
+class RetryPolicy:
+    """指数退避重试策略（带full jitter）"""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 4.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def max_attempts(self) -> int:
+        return self.max_retries + 1
+
+    def get_delay(self, attempt: int) -> float:
+        """第attempt次重试（从1开始）前的等待时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from utils.logger import setup_logger
+
+class ResponseCache:
+    """AI响应缓存
+
+    两级缓存：进程内LRU + SQLite持久化。键为提供商、模型、温度、
+    max_tokens、系统提示词、历史消息和提示词的哈希，条目超过TTL后失效，超过容量时淘汰最久未使用的条目。
+    """
+
+    # 参与缓存键计算的请求参数
+    KEY_PARAMS = ('model', 'temperature', 'max_tokens', 'system', 'history')
+
+    def __init__(self, db_path: Optional[str] = None, memory_size: int = 256,
+                 max_entries: int = 5000, ttl: int = 86400):
+        self.logger = setup_logger("response_cache")
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_count = 0
+        self.stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'evictions': 0}
+
+        if db_path:
+            self._init_db()
+
+    def _init_db(self):
+        """初始化SQLite缓存表"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+            self._conn.commit()
+            self._disk_count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.error(f"缓存数据库初始化失败: {str(e)}")
+            self._conn = None
+
+    @classmethod
+    def make_key(cls, provider_name: str, prompt: str, **kwargs) -> str:
+        """根据请求内容生成缓存键"""
+        payload = {'provider': provider_name, 'prompt': prompt}
+        for name in cls.KEY_PARAMS:
+            payload[name] = kwargs.get(name)
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，未命中或已过期时返回None
+
+        返回缓存结果的副本，调用方修改结果（例如标记 provider）不会影响缓存。
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats['hits'] += 1
+                    self.stats['memory_hits'] += 1
+                    return dict(value)
+                del self._memory[key]
+
+            value = self._get_from_disk(key, now)
+            if value is not None:
+                self.stats['hits'] += 1
+                self.stats['disk_hits'] += 1
+                return dict(value)
+
+            self.stats['misses'] += 1
+            return None
+
+    def _get_from_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """从SQLite读取缓存并回填内存层"""
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._disk_count -= 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            result = json.loads(value)
+            self._put_memory(key, created_at, result)
+            return result
+        except sqlite3.Error as e:
+            self.logger.error(f"读取缓存失败: {str(e)}")
+            return None
+
+    def _put_memory(self, key: str, created_at: float, value: Dict[str, Any]):
+        """写入内存层并按LRU淘汰"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """写入缓存（内存层保存副本，调用方之后修改原结果不会影响缓存）"""
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, now, dict(value))
+            if self._conn is None:
+                return
+            try:
+                exists = self._conn.execute(
+                    "SELECT 1 FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                if not exists:
+                    self._disk_count += 1
+                self._evict_disk(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.logger.error(f"写入缓存失败: {str(e)}")
+
+    def _evict_disk(self, now: float):
+        """清理过期条目，并在超出容量时淘汰最久未使用的条目"""
+        if self._disk_count <= self.max_entries:
+            return
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+        ).rowcount
+        self._disk_count -= expired
+        excess = self._disk_count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)", (excess,)
+            )
+            self._disk_count -= excess
+        self.stats['evictions'] += expired + max(excess, 0)
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+                self._disk_count = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': self.stats['hits'] / total if total else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': self._disk_count
+            }
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from typing import Dict, Any, Callable, Awaitable, Optional, Tuple
+
+class _Call:
+    """一次进行中的调用"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """合并相同键的并发调用
+
+    同一时刻相同键只执行一次 fn，其余调用方等待并共享结果；调用结束后立即
+    移除记录，不保留任何结果，因此不会返回过期数据。同步和异步调用分别合并
+    （异步调用按事件循环隔离）。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {'executed': 0, 'shared': 0}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """执行或等待相同键的调用，返回 (结果, 是否共享了其他调用的结果)
+
+        timeout 只限制等待其他调用的时间，超时抛出 TimeoutError。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise TimeoutError(f"等待合并的请求超时: {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]],
+                       timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """do 的异步版本，等待超时抛出 asyncio.TimeoutError"""
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        with self._lock:
+            future = self._async_calls.get(loop_key)
+            leader = future is None
+            if leader:
+                future = self._async_calls[loop_key] = loop.create_future()
+                self.stats['executed'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            return await asyncio.wait_for(asyncio.shield(future), timeout), True
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[loop_key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        with self._lock:
+            return {**self.stats, 'in_flight': len(self._calls) + len(self._async_calls)}
@@ -0,0 +1,176 @@
+import re
+import threading
+from typing import Dict, Any, Optional, List
+from utils.logger import setup_logger
+
+# 各模型的上下文窗口（输入 + 输出token数）
+MODEL_CONTEXT_WINDOWS = {
+    'openai': {
+        'gpt-3.5-turbo': 16385,
+        'gpt-4': 8192,
+        'gpt-4-turbo': 128000,
+        'gpt-4o': 128000,
+        'gpt-4o-mini': 128000,
+    },
+    'anthropic': {
+        'claude-3-haiku-20240307': 200000,
+        'claude-3-sonnet-20240229': 200000,
+        'claude-3-opus-20240229': 200000,
+    },
+    'qwen': {
+        'qwen-turbo': 8192,
+        'qwen-plus': 32768,
+        'qwen-max': 8192,
+    },
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# 启发式估算：每个中日韩字符的token数（按各家分词器实测取略偏大的值），其余字符约4个一个token
+CJK_TOKENS_PER_CHAR = {'openai': 1.0, 'anthropic': 1.2, 'qwen': 0.8}
+DEFAULT_CJK_TOKENS_PER_CHAR = 1.2
+CHARS_PER_TOKEN = 4.0
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿　-〿＀-￯]')
+
+class TokenEstimator:
+    """本地token数估算
+
+    OpenAI模型在安装了 tiktoken 且编码文件可用时精确计数，其余情况按中日韩字符
+    和其他字符分别估算（结果略偏大，宁可多留余量）。不会发起任何网络请求。
+    """
+
+    def __init__(self):
+        self.logger = setup_logger("token_estimator")
+        self._encodings: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_encoding(self, provider: Optional[str], model: Optional[str]):
+        """获取tiktoken编码，不可用时返回None（结果会被缓存）"""
+        if provider != 'openai':
+            return None
+        key = model or ''
+        if key not in self._encodings:
+            with self._lock:
+                if key not in self._encodings:
+                    self._encodings[key] = self._load_encoding(model)
+        return self._encodings[key]
+
+    def _load_encoding(self, model: Optional[str]):
+        try:
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(model or 'gpt-3.5-turbo')
+            except KeyError:
+                return tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            # 离线环境下编码文件无法下载时退回启发式估算
+            self.logger.warning(f"tiktoken编码不可用，使用估算: {str(e)}")
+            return None
+
+    def count(self, text: str, provider: Optional[str] = None, model: Optional[str] = None) -> int:
+        """估算一段文本的token数"""
+        if not text:
+            return 0
+        encoding = self._get_encoding(provider, model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        cjk_chars = len(_CJK_PATTERN.findall(text))
+        cjk_ratio = CJK_TOKENS_PER_CHAR.get(provider, DEFAULT_CJK_TOKENS_PER_CHAR)
+        other_chars = len(text) - cjk_chars
+        return int(cjk_chars * cjk_ratio + other_chars / CHARS_PER_TOKEN) + 1
+
+    def count_messages(self, messages: List[Dict[str, Any]], provider: Optional[str] = None,
+                       model: Optional[str] = None) -> int:
+        """估算一组消息的token数（含每条消息的格式开销）"""
+        return sum(
+            self.count(message.get('content') or '', provider, model) + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+
+    def count_request(self, prompt: str, kwargs: Dict[str, Any], provider: Optional[str] = None) -> int:
+        """估算一次请求的输入token数：系统提示词 + 历史对话 + 当前请求"""
+        model = kwargs.get('model')
+        messages = [{'content': kwargs.get('system') or ''}] + list(kwargs.get('history') or []) + [{'content': prompt}]
+        return self.count_messages(messages, provider, model)
+
+def get_context_window(provider: Optional[str], model: Optional[str]) -> int:
+    """模型的上下文窗口，未知模型使用保守的默认值"""
+    windows = MODEL_CONTEXT_WINDOWS.get(provider, {})
+    if model in windows:
+        return windows[model]
+    # 带日期或版本后缀的模型名按前缀匹配
+    for name, window in sorted(windows.items(), key=lambda item: -len(item[0])):
+        if model and model.startswith(name):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+class TokenBudget:
+    """请求token预算
+
+    在请求发出前估算输入token数：超出输入上限时从最早的历史对话开始裁剪，
+    系统提示词和当前请求本身就超限时拒绝请求；未指定 max_tokens 时按上下文
+    窗口剩余空间和默认值动态选择，指定了则不超过剩余空间。
+    """
+
+    def __init__(self, estimator: Optional[TokenEstimator] = None, max_input_tokens: int = 6000,
+                 default_max_tokens: int = 1000, min_output_tokens: int = 256):
+        self.estimator = estimator or TokenEstimator()
+        self.max_input_tokens = max_input_tokens
+        self.default_max_tokens = default_max_tokens
+        self.min_output_tokens = min_output_tokens
+
+    def apply(self, provider: str, prompt: str, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按预算调整kwargs（history、max_tokens），请求过大时返回失败结果，否则返回None"""
+        model = kwargs.get('model')
+        window = get_context_window(provider, model)
+        input_limit = window - self.min_output_tokens
+        if self.max_input_tokens:
+            input_limit = min(input_limit, self.max_input_tokens)
+
+        history = list(kwargs.get('history') or [])
+        fixed_tokens = self.estimator.count_request(prompt, {**kwargs, 'history': []}, provider)
+        if fixed_tokens > input_limit:
+            return too_large_result(fixed_tokens, input_limit)
+
+        history_tokens = [self.estimator.count_messages([message], provider, model) for message in history]
+        input_tokens = fixed_tokens + sum(history_tokens)
+        trimmed = 0
+        # 成对（用户 + 助手）丢弃最早的历史，保持对话轮次完整
+        while input_tokens > input_limit and trimmed < len(history):
+            drop = min(2, len(history) - trimmed)
+            input_tokens -= sum(history_tokens[trimmed:trimmed + drop])
+            trimmed += drop
+        if trimmed:
+            kwargs['history'] = history[trimmed:]
+
+        available = window - input_tokens
+        requested = kwargs.get('max_tokens')
+        kwargs['max_tokens'] = max(1, min(requested or self.default_max_tokens, available))
+        kwargs['estimated_input_tokens'] = input_tokens
+        return None
+
+def too_large_result(tokens: int, limit: int) -> Dict[str, Any]:
+    """请求超出token上限的结果"""
+    return {
+        'success': False,
+        'error': f'请求过大: 约{tokens} tokens，超过上限{limit} tokens',
+        'error_type': 'too_large',
+        'retryable': False
+    }
+
+_estimator: Optional[TokenEstimator] = None
+_estimator_lock = threading.Lock()
+
+def get_token_estimator() -> TokenEstimator:
+    """获取全局token估算器（tiktoken编码只加载一次）"""
+    global _estimator
+    if _estimator is None:
+        with _estimator_lock:
+            if _estimator is None:
+                _estimator = TokenEstimator()
+    return _estimator